@@ -0,0 +1,58 @@
+# Georgia Tech
+# Spring 2014
+# benchB64.py: upstream throughput of the b64 url encoder against the
+# market url encoder
+#
+# usage: python benchmarks/benchB64.py [--bytes N] [--max-size M ...]
+#
+# Upstream data is cut into requests of at most --max-size characters,
+# each of them encoded and decoded again as the client and the bridge
+# do. Market urls only carry 39 bytes and the rest goes in cookies,
+# while b64 urls carry everything in the path and query string. For
+# each encoder this prints the bytes one request carries, the requests
+# it takes to send --bytes of data, and how fast they are encoded and
+# decoded.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import urlEncode
+
+ENCODING_TYPES = ['market', 'b64']
+
+
+def bench(data, encodingType, maxSize):
+  """Return (capacity, requests, seconds) to encode and decode data"""
+  capacity = urlEncode.getCapacity(encodingType, maxSize)
+  chunks = [data[offset:offset + capacity]
+            for offset in xrange(0, len(data), capacity)]
+  start = time.time()
+  for chunk in chunks:
+    if urlEncode.decode(urlEncode.encode(chunk, encodingType)) != chunk:
+      raise Exception("{} does not decode what it encodes"
+                      .format(encodingType))
+  return capacity, len(chunks), time.time() - start
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--bytes', type=int, default=1024 * 1024)
+  parser.add_argument('--max-size', type=int, nargs='+',
+                      default=[urlEncode.MAX_REQUEST_SIZE, 2048, 4096])
+  args = parser.parse_args()
+
+  data = os.urandom(args.bytes)
+  print "{:>8} {:>7} {:>9} {:>9} {:>10} {:>8}".format(
+    'maxSize', 'type', 'capacity', 'requests', 'req/s', 'MB/s')
+  for maxSize in args.max_size:
+    for encodingType in ENCODING_TYPES:
+      capacity, requests, seconds = bench(data, encodingType, maxSize)
+      print "{:>8} {:>7} {:>9} {:>9} {:>10.0f} {:>8.2f}".format(
+        maxSize, encodingType, capacity, requests, requests / seconds,
+        len(data) / seconds / 1024 / 1024)
+
+if __name__ == '__main__':
+  main()
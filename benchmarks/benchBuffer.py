@@ -0,0 +1,143 @@
+# Georgia Tech
+# Spring 2014
+# benchBuffer.py: frames per second through the reorder buffer
+#
+# usage: python benchmarks/benchBuffer.py [--frames N]
+#
+# Three arrival orders are measured:
+# in-order- every frame arrives right after the one before it
+# reversed- each window of BUFFER_SIZE - 1 frames arrives backwards, so
+#           nothing is delivered until the last frame of the window
+# random-   frames arrive shuffled within windows of 64, as they do
+#           when several requests are in flight
+#
+# Each is run on buffers.Buffer and on the list based buffer it
+# replaced, which shifted the whole list for every frame delivered.
+#
+# gap fill- BUFFER_SIZE - 1 frames wait behind a missing one, which then
+#           arrives and releases them all. This compares the old
+#           buffer's string += with joining them into calls of at most
+#           --max-flush bytes
+
+import argparse
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import buffers
+from constants import BUFFER_SIZE, MAX_SEQ_NUM
+
+PAYLOAD = 'x' * 512
+
+
+class ListBuffer(buffers.Buffer):
+  """The reorder buffer before the ring: pop(0) and append per frame,
+  and string += to gather released frames"""
+
+  def recvData(self, data, seqNum):
+    if self.receivedData == False:
+      self.minAcceptableSeqNum = seqNum
+      self.maxAcceptableSeqNum = seqNum + BUFFER_SIZE
+      self.receivedData = True
+    if not self.isSeqNumInBuffer(seqNum):
+      raise buffers.BufferingException("seqNum {}".format(seqNum))
+    index = (seqNum - self.minAcceptableSeqNum) % MAX_SEQ_NUM
+    self.buffer[index] = data
+    availableData = ''
+    while self.buffer[0] is not None:
+      availableData += self.buffer.pop(0)
+      self.minAcceptableSeqNum = ((self.minAcceptableSeqNum +1) % MAX_SEQ_NUM)
+      self.maxAcceptableSeqNum = ((self.maxAcceptableSeqNum +1) % MAX_SEQ_NUM)
+      self.buffer.append(None)
+    if availableData != '':
+      self.callback(availableData)
+
+
+def inOrder(numFrames):
+  return range(numFrames)
+
+def reverseWindows(numFrames):
+  size = BUFFER_SIZE - 1
+  seqNums = []
+  for start in range(0, numFrames, size):
+    seqNums.extend(reversed(range(start, min(start + size, numFrames))))
+  return seqNums
+
+def shuffleWindows(numFrames):
+  random.seed(0)
+  seqNums = []
+  for start in range(0, numFrames, 64):
+    window = range(start, min(start + 64, numFrames))
+    random.shuffle(window)
+    seqNums.extend(window)
+  return seqNums
+
+def bench(bufferClass, seqNums):
+  """Return frames per second for one buffer and arrival order"""
+  seqNums = [seqNum % MAX_SEQ_NUM for seqNum in seqNums]
+  def run():
+    buf = bufferClass(minSeqNum=0)
+    buf.addCallback(lambda data: None)
+    recvData = buf.recvData
+    for seqNum in seqNums:
+      recvData(PAYLOAD, seqNum)
+  return len(seqNums) / min(timeit.repeat(run, number=1, repeat=3))
+
+def benchGapFill(bufferClass, payloadSize, view=False, **kwargs):
+  """
+  Return ms to release BUFFER_SIZE - 1 frames held behind a gap
+
+  Note: with view, the frames are memoryviews like the ones the
+  disassembler passes to the buffer
+
+  """
+  payloads = [os.urandom(payloadSize) for index in range(BUFFER_SIZE - 1)]
+  if view:
+    payloads = [memoryview(payload) for payload in payloads]
+  def timeRelease():
+    buf = bufferClass(minSeqNum=0, **kwargs)
+    buf.addCallback(lambda data: None)
+    for seqNum in xrange(1, BUFFER_SIZE):
+      buf.recvData(payloads[seqNum - 1], seqNum)
+    start = timeit.default_timer()
+    buf.recvData('', 0)
+    return timeit.default_timer() - start
+  return min([timeRelease() for index in range(10)]) * 1000
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--frames', type=int, default=100000)
+  parser.add_argument('--max-flush', type=int, nargs='+',
+                      default=[64 * 1024, 256 * 1024, 1024 * 1024])
+  args = parser.parse_args()
+
+  workloads = [('in-order', inOrder), ('reversed', reverseWindows),
+               ('random', shuffleWindows)]
+  print "{:>10} {:>14} {:>14} {:>8}".format('arrival', 'list frames/s',
+                                            'ring frames/s', 'speedup')
+  for name, order in workloads:
+    seqNums = order(args.frames)
+    old = bench(ListBuffer, seqNums)
+    new = bench(buffers.Buffer, seqNums)
+    print "{:>10} {:>14.0f} {:>14.0f} {:>7.1f}x".format(name, old, new,
+                                                       new / old)
+
+  print
+  print "{:>10} {:>10} {:>12} {:>12} {:>12}".format('payload', 'max flush',
+                                                  '+= ms', 'joined ms',
+                                                  'views ms')
+  for payloadSize in [512, 4096]:
+    concat = benchGapFill(ListBuffer, payloadSize)
+    for maxFlushSize in args.max_flush:
+      joined = benchGapFill(buffers.Buffer, payloadSize,
+                            maxFlushSize=maxFlushSize)
+      views = benchGapFill(buffers.Buffer, payloadSize, view=True,
+                           maxFlushSize=maxFlushSize)
+      print "{:>10} {:>10} {:>12.2f} {:>12.2f} {:>12.2f}".format(
+        payloadSize, maxFlushSize, concat, joined, views)
+
+if __name__ == '__main__':
+  main()
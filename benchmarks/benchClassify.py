@@ -0,0 +1,126 @@
+# Georgia Tech
+# Spring 2014
+# benchClassify.py: urls per second the bridge can sort into carriers
+#
+# usage: python benchmarks/benchClassify.py [--urls N] [--gallery SHARE]
+#
+# The corpus mixes market urls carrying frames of random sizes, Baidu
+# and Google urls and plain gallery urls, which are a share --gallery of
+# it. Two things are timed, before and after urlEncode.classify:
+# - dispatch: what processRequest does with a url. Before, isMarket
+#   matched it and decode then matched it twice more to pick a decoder
+#   and find the data. Now classify matches it once and decode reuses
+#   the result. Only market urls are decoded, as on the bridge
+# - classify: telling every carrier apart, isMarket, isBaidu and
+#   isGoogle one after the other before, a single match now
+
+import argparse
+import binascii
+import os
+import random
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import urlEncode
+
+GALLERY_URLS = ['http://localhost:5000/',
+                'http://localhost:5000/gallery/photo{}.jpg',
+                'http://localhost:5000/gallery?page={}&sort=date',
+                'http://localhost:5000/static/css/site.css?v={}']
+
+
+def oldIsMarket(url):
+  pattern = 'http://[a-zA-Z0-9:./]*\?qs=[0-9a-fA-F]{80}'
+  return re.match(pattern, url) != None
+
+def oldIsBaidu(url):
+  pattern = 'http://www.baidu.com/s\?wd=[\S+]+'
+  return re.match(pattern, url) != None
+
+def oldIsGoogle(url):
+  pattern = 'http://www.google.com/search\?q=(?P<query>[a-zA-Z0-9+]+)'
+  return re.match(pattern, url) != None
+
+def oldDecodeAsMarket(url):
+  pattern = '\?qs=(?P<hash>[0-9a-fA-F]*)'
+  data = re.search(pattern, url).group('hash')
+  dataLen = int(data[:2], 16)
+  return binascii.unhexlify(data[2:dataLen+2])
+
+def oldDispatch(protocolUnit):
+  """processRequest and decode as they were"""
+  url = protocolUnit['url']
+  if not oldIsMarket(url):
+    return None
+  data = []
+  if oldIsMarket(url):
+    data.append(oldDecodeAsMarket(url))
+  for cookie in protocolUnit['cookie']:
+    data.append(urlEncode.decodeAsCookie(cookie))
+  return ''.join(data)
+
+def newDispatch(protocolUnit):
+  carrier = urlEncode.classify(protocolUnit['url'])
+  if carrier[0] != 'market':
+    return None
+  return urlEncode.decode(protocolUnit, carrier)
+
+def oldClassify(url):
+  if oldIsMarket(url):
+    return 'market'
+  if oldIsBaidu(url):
+    return 'baidu'
+  if oldIsGoogle(url):
+    return 'google'
+  return None
+
+def newClassify(url):
+  return urlEncode.classify(url)[0]
+
+def makeCorpus(count, gallery):
+  random.seed(0)
+  corpus = []
+  capacity = urlEncode.getCapacity('market')
+  for index in range(count):
+    pick = random.random()
+    if pick < gallery:
+      url = random.choice(GALLERY_URLS).format(index)
+      corpus.append({'url':url, 'cookie':[]})
+    elif pick < gallery + (1 - gallery) * 0.8:
+      data = os.urandom(random.choice([12, 30, capacity]))
+      corpus.append(urlEncode.encodeAsMarket(data))
+    elif pick < gallery + (1 - gallery) * 0.9:
+      corpus.append(urlEncode.encodeAsBaidu(os.urandom(30)))
+    else:
+      corpus.append(urlEncode.encodeAsGoogle(os.urandom(30)))
+  return corpus
+
+def rate(function, items):
+  seconds = min(timeit.repeat(lambda: map(function, items), number=1,
+                              repeat=5))
+  return len(items) / seconds
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--urls', type=int, default=20000)
+  parser.add_argument('--gallery', type=float, default=0.3)
+  args = parser.parse_args()
+
+  corpus = makeCorpus(args.urls, args.gallery)
+  urls = [protocolUnit['url'] for protocolUnit in corpus]
+  assert map(oldDispatch, corpus) == map(newDispatch, corpus)
+  assert map(oldClassify, urls) == map(newClassify, urls)
+  print "{:>10} {:>12} {:>12} {:>8}".format('', 'old urls/s', 'new urls/s',
+                                           'speedup')
+  for name, old, new, items in [('dispatch', oldDispatch, newDispatch, corpus),
+                                ('classify', oldClassify, newClassify, urls)]:
+    oldRate = rate(old, items)
+    newRate = rate(new, items)
+    print "{:>10} {:>12.0f} {:>12.0f} {:>7.1f}x".format(name, oldRate, newRate,
+                                                       newRate / oldRate)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,73 @@
+# Georgia Tech
+# Spring 2014
+# benchEnglish.py: throughput of the english word encoding used by the
+# Baidu and Google urls
+#
+# usage: python benchmarks/benchEnglish.py [--sizes N ...]
+#
+# The old path hexlifies the data and looks up a word per hex digit,
+# and decodes with a dictionary lookup per word appended in a loop. The
+# new path looks up both words of a byte in urlEncode.WORD_PAIRS and
+# decodes the joined string as a whole. Both produce the same words.
+
+import argparse
+import binascii
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import urlEncode
+
+# bytes each timing should cover, so small inputs are run many times
+WORK = 4 * 1024 * 1024
+
+
+def oldEncode(data):
+  """encodeAsEnglish as it was, joined as encodeAsBaidu joined it"""
+  hexString = binascii.hexlify(data)
+  stringy = []
+  for char in hexString:
+    stringy.append(urlEncode.LOOKUP_TABLE[int(char, 16)])
+  return '+'.join(stringy)
+
+def oldDecode(text):
+  """decodeAsEnglish as it was, split as decodeAsBaidu split it"""
+  hexString = []
+  for word in text.split('+'):
+    hexString.append(urlEncode.REVERSE_LOOKUP_TABLE[word])
+  return binascii.unhexlify(''.join(hexString))
+
+def throughput(function, argument, size):
+  """Return the MB/s of data that function handles"""
+  number = max(WORK / size, 1)
+  seconds = min(timeit.repeat(lambda: function(argument), number=number,
+                              repeat=3))
+  return size * number / seconds / 1024 / 1024
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--sizes', type=int, nargs='+',
+                      default=[urlEncode.ENGLISH_URL_BYTES, 1024, 16 * 1024,
+                               256 * 1024, 1024 * 1024])
+  args = parser.parse_args()
+
+  print "{:>8} {:>10} {:>10} {:>8} {:>10} {:>10} {:>8}".format(
+    'bytes', 'old enc', 'new enc', 'speedup', 'old dec', 'new dec', 'speedup')
+  for size in args.sizes:
+    data = os.urandom(size)
+    text = urlEncode.encodeAsEnglishString(data)
+    assert text == oldEncode(data)
+    assert urlEncode.decodeAsEnglishString(text) == oldDecode(text) == data
+    oldEnc = throughput(oldEncode, data, size)
+    newEnc = throughput(urlEncode.encodeAsEnglishString, data, size)
+    oldDec = throughput(oldDecode, text, size)
+    newDec = throughput(urlEncode.decodeAsEnglishString, text, size)
+    print "{:>8} {:>10.2f} {:>10.2f} {:>7.1f}x {:>10.2f} {:>10.2f} {:>7.1f}x" \
+      .format(size, oldEnc, newEnc, newEnc / oldEnc, oldDec, newDec,
+              newDec / oldDec)
+  print "throughput in MB/s of data"
+
+if __name__ == '__main__':
+  main()
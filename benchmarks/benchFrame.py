@@ -0,0 +1,85 @@
+# Georgia Tech
+# Spring 2014
+# benchFrame.py: frames per second put together by many assemblers at
+# once, one thread per assembler
+#
+# usage: python benchmarks/benchFrame.py [--frames N] [--assemblers N ...]
+#
+# Two ways of numbering frames are measured:
+# shared-  every assembler draws from one counter behind one lock, as
+#          frame.SeqNumber did when it kept its state on the class
+# own-     every assembler has its own frame.SeqNumber
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import frame
+from constants import MAX_SEQ_NUM
+
+PAYLOAD = 'x' * 512
+
+
+class SharedSeqNumber():
+  """One counter and lock for the whole process, like the old SeqNumber"""
+  _seqNum = -1
+  _lock = threading.Lock()
+
+  def getSequenceAndIncrement(self):
+    SharedSeqNumber._lock.acquire()
+    SharedSeqNumber._seqNum = (SharedSeqNumber._seqNum + 1) % MAX_SEQ_NUM
+    seqNum = SharedSeqNumber._seqNum
+    SharedSeqNumber._lock.release()
+    return seqNum
+
+
+def bench(numAssemblers, numFrames, shared):
+  """
+  Return frames per second for numAssemblers threads which each
+  assemble numFrames frames
+
+  """
+  assemblers = []
+  for index in range(numAssemblers):
+    assembler = frame.Assembler(sessionID=index % 256)
+    if shared:
+      assembler.seqNum = SharedSeqNumber()
+    assemblers.append(assembler)
+  start = threading.Event()
+  def assemble(assembler):
+    start.wait()
+    for index in xrange(numFrames):
+      assembler.assemble(PAYLOAD)
+  threads = [threading.Thread(target=assemble, args=(assembler,))
+             for assembler in assemblers]
+  for thread in threads:
+    thread.start()
+  began = time.time()
+  start.set()
+  for thread in threads:
+    thread.join()
+  elapsed = time.time() - began
+  return numAssemblers * numFrames / elapsed
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--frames', type=int, default=200000,
+                      help='frames assembled in total for each run')
+  parser.add_argument('--assemblers', type=int, nargs='+',
+                      default=[1, 16, 256])
+  args = parser.parse_args()
+
+  print "{:>10} {:>16} {:>16}".format('assemblers', 'shared frames/s',
+                                      'own frames/s')
+  for numAssemblers in args.assemblers:
+    numFrames = max(args.frames / numAssemblers, 1)
+    results = [bench(numAssemblers, numFrames, shared)
+               for shared in (True, False)]
+    print "{:>10} {:>16.0f} {:>16.0f}".format(numAssemblers, *results)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,101 @@
+# Georgia Tech
+# Spring 2014
+# benchHeader.py: microbenchmarks for packing and unpacking frame
+# headers
+#
+# usage: python benchmarks/benchHeader.py [--number N]
+#
+# Each operation is timed on the path frame.py used before headerCodec
+# (a '0'/'1' flag string and struct calls with the format string) and
+# on headerCodec. Batch operations handle BATCH headers per call.
+
+import argparse
+import os
+import struct
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import headerCodec
+
+BATCH = 256
+HEADERS = [(index, index % 256, 1<<7) for index in range(BATCH)]
+PACKED = headerCodec.packHeaders(HEADERS)
+FRAMES = [headerCodec.packHeader(*header) + 'x' * 64 for header in HEADERS]
+
+
+def oldFlags(**kwargs):
+  """Flags as generateFlags used to build them"""
+  flag_list = list('00000000')
+  if 'more_data' in kwargs:
+    flag_list[0] = str(kwargs['more_data'])
+  if 'SYN' in kwargs:
+    flag_list[1] = str(kwargs['SYN'])
+  if 'long_poll' in kwargs:
+    flag_list[2] = str(kwargs['long_poll'])
+  if 'packed' in kwargs:
+    flag_list[3] = str(kwargs['packed'])
+  return int("".join(flag_list), 2)
+
+def oldHeader():
+  return struct.pack('!HBB', 23, 10, oldFlags(more_data=1))
+
+def newHeader():
+  return headerCodec.packHeader(23, 10, headerCodec.makeFlags(more_data=1))
+
+def oldParseHeaders(headers):
+  """Headers as frame.parseHeaders used to parse them"""
+  headerTuple = struct.unpack('!HBB', headers)
+  seqNum = headerTuple[0]
+  sessionID = headerTuple[1]
+  flags = headerTuple[2]
+  return seqNum, sessionID, flags
+
+def oldParse():
+  return oldParseHeaders(FRAMES[0][:4])
+
+def newParse():
+  return headerCodec.unpackHeader(FRAMES[0])
+
+def oldPackBatch():
+  return ''.join([struct.pack('!HBB', *header) for header in HEADERS])
+
+def newPackBatch(buf=bytearray(BATCH * 4)):
+  return headerCodec.packHeaders(HEADERS, buf)
+
+def oldParseBatch():
+  return [oldParseHeaders(frame[:4]) for frame in FRAMES]
+
+def newParseBatch():
+  return headerCodec.unpackFrameHeaders(FRAMES)
+
+def oldUnpackBatch():
+  return [oldParseHeaders(PACKED[offset:offset + 4])
+          for offset in xrange(0, len(PACKED), 4)]
+
+def newUnpackBatch():
+  return headerCodec.unpackHeaders(PACKED)
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--number', type=int, default=200000,
+                      help='calls per single header operation')
+  args = parser.parse_args()
+
+  cases = [('header + flags', oldHeader, newHeader, 1),
+           ('parse header', oldParse, newParse, 1),
+           ('pack batch', oldPackBatch, newPackBatch, BATCH),
+           ('parse frames batch', oldParseBatch, newParseBatch, BATCH),
+           ('unpack batch', oldUnpackBatch, newUnpackBatch, BATCH)]
+  print "{:>20} {:>16} {:>16} {:>8}".format('operation', 'old headers/s',
+                                            'new headers/s', 'speedup')
+  for name, old, new, perCall in cases:
+    number = max(args.number / perCall, 1)
+    oldRate = number * perCall / min(timeit.repeat(old, number=number, repeat=3))
+    newRate = number * perCall / min(timeit.repeat(new, number=number, repeat=3))
+    print "{:>20} {:>16.0f} {:>16.0f} {:>7.1f}x".format(name, oldRate, newRate,
+                                                       newRate / oldRate)
+
+if __name__ == '__main__':
+  main()
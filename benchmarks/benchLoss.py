@@ -0,0 +1,111 @@
+# Georgia Tech
+# Spring 2014
+# benchLoss.py: goodput of a simulated session as requests are lost
+#
+# usage: python benchmarks/benchLoss.py [--seconds N] [--rtt S]
+#
+# A sender keeps --window requests in flight to a receiver, each
+# carrying one segment. Every request and every response is lost with
+# the given probability. Responses carry the receiver's ack back to the
+# sender. Time is simulated, so a run takes well under a second.
+#
+# Goodput is the data delivered in order by the receiver, as a share of
+# what a lossless session delivers. Without acks, the first lost
+# request leaves a gap the reorder buffer never gets past.
+
+import argparse
+import heapq
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import frame
+import retransmit
+
+SEGMENT = 'x' * 1000
+
+
+class Simulation():
+  """One sender and receiver joined by a lossy link"""
+
+  def __init__(self, loss, rtt, window, reliable):
+    self.now = 0.0
+    self.loss = loss
+    self.rtt = rtt
+    self.window = window
+    self.delivered = 0
+    self.inFlight = 0
+    self.events = []
+    self.reliable = reliable
+    self.sender = frame.Assembler(reliable=reliable)
+    if reliable:
+      self.sender.unacked = retransmit.RetransmitQueue(clock=lambda: self.now)
+    self.receiver = frame.Disassembler(self.deliver, minSeqNum=0)
+
+  def deliver(self, data):
+    self.delivered += len(data)
+
+  def schedule(self, delay, event, *args):
+    heapq.heappush(self.events, (self.now + delay, event, args))
+
+  def send(self):
+    """Send a request: frames due again first, else a new segment"""
+    resend = self.sender.getRetransmits(1)
+    if resend != []:
+      seqNum, data = resend[0]
+      framed = self.sender.assemble(data, seqNum=seqNum)
+    else:
+      framed = self.sender.assemble(SEGMENT)
+    self.inFlight += 1
+    if random.random() >= self.loss:
+      self.schedule(self.rtt / 2, 'request', framed)
+    else:
+      self.schedule(self.rtt, 'lost')
+
+  def run(self, seconds):
+    while self.now < seconds:
+      while self.inFlight < self.window:
+        self.send()
+      self.now, event, args = heapq.heappop(self.events)
+      if event == 'request':
+        self.receiver.disassemble(args[0])
+        if random.random() >= self.loss:
+          self.schedule(self.rtt / 2, 'response', self.receiver.getAck())
+        else:
+          self.schedule(self.rtt / 2, 'lost')
+      elif event == 'response':
+        # an assembler turns reliable on its first ack, so the sender
+        # without acks must not see them
+        if self.reliable:
+          self.sender.recvAck(args[0])
+        self.inFlight -= 1
+      else:
+        # the request timed out at the sender
+        self.inFlight -= 1
+    return self.delivered
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--seconds', type=float, default=60)
+  parser.add_argument('--rtt', type=float, default=0.2)
+  parser.add_argument('--window', type=int, default=4)
+  args = parser.parse_args()
+
+  random.seed(0)
+  lossless = Simulation(0, args.rtt, args.window, True).run(args.seconds)
+  print "{:>6} {:>14} {:>14} {:>12}".format('loss', 'no acks', 'sack + rto',
+                                           'retransmits')
+  for loss in [0, 0.001, 0.01, 0.02, 0.05, 0.1, 0.2]:
+    random.seed(1)
+    plain = Simulation(loss, args.rtt, args.window, False).run(args.seconds)
+    random.seed(1)
+    reliable = Simulation(loss, args.rtt, args.window, True)
+    delivered = reliable.run(args.seconds)
+    print "{:>6.3f} {:>13.1f}% {:>13.1f}% {:>12}".format(
+      loss, 100.0 * plain / lossless, 100.0 * delivered / lossless,
+      reliable.sender.unacked.retransmits)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,72 @@
+# Georgia Tech
+# Spring 2014
+# benchMarket.py: requests per second of the market url encoder
+#
+# usage: python benchmarks/benchMarket.py [--number N]
+#
+# Every upstream request and every poll is market encoded. The old path
+# picks each padding character with random.choice, the new one takes
+# them from urlEncode.paddingPool, which makes them in bulk from
+# os.urandom. Requests are timed for an empty poll (a header and an
+# ack), data that fits in the url and a full request with cookies.
+
+import argparse
+import binascii
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import urlEncode
+from constants import *
+
+
+def oldEncodeAsMarket(data):
+  """encodeAsMarket as it was, padding one character at a time"""
+  cookies = []
+  if len(data) > urlEncode.MARKET_URL_BYTES:
+    cookies = urlEncode.encodeAsCookies(data[urlEncode.MARKET_URL_BYTES:])
+    data = data[:urlEncode.MARKET_URL_BYTES]
+  hexData = binascii.hexlify(data)
+  padding = []
+  for index in range(78 - len(hexData)):
+    padding.append(urlEncode.pickRandomHexChar())
+  padding = ''.join(padding)
+  dataLen = hex(len(hexData))[2:]
+  if len(dataLen) == 1:
+    dataLen = '0' + dataLen
+  url = 'http://' + "localhost:5000/" + '?qs=' + dataLen + hexData + padding
+  return {'url':url, 'cookie':cookies}
+
+def oldPadding(count):
+  return ''.join([urlEncode.pickRandomHexChar() for index in range(count)])
+
+def rate(function, data, number):
+  """Return the calls of function per second"""
+  seconds = min(timeit.repeat(lambda: function(data), number=number, repeat=3))
+  return number / seconds
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--number', type=int, default=20000)
+  args = parser.parse_args()
+
+  requests = [('poll', os.urandom(HEADER_SIZE + ACK_SIZE)),
+              ('url only', os.urandom(urlEncode.MARKET_URL_BYTES)),
+              ('full', os.urandom(urlEncode.getCapacity('market')))]
+  print "{:>10} {:>6} {:>12} {:>12} {:>8}".format(
+    'request', 'bytes', 'old req/s', 'new req/s', 'speedup')
+  for name, data in requests:
+    old = rate(oldEncodeAsMarket, data, args.number)
+    new = rate(urlEncode.encodeAsMarket, data, args.number)
+    print "{:>10} {:>6} {:>12.0f} {:>12.0f} {:>7.1f}x".format(
+      name, len(data), old, new, new / old)
+  # the padding of an empty url on its own
+  old = rate(oldPadding, 78, args.number)
+  new = rate(urlEncode.paddingPool.take, 78, args.number)
+  print "{:>10} {:>6} {:>12.0f} {:>12.0f} {:>7.1f}x".format(
+    'padding', 78, old, new, new / old)
+
+if __name__ == '__main__':
+  main()
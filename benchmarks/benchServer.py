@@ -0,0 +1,91 @@
+# Georgia Tech
+# Spring 2014
+# benchServer.py: requests per second served by the bridge's thread
+# pool WSGI server for different numbers of workers
+#
+# usage: python benchmarks/benchServer.py [--clients N] [--seconds S]
+#
+# Two workloads are measured:
+# gallery- the real flask app answering requests that are not htpt
+#          traffic, which costs one PNG encode per request
+# wait-    a stand-in app that waits 20ms per request, as the bridge
+#          does when it blocks on Tor or on a slow client
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import connection
+import htpt
+import wsgiServer
+
+WAIT = 0.02
+
+
+def waitApp(environ, start_response):
+  """WSGI app which waits WAIT seconds before answering"""
+  time.sleep(WAIT)
+  body = 'ok'
+  start_response('200 OK', [('Content-Type', 'text/plain'),
+                            ('Content-Length', str(len(body)))])
+  return [body]
+
+def runClients(address, path, numClients, seconds):
+  """
+  Hit the server from numClients keep-alive connections for the given
+  number of seconds and return the number of requests answered
+
+  """
+  counts = [0] * numClients
+  deadline = time.time() + seconds
+  def client(index):
+    pool = connection.ConnectionPool(address, size=1)
+    encoded = {'url':'http://' + address + path, 'cookie':[]}
+    while time.time() < deadline:
+      pool.request(encoded)
+      counts[index] += 1
+    pool.close()
+  threads = [threading.Thread(target=client, args=(index,))
+             for index in range(numClients)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return sum(counts)
+
+def bench(app, path, workers, numClients, seconds):
+  """Return requests per second for one app and number of workers"""
+  server = wsgiServer.ThreadPoolWSGIServer('localhost', 0, app, workers)
+  serverThread = threading.Thread(target=server.serve_forever)
+  serverThread.daemon = True
+  serverThread.start()
+  address = 'localhost:{}'.format(server.port)
+  start = time.time()
+  requests = runClients(address, path, numClients, seconds)
+  elapsed = time.time() - start
+  server.shutdown()
+  serverThread.join()
+  return requests / elapsed
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--clients', type=int, default=32)
+  parser.add_argument('--seconds', type=float, default=3)
+  parser.add_argument('--workers', type=int, nargs='+',
+                      default=[1, 2, 4, 8, 16, 32])
+  args = parser.parse_args()
+
+  workloads = [('gallery', htpt.app, '/?page=1'), ('wait', waitApp, '/')]
+  print "{:>8} {:>14} {:>14}".format('workers', 'gallery req/s', 'wait req/s')
+  for workers in args.workers:
+    results = []
+    for name, app, path in workloads:
+      results.append(bench(app, path, workers, args.clients, args.seconds))
+    print "{:>8} {:>14.1f} {:>14.1f}".format(workers, *results)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,209 @@
+# Georgia Tech
+# Spring 2014
+# benchWindow.py: throughput and latency of upstream data with a fixed
+# request window and with the AIMD congestion window
+#
+# usage: python benchmarks/benchWindow.py [--bytes N] [--rate R]
+#        [--queue Q] [--path DELAY,LOSS ...]
+#
+# The client side is the htpt client's: segmenter, reliable assembler,
+# market encoding, connection pool and request window. It talks to a
+# stand-in for the bridge which
+# - waits DELAY seconds before and after handling each request, as a
+#   path with a round trip time of 2 * DELAY would
+# - answers a share LOSS of the requests and responses with an error,
+#   as if they were lost on the way
+# - handles at most --rate requests per second one after the other and
+#   keeps at most --queue requests waiting for their turn, turning any
+#   more away. This is the bottleneck that a window that is too large
+#   overruns
+# The stand-in disassembles the frames like the bridge and answers with
+# an ack, so lost frames are sent again.
+#
+# Latency is measured per segment, from when it was first sent to when
+# the ack that covers it came back.
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'htpt'))
+
+import congestion
+import connection
+import frame
+import segmenter
+import urlEncode
+import wsgiServer
+
+# requests in flight with the fixed window, as before the congestion
+# window
+FIXED_WINDOW = 4
+
+
+class StandIn():
+  """WSGI app standing in for the bridge on a slow and lossy path"""
+
+  def __init__(self, delay, loss, rate, queue):
+    self.delay = delay
+    self.loss = loss
+    self.serviceTime = 1.0 / rate
+    self.queue = queue
+    self.waiting = 0
+    self.lock = threading.Lock()
+    self.service = threading.Lock()
+    self.disassembler = frame.Disassembler(lambda data: None, minSeqNum=0)
+    # reliable so that its answers carry the ack, as the bridge's do
+    # once the client has agreed on version 2 headers
+    self.assembler = frame.Assembler(reliable=True)
+
+  def __call__(self, environ, start_response):
+    time.sleep(self.delay)
+    answer = self.handle(environ)
+    time.sleep(self.delay)
+    if answer is None or random.random() < self.loss / 2:
+      start_response('503 Service Unavailable', [('Content-Length', '4')])
+      return ['lost']
+    start_response('200 OK', [('Content-Length', str(len(answer)))])
+    return [answer]
+
+  def handle(self, environ):
+    """Return the frame answering a request, or None if it was lost"""
+    if random.random() < self.loss / 2:
+      return None
+    self.lock.acquire()
+    full = self.waiting >= self.queue
+    if not full:
+      self.waiting += 1
+    self.lock.release()
+    if full:
+      return None
+    self.service.acquire()
+    time.sleep(self.serviceTime)
+    self.service.release()
+    self.lock.acquire()
+    self.waiting -= 1
+    self.lock.release()
+    url = 'http://localhost' + environ['PATH_INFO']
+    if environ.get('QUERY_STRING'):
+      url += '?' + environ['QUERY_STRING']
+    cookies = connection.splitCookieHeader(environ.get('HTTP_COOKIE'))
+    decoded = urlEncode.decode({'url':url, 'cookie':cookies})
+    self.lock.acquire()
+    try:
+      self.disassembler.disassemble(decoded)
+      return self.assembler.assemble('', ack=self.disassembler.getAck())
+    finally:
+      self.lock.release()
+
+
+class Session():
+  """Upload data to the stand-in as the htpt client does"""
+
+  def __init__(self, address, adaptive):
+    self.assembler = frame.Assembler(reliable=True)
+    self.segmenter = segmenter.Segmenter('market')
+    self.congestion = None
+    size = FIXED_WINDOW
+    if adaptive:
+      self.congestion = congestion.CongestionWindow()
+      size = congestion.MAX_WINDOW
+    self.pool = connection.ConnectionPool(address, size)
+    # lost requests are sent again, so none of them ends the session
+    self.window = connection.RequestWindow(self.pool, self.recvAck, size,
+                                           sys.maxint, self.congestion)
+    self.sentAt = {}
+    self.latencies = []
+    self.lock = threading.Lock()
+
+  def recvAck(self, body):
+    """Window callback: take the ack from the stand-in's answer"""
+    disassembler = frame.Disassembler(lambda data: None, minSeqNum=0)
+    disassembler.disassemble(body)
+    ack = disassembler.getPeerAck()
+    if ack is None:
+      return
+    self.assembler.recvAck(ack)
+    now = time.time()
+    self.lock.acquire()
+    for seqNum in self.sentAt.keys():
+      if seqNum < ack[0]:
+        self.latencies.append(now - self.sentAt.pop(seqNum))
+    self.lock.release()
+
+  def send(self, framed):
+    self.window.send(urlEncode.encode(framed, 'market'))
+
+  def run(self, data):
+    """Send data and return the seconds until all of it was acked"""
+    segments = list(self.segmenter.segment(data))
+    start = time.time()
+    index = 0
+    while index < len(segments) or len(self.assembler.unacked) > 0:
+      resend = self.assembler.getRetransmits()
+      if resend != [] and self.congestion is not None:
+        self.congestion.onLoss()
+      for seqNum, segment in resend:
+        self.send(self.assembler.assemble(segment, seqNum=seqNum))
+      if index < len(segments) and \
+         self.assembler.getSendAllowance() >= len(segments[index]):
+        framed = self.assembler.assemble(segments[index])
+        self.lock.acquire()
+        self.sentAt[self.assembler.sequenceNumber] = time.time()
+        self.lock.release()
+        self.send(framed)
+        index += 1
+      else:
+        time.sleep(0.001)
+    elapsed = time.time() - start
+    self.window.close()
+    self.pool.close()
+    return elapsed
+
+def percentile(values, share):
+  values = sorted(values)
+  return values[min(int(len(values) * share), len(values) - 1)]
+
+def bench(data, delay, loss, rate, queue, adaptive):
+  """Return (KB/s, median ms, 95th percentile ms, lost requests)"""
+  random.seed(0)
+  standIn = StandIn(delay, loss, rate, queue)
+  server = wsgiServer.ThreadPoolWSGIServer('localhost', 0, standIn, 64)
+  serverThread = threading.Thread(target=server.serve_forever)
+  serverThread.daemon = True
+  serverThread.start()
+  session = Session('localhost:{}'.format(server.port), adaptive)
+  elapsed = session.run(data)
+  server.shutdown()
+  serverThread.join()
+  return (len(data) / 1024.0 / elapsed,
+          percentile(session.latencies, 0.5) * 1000,
+          percentile(session.latencies, 0.95) * 1000,
+          session.window.lost)
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__)
+  parser.add_argument('--bytes', type=int, default=200 * 1024)
+  parser.add_argument('--rate', type=float, default=200)
+  parser.add_argument('--queue', type=int, default=8)
+  parser.add_argument('--path', nargs='+',
+                      default=['0.005,0', '0.05,0', '0.05,0.02', '0.1,0.05'],
+                      help='one-way delay in seconds and loss rate')
+  args = parser.parse_args()
+
+  data = os.urandom(args.bytes)
+  print "{:>6} {:>5} {:>7} {:>9} {:>8} {:>8} {:>6}".format(
+    'delay', 'loss', 'window', 'KB/s', 'p50 ms', 'p95 ms', 'lost')
+  for path in args.path:
+    delay, loss = [float(value) for value in path.split(',')]
+    for adaptive in [False, True]:
+      result = bench(data, delay, loss, args.rate, args.queue, adaptive)
+      window = 'aimd' if adaptive else 'fixed'
+      print "{:>6.3f} {:>5.2f} {:>7} {:>9.1f} {:>8.1f} {:>8.1f} {:>6}".format(
+        delay, loss, window, *result)
+
+if __name__ == '__main__':
+  main()
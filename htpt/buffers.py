@@ -4,68 +4,175 @@ class BufferingException(Exception):
   pass
 
 class Buffer:
-  """Stores data, buffers it and sends it to the Framer"""
+  """
+  Stores data, buffers it and sends it to the Framer
+
+  The slots form a ring: self.head is the slot of the frame with
+  minAcceptableSeqNum, and the frame with sequence number seqNum goes in
+  slot (head + seqNum - minAcceptableSeqNum) % BUFFER_SIZE. Delivering a
+  frame clears its slot and moves head on by one, so the work per frame
+  does not depend on BUFFER_SIZE.
+
+  Frames waiting for an earlier one are limited by bytes as well as by
+  slots. Rather than raising when a frame does not fit, the buffer drops
+  it and recvData returns False. Frames that were already taken, e.g.
+  sent again because an ack was lost, are counted as duplicates and
+  recvData returns True for them. getFillLevel and isCongested tell the
+  session how full the buffer is, so it can ask its peer to hold back
+  before frames have to be dropped, and getStats reports the numbers.
+
+  """
   def __init__(self, **kArgs):
     """ParametersL kArgs- additional keyword arguments specified for
-    the function. Currently, the only additional option has the keyword
-    of 'minSeqNum' and an integer value which tells Framer the min
-    acceptable sequence number. Example syntax: Buffer(minSeqNum=5)"""
+    the function. Currently, the additional options are 'minSeqNum',
+    an integer value which tells Framer the min acceptable sequence
+    number, 'maxFlushSize', the most bytes of consecutive frames
+    joined into one call of the callback (MAX_FLUSH_SIZE by default),
+    'maxBufferedBytes', the most bytes held for frames that arrived
+    ahead of a missing one (MAX_BUFFERED_BYTES by default), and
+    'maxSeqNum', where the sender's sequence numbers wrap (MAX_SEQ_NUM
+    by default, MAX_EXT_SEQ_NUM for version 2 headers).
+    Example syntax: Buffer(minSeqNum=5, maxFlushSize=65536)"""
 
     # Defining buffers like Ben's original Framer code to make recvData() work
     # TODO Check if this is how we want to implement it finally
     self.buffer = [None] * BUFFER_SIZE
+    self.head = 0
     self.callback = None
+    self.maxFlushSize = kArgs.get('maxFlushSize', MAX_FLUSH_SIZE)
+    self.maxBufferedBytes = kArgs.get('maxBufferedBytes', MAX_BUFFERED_BYTES)
+    self.maxSeqNum = kArgs.get('maxSeqNum', MAX_SEQ_NUM)
+    # frames (and their bytes) held in the ring waiting to be delivered
+    self.bufferedFrames = 0
+    self.bufferedBytes = 0
+    self.peakBufferedBytes = 0
+    self.droppedFrames = 0
+    self.duplicateFrames = 0
     if 'minSeqNum' in kArgs:
       self.minAcceptableSeqNum = kArgs['minSeqNum']
       self.maxAcceptableSeqNum = BUFFER_SIZE + self.minAcceptableSeqNum
+      # the window is already known, so frames may arrive in any order
+      self.receivedData = True
     else:
       self.minAcceptableSeqNum = 0
       self.maxAcceptableSeqNum = BUFFER_SIZE
-    self.receivedData = False
+      self.receivedData = False
 
   def addCallback(self, callback):
     self.callback = callback
 
   def flush(self, **kwargs):
-    availableData = ''
-    while self.buffer[0] is not None:
-      availableData += self.buffer.pop(0)
-      self.minAcceptableSeqNum = ((self.minAcceptableSeqNum +1) % BUFFER_SIZE)
-      self.maxAcceptableSeqNum = ((self.maxAcceptableSeqNum +1) % BUFFER_SIZE)
-      self.buffer.append(None)
-      # keep sending recvData until it finishes
-      # This flushes availableData
-    if availableData != '':
-      self.callback(availableData)
+    """
+    Pass every frame up to the first missing one to the callback
+
+    Note: released frames are gathered and joined once per call of the
+    callback rather than appended to a string one by one. When a gap
+    fills and releases many frames, they are passed up in several
+    calls of at most maxFlushSize bytes each, split between frames. A
+    single frame larger than that is passed up on its own
+
+    """
+    #coalesce every data element up to the first missing sequence
+    buffer = self.buffer
+    head = self.head
+    data = buffer[head]
+    if data is None:
+      return
+    buffer[head] = None
+    head = (head + 1) % BUFFER_SIZE
+    if buffer[head] is None:
+      # the common case of a frame arriving in order: nothing to join
+      delivered = 1
+      released = len(data)
+      batches = [data] if len(data) > 0 else []
+    else:
+      # the frames released so far are counted from how far head moved
+      # and the sizes of the batches, rather than frame by frame
+      start = self.head
+      maxFlushSize = self.maxFlushSize
+      released = 0
+      batches = []
+      batch = [data]
+      batchSize = len(data)
+      data = buffer[head]
+      while data is not None:
+        buffer[head] = None
+        head += 1
+        if head == BUFFER_SIZE:
+          head = 0
+        size = len(data)
+        if batchSize + size > maxFlushSize:
+          batches.append(joinData(batch))
+          released += batchSize
+          batch = [data]
+          batchSize = size
+        else:
+          batch.append(data)
+          batchSize += size
+        data = buffer[head]
+      batches.append(joinData(batch))
+      released += batchSize
+      delivered = (head - start) % BUFFER_SIZE
+      if delivered == 0:
+        # every slot of the ring was released
+        delivered = BUFFER_SIZE
+    # move the window on before passing data up, in case the callback
+    # raises
+    self.head = head
+    self.bufferedFrames -= delivered
+    self.bufferedBytes -= released
+    self.minAcceptableSeqNum = ((self.minAcceptableSeqNum + delivered) %
+                                self.maxSeqNum)
+    self.maxAcceptableSeqNum = ((self.maxAcceptableSeqNum + delivered) %
+                                self.maxSeqNum)
+    for availableData in batches:
+      if availableData is not None:
+        self.callback(availableData)
     return
 
   def isSeqNumInBuffer(self, seqNum):
-    """If the sequence number is in the buffer, return True, else False"""
-    if seqNum >= self.minAcceptableSeqNum:
-      if seqNum <= self.maxAcceptableSeqNum:
-        return True
-      #explore the case where the sequence number wraps
-      elif (self.minAcceptableSeqNum + BUFFER_SIZE) >= MAX_SEQ_NUM:
-        #case where maxSeqNum wrapped, so seqNum > min > max
-        if(seqNum <= MAX_SEQ_NUM):
-          return True
-      else:
-        return False
-    else:
-      #case where the max seq num and seqNum have wrapped, but min has
-      #not
-      if(self.minAcceptableSeqNum + BUFFER_SIZE) > MAX_SEQ_NUM:
-        if(seqNum < self.maxAcceptableSeqNum):
-          return True
-      else:
-        return False
-    return False
+    """
+    If the sequence number is in the buffer, return True, else False
+
+    Note: the window runs from minAcceptableSeqNum to
+    maxAcceptableSeqNum, inclusive. Measuring how far seqNum is past the
+    start of the window modulo maxSeqNum gives the same answer whether
+    or not the window wraps
+
+    """
+    return (seqNum - self.minAcceptableSeqNum) % self.maxSeqNum <= BUFFER_SIZE
+
+  def isSeqNumDelivered(self, seqNum):
+    """
+    Return True if the frame with this sequence number has already been
+    passed up, i.e. it is at most BUFFER_SIZE behind minAcceptableSeqNum
+
+    Note: frames further back than that cannot be told apart from frames
+    too far ahead, so they are not counted as delivered
+
+    """
+    behind = (self.minAcceptableSeqNum - seqNum) % self.maxSeqNum
+    return 0 < behind <= BUFFER_SIZE
+
+  def setMaxSeqNum(self, maxSeqNum):
+    """
+    Change where the sender's sequence numbers wrap, e.g. once version 2
+    headers have been agreed on
+
+    Note: this should be called before the sequence numbers wrap in the
+    old space
+
+    """
+    self.maxSeqNum = maxSeqNum
+    self.maxAcceptableSeqNum = ((self.minAcceptableSeqNum + BUFFER_SIZE) %
+                                maxSeqNum)
 
   def recvData(self, data, seqNum):
     """Add the given data to the buffer at the right index and flush it
     in the right order.
 
-    Parameters: data- the data from the decoded and disassembled frame
+    Parameters: data- the data from the decoded and disassembled frame,
+    a string or a buffer such as a memoryview slice of the frame
     seqNum- the sequence number of the frame from disassembled header
 
     Note: the acceptable window is based on available buffer space,
@@ -73,32 +180,147 @@ class Buffer:
 
     This also keeps flushing out data as received at minimum sequence number
     and advancing the window. For data out of order, we wait for buffer to
-    receive packets and then flush it above."""
+    receive packets and then flush it above.
+
+    Returns: True if the frame was taken or is a duplicate of one that
+    was, whether it is still waiting in the buffer or already passed
+    up. False if it was dropped because it is too far ahead of the
+    window or the buffer has no room for its bytes. A dropped frame has
+    to be sent again"""
 
     # if this is the first element, then set this to the min seq number
     if self.receivedData == False:
       self.minAcceptableSeqNum = seqNum
       self.maxAcceptableSeqNum = seqNum + BUFFER_SIZE 
       self.receivedData = True
-    if not self.isSeqNumInBuffer(seqNum):
-      raise BufferingException("seqNum already received/Not enough space in the buffer {} ".format(seqNum))
-    index = (seqNum - self.minAcceptableSeqNum) % MAX_SEQ_NUM
+    # the same test as isSeqNumInBuffer, without the call. The window is
+    # one slot wider than the ring, so the frame at the very top of it
+    # has to wait until the head moves on as well
+    index = (seqNum - self.minAcceptableSeqNum) % self.maxSeqNum
+    if index >= BUFFER_SIZE:
+      if self.isSeqNumDelivered(seqNum):
+        self.duplicateFrames += 1
+        return True
+      # too far ahead of the missing frame
+      self.droppedFrames += 1
+      return False
 #    print "len: {} data: {} index: {} seqNum: {}".format(len(data), data, index, seqNum)
-    # if the data is just an empty string and this is the first element, then do nothing
-    if data == "" and index == 0:
-      self.minAcceptableSeqNum = seqNum + 1
-      self.maxAcceptableSeqNum = seqNum + BUFFER_SIZE
-    else:
-      self.buffer[index] = data
-    #coalesce every data element up to the first missing sequence
-    availableData = ''
-    while self.buffer[0] is not None:
-      availableData += self.buffer.pop(0)
-      self.minAcceptableSeqNum = ((self.minAcceptableSeqNum +1) % MAX_SEQ_NUM)
-      self.maxAcceptableSeqNum = ((self.maxAcceptableSeqNum +1) % MAX_SEQ_NUM)
-      self.buffer.append(None)
-      # keep sending recvData until it finishes
-      # This flushes availableData
-    if availableData != '':
-      self.callback(availableData)
-    return
+    # empty frames (polls) are stored like any other so that the window
+    # only advances past them once every earlier frame has arrived
+    if index != 0:
+      slot = (self.head + index) % BUFFER_SIZE
+      buffer = self.buffer
+      if buffer[slot] is not None:
+        self.duplicateFrames += 1
+        return True
+      # the frame at the head is always taken since it drains the
+      # buffer, but frames after a gap have to fit in the byte budget
+      bufferedBytes = self.bufferedBytes + len(data)
+      if bufferedBytes > self.maxBufferedBytes:
+        self.droppedFrames += 1
+        return False
+      buffer[slot] = data
+      self.bufferedFrames += 1
+      self.bufferedBytes = bufferedBytes
+      return True
+    # only a frame landing at the head can let anything through. If the
+    # frame after it has not arrived, pass it straight up
+    head = (self.head + 1) % BUFFER_SIZE
+    if self.buffer[head] is None:
+      self.head = head
+      self.minAcceptableSeqNum = ((self.minAcceptableSeqNum + 1) %
+                                  self.maxSeqNum)
+      self.maxAcceptableSeqNum = ((self.maxAcceptableSeqNum + 1) %
+                                  self.maxSeqNum)
+      if len(data) > 0:
+        self.callback(data)
+      return True
+    # the peak is only taken before frames leave the buffer, since the
+    # bytes held only grow until then
+    if self.bufferedBytes > self.peakBufferedBytes:
+      self.peakBufferedBytes = self.bufferedBytes
+    self.buffer[self.head] = data
+    self.bufferedFrames += 1
+    self.bufferedBytes += len(data)
+    self.flush()
+    return True
+
+  def getAck(self):
+    """
+    Return the acknowledgement for the frames received so far
+
+    Returns: None if no frame has been received yet, else a
+    (cumAck, bitmap, credit) tuple. cumAck is the sequence number of the
+    next frame to deliver, so every frame before it has been received.
+    Bit i of bitmap is set if the frame with sequence number
+    cumAck + 1 + i is waiting in the buffer. credit is how much of the
+    byte budget is free, in CREDIT_UNITs: the sender may have that many
+    bytes unacked and the buffer can still hold them all if the first
+    one is lost
+
+    """
+    if self.receivedData == False:
+      return None
+    bitmap = 0
+    if self.bufferedFrames > 0:
+      buffer = self.buffer
+      for bit in xrange(SACK_BITS):
+        if buffer[(self.head + 1 + bit) % BUFFER_SIZE] is not None:
+          bitmap |= 1 << bit
+    credit = min((self.maxBufferedBytes - self.bufferedBytes) / CREDIT_UNIT,
+                 MAX_CREDIT)
+    return self.minAcceptableSeqNum, bitmap, max(credit, 0)
+
+  def getFillLevel(self):
+    """
+    Return how full the buffer is, from 0 (empty) to 1 (full)
+
+    Note: this is the fuller of the byte budget and the slots, since
+    running out of either drops frames
+
+    """
+    return max(float(self.bufferedBytes) / self.maxBufferedBytes,
+               float(self.bufferedFrames) / BUFFER_SIZE)
+
+  def isCongested(self):
+    """Return True once the fill level reaches BACKPRESSURE_LEVEL"""
+    return self.getFillLevel() >= BACKPRESSURE_LEVEL
+
+  def getStats(self):
+    """Return a dictionary of the buffer's fill level and counters"""
+    if self.bufferedBytes > self.peakBufferedBytes:
+      self.peakBufferedBytes = self.bufferedBytes
+    return {'bufferedFrames': self.bufferedFrames,
+            'bufferedBytes': self.bufferedBytes,
+            'peakBufferedBytes': self.peakBufferedBytes,
+            'droppedFrames': self.droppedFrames,
+            'duplicateFrames': self.duplicateFrames,
+            'fillLevel': self.getFillLevel()}
+
+def joinData(pieces):
+  """
+  Return the data in a list of strings or buffers as one object
+
+  Parameters: pieces- the data of consecutive frames, e.g. memoryview
+  slices of the decoded frames
+
+  Returns: None if there is no data. A single piece is returned as it
+  is, so its bytes are not copied until they are written to Tor.
+  Otherwise the pieces are copied once, by str.join if they are all
+  strings or else into a bytearray
+
+  """
+  pieces = [piece for piece in pieces if len(piece) > 0]
+  if pieces == []:
+    return None
+  if len(pieces) == 1:
+    return pieces[0]
+  try:
+    return ''.join(pieces)
+  except TypeError:
+    # str.join does not take buffers such as memoryview
+    pass
+  joined = bytearray()
+  for piece in pieces:
+    joined += piece
+  return joined
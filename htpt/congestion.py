@@ -0,0 +1,72 @@
+# Georgia Tech
+# Spring 2014
+# congestion.py: size the client's request window to the path to the bridge
+
+import threading
+
+# requests in flight when a session starts
+INITIAL_WINDOW = 4
+# bounds on the number of requests in flight
+MIN_WINDOW = 1
+MAX_WINDOW = 16
+# factor the window is multiplied by after a loss
+DECREASE = 0.5
+
+
+class CongestionWindow():
+  """
+  Number of requests the client keeps in flight, by AIMD
+
+  Every answered request grows the window by 1/window, so it opens by
+  one request per round trip while nothing is lost. A lost request, or
+  a frame that has to be sent again, halves it. Losses are only acted
+  on once per round trip: after a decrease, further losses are ignored
+  until a window's worth of requests has been answered, since they are
+  most likely from requests that were sent before the window shrank.
+
+  """
+
+  def __init__(self, initial=INITIAL_WINDOW, minimum=MIN_WINDOW,
+               maximum=MAX_WINDOW):
+    """
+    Parameters:
+    initial- the number of requests in flight to start with
+    minimum, maximum- the bounds on the window
+
+    """
+    self.minimum = minimum
+    self.maximum = maximum
+    self.window = float(initial)
+    # responses left before a loss can shrink the window again
+    self.recovery = 0
+    self.losses = 0
+    self.decreases = 0
+    self.lock = threading.Lock()
+
+  def getWindow(self):
+    """Return the number of requests that may be in flight"""
+    return int(self.window)
+
+  def onResponse(self):
+    """Open the window after a request was answered"""
+    self.lock.acquire()
+    if self.recovery > 0:
+      self.recovery -= 1
+    self.window = min(self.window + 1 / self.window, self.maximum)
+    self.lock.release()
+
+  def onLoss(self):
+    """Close the window after a request or a frame was lost"""
+    self.lock.acquire()
+    self.losses += 1
+    if self.recovery == 0:
+      self.window = max(self.window * DECREASE, self.minimum)
+      self.recovery = self.getWindow()
+      self.decreases += 1
+    self.lock.release()
+
+  def getStats(self):
+    """Return a dictionary of the window and the losses seen"""
+    return {'window': self.window,
+            'losses': self.losses,
+            'decreases': self.decreases}
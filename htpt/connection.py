@@ -0,0 +1,381 @@
+# Georgia Tech
+# Spring 2014
+# connection.py: persistent HTTP/1.1 connections from the htpt client
+# to the bridge
+
+import errno
+import httplib
+import socket
+import threading
+import urlparse
+from Queue import Queue, Empty
+
+# maximum number of keep-alive connections held open to the bridge
+POOL_SIZE = 4
+# number of seconds to wait on the bridge before giving up on a request
+REQUEST_TIMEOUT = 30
+# maximum number of requests outstanding to the bridge at once
+WINDOW_SIZE = 4
+# socket errors that mean the connection was closed before the request
+# got to the bridge, e.g. by the bridge's keep-alive timeout
+CLOSED_ERRNOS = [errno.ECONNRESET, errno.EPIPE, errno.ECONNABORTED,
+                 errno.EBADF]
+
+
+class ConnectionError(Exception):
+  pass
+
+
+def isClosedConnection(error):
+  """
+  Return True if an error from sending a request or reading its status
+  line means the connection had been closed, so the bridge never
+  answered the request and it is safe to send it again
+
+  Note: a timeout is not one of these errors. The bridge may have
+  received the request and answer it late, so sending it again would
+  send its frames twice
+
+  """
+  if isinstance(error, httplib.BadStatusLine):
+    return True
+  if isinstance(error, socket.timeout):
+    return False
+  return isinstance(error, socket.error) and error.errno in CLOSED_ERRNOS
+
+
+def requestPath(url):
+  """
+  Return the path and query string of an encoded url
+
+  Note: we cannot use urlparse.urlunsplit here because the hex
+  encoding relies on the case of the query string being preserved, so
+  the pieces are glued back together by hand
+
+  """
+  parts = urlparse.urlsplit(url)
+  path = parts.path
+  if path == '':
+    path = '/'
+  if parts.query != '':
+    path = path + '?' + parts.query
+  return path
+
+def cookieHeader(cookies):
+  """
+  Join the cookies produced by urlEncode into a single Cookie header
+
+  Parameters: cookies- a list of strings of the form 'Cookie: key=value'
+
+  Returns: a string with the key value pairs separated by '; ', in the
+  same order that they were given
+
+  """
+  pairs = []
+  for cookie in cookies:
+    if cookie.startswith('Cookie: '):
+      cookie = cookie[len('Cookie: '):]
+    pairs.append(cookie)
+  return '; '.join(pairs)
+
+def splitCookieHeader(header):
+  """
+  Inverse of cookieHeader: turn a raw Cookie header back into the list
+  of cookies that urlEncode.decode expects
+
+  """
+  if header is None or header == '':
+    return []
+  cookies = []
+  for pair in header.split(';'):
+    pair = pair.strip()
+    if pair != '':
+      cookies.append('Cookie: ' + pair)
+  return cookies
+
+
+class ConnectionPool():
+  """
+  Pool of persistent HTTP/1.1 connections to a single bridge
+
+  Connections are handed out to one request at a time and returned to
+  the pool once the response has been read, so consecutive frames
+  reuse the same TCP connection instead of paying for a new handshake
+  each time. A connection that the bridge has closed is thrown away and
+  the request is transparently retried on a fresh one.
+
+  """
+
+  def __init__(self, address, size=POOL_SIZE, timeout=REQUEST_TIMEOUT):
+    """
+    Parameters:
+    address- the bridge as a 'host:port' string
+    size- the maximum number of connections to keep open
+    timeout- number of seconds to wait on a single request
+
+    """
+    self.address = address
+    self.size = size
+    self.timeout = timeout
+    self.idle = Queue()
+    self.lock = threading.Lock()
+    self.numConnections = 0
+
+  def newConnection(self):
+    """Open a new connection to the bridge"""
+    conn = httplib.HTTPConnection(self.address, timeout=self.timeout)
+    # number of responses read over this connection, used to tell
+    # apart a stale keep-alive connection from a bridge that is down
+    conn.numRequests = 0
+    return conn
+
+  def getConnection(self):
+    """
+    Get an idle connection from the pool, opening a new one if the
+    pool is not full yet. If all connections are busy, block until one
+    is released
+
+    """
+    try:
+      return self.idle.get_nowait()
+    except Empty:
+      pass
+    self.lock.acquire()
+    try:
+      if self.numConnections < self.size:
+        self.numConnections += 1
+        return self.newConnection()
+    finally:
+      self.lock.release()
+    return self.idle.get()
+
+  def releaseConnection(self, conn):
+    """Return a healthy connection to the pool"""
+    self.idle.put(conn)
+
+  def discardConnection(self, conn):
+    """Close a broken connection and free its slot in the pool"""
+    conn.close()
+    self.lock.acquire()
+    self.numConnections -= 1
+    self.lock.release()
+
+  def request(self, encoded):
+    """
+    Send an encoded url and its cookies to the bridge
+
+    Parameters: encoded- a dictionary as returned by urlEncode.encode
+    with the url under 'url' and a list of cookies under 'cookie'
+
+    Returns: the body of the response as a string
+
+    Note: if a connection that has already carried a response turns
+    out to be closed before any of the response arrives, the bridge
+    most likely closed it while it sat idle, so the request is resent
+    on a new connection (see isClosedConnection). Any other failure is
+    reported to the caller as a ConnectionError, except a timeout,
+    which is raised as the socket.timeout itself and never resent
+
+    """
+    path = requestPath(encoded['url'])
+    headers = {'Connection': 'keep-alive'}
+    if encoded['cookie'] != []:
+      headers['Cookie'] = cookieHeader(encoded['cookie'])
+    while True:
+      conn = self.getConnection()
+      response = None
+      try:
+        conn.request('GET', path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+      except (httplib.HTTPException, socket.error) as e:
+        self.discardConnection(conn)
+        if isinstance(e, socket.timeout):
+          raise
+        if response is None and conn.numRequests > 0 and \
+           isClosedConnection(e):
+          continue
+        raise ConnectionError("Request to {} failed: {}"
+                              .format(self.address, e))
+      conn.numRequests += 1
+      if response.will_close:
+        self.discardConnection(conn)
+      else:
+        self.releaseConnection(conn)
+      return body
+
+  def close(self):
+    """Close every idle connection in the pool"""
+    while True:
+      try:
+        conn = self.idle.get_nowait()
+      except Empty:
+        break
+      self.discardConnection(conn)
+
+
+class RequestWindow():
+  """
+  Keep up to a fixed number of requests to the bridge in flight
+
+  Requests are handed to a set of worker threads which send them over
+  a ConnectionPool and pass each response body to the callback as it
+  arrives. Responses may come back in any order; the sequence numbers
+  in the frames and the reordering in buffers.Buffer put the data back
+  in order.
+
+  A request that fails is reported to the sender. If the frames it
+  carried will be sent again (see frame.Assembler's reliable option),
+  up to maxLost requests in a row may be lost instead. Responses the
+  callback cannot handle are counted apart, in self.dropped, since the
+  request itself got through. They are reported once more than maxLost
+  come in a row, and do not close the congestion window.
+
+  With a congestion.CongestionWindow, the number of requests in flight
+  follows it instead of staying at size: answered requests open it and
+  lost ones close it. size is then the most it can grow to.
+
+  """
+
+  def __init__(self, pool, callback, size=WINDOW_SIZE, maxLost=0,
+               congestion=None):
+    """
+    Parameters:
+    pool- the ConnectionPool to send requests over. It should allow at
+    least size connections, otherwise requests queue for a connection
+    callback- function called with the body of every response
+    size- maximum number of outstanding requests
+    maxLost- number of failed requests in a row that are only counted
+    in self.lost rather than reported
+    congestion- a congestion.CongestionWindow to size the window by, or
+    None to always allow size requests
+
+    """
+    self.pool = pool
+    self.callback = callback
+    self.size = size
+    self.maxLost = maxLost
+    self.lost = 0
+    self.lostInARow = 0
+    self.dropped = 0
+    self.droppedInARow = 0
+    self.congestion = congestion
+    self.outstanding = 0
+    self.outstandingLock = threading.Lock()
+    # signalled whenever a request is answered and makes room
+    self.room = threading.Condition(self.outstandingLock)
+    self.requests = Queue()
+    self.error = None
+    self.workers = []
+    for index in range(size):
+      worker = threading.Thread(target=self.sendRequests)
+      worker.daemon = True
+      worker.start()
+      self.workers.append(worker)
+
+  def send(self, encoded, callback=None):
+    """
+    Queue an encoded url and its cookies to be sent to the bridge
+
+    Parameters:
+    encoded- the url and cookies as returned by urlEncode.encode
+    callback- function to call with the response instead of the
+    window's callback
+
+    Note: this blocks while the window is full, so the caller cannot
+    get more than getLimit() requests ahead of the bridge. If an
+    earlier request failed, its error is raised here
+
+    """
+    self.checkError()
+    self.outstandingLock.acquire()
+    while self.outstanding >= self.getLimit():
+      self.room.wait()
+    self.outstanding += 1
+    self.outstandingLock.release()
+    if callback is None:
+      callback = self.callback
+    self.requests.put((encoded, callback))
+
+  def sendRequests(self):
+    """Worker thread: send queued requests until None is queued"""
+    while True:
+      item = self.requests.get()
+      if item is None:
+        self.requests.task_done()
+        return
+      encoded, callback = item
+      try:
+        try:
+          body = self.pool.request(encoded)
+        except Exception as e:
+          self.outstandingLock.acquire()
+          self.lost += 1
+          self.lostInARow += 1
+          lostInARow = self.lostInARow
+          self.outstandingLock.release()
+          if self.congestion is not None:
+            self.congestion.onLoss()
+          if lostInARow > self.maxLost:
+            self.error = e
+          continue
+        self.outstandingLock.acquire()
+        self.lostInARow = 0
+        self.outstandingLock.release()
+        if self.congestion is not None:
+          self.congestion.onResponse()
+        try:
+          callback(body)
+        except Exception as e:
+          self.outstandingLock.acquire()
+          self.dropped += 1
+          self.droppedInARow += 1
+          droppedInARow = self.droppedInARow
+          self.outstandingLock.release()
+          if droppedInARow > self.maxLost:
+            self.error = e
+          continue
+        self.outstandingLock.acquire()
+        self.droppedInARow = 0
+        self.outstandingLock.release()
+      finally:
+        self.outstandingLock.acquire()
+        self.outstanding -= 1
+        self.room.notifyAll()
+        self.outstandingLock.release()
+        self.requests.task_done()
+
+  def getLimit(self):
+    """Return the number of requests that may be outstanding right now"""
+    if self.congestion is None:
+      return self.size
+    return max(min(self.congestion.getWindow(), self.size), 1)
+
+  def isFull(self):
+    """
+    Return True if getLimit() requests are outstanding, so send would
+    block
+
+    Note: only meaningful to the thread that calls send, since other
+    threads only ever make room in the window
+    """
+    return self.outstanding >= self.getLimit()
+
+  def checkError(self):
+    """Raise the error of a failed request, if any"""
+    if self.error is not None:
+      error = self.error
+      self.error = None
+      raise error
+
+  def wait(self):
+    """Block until every queued request has been answered"""
+    self.requests.join()
+    self.checkError()
+
+  def close(self):
+    """Stop the worker threads once the queued requests are done"""
+    for worker in self.workers:
+      self.requests.put(None)
+    for worker in self.workers:
+      worker.join()
@@ -1,6 +1,45 @@
 # used in buffers.py
 BUFFER_SIZE = 2048
+# most bytes the reorder buffer passes to its callback at once
+MAX_FLUSH_SIZE = 256 * 1024
+# most bytes the reorder buffer holds while waiting for a missing frame
+MAX_BUFFERED_BYTES = 8 * 1024 * 1024
+# fill level (0-1) of the reorder buffer at which to ask for backpressure
+BACKPRESSURE_LEVEL = 0.5
 # used by frame.py
 MAX_SEQ_NUM = 65535
 MIN_SIZE_TO_PASS_UP = 512
 MAX_SESSION_NUM = 256
+# sequence numbers and session IDs of version 2 headers, see EXT_FLAG
+MAX_EXT_SEQ_NUM = 2**32
+MAX_EXT_SESSION_NUM = 2**24
+# size of the header that frame.Assembler puts on every frame
+HEADER_SIZE = 4
+# size of a version 2 header, which has an extension after those 4 bytes
+EXT_HEADER_SIZE = 8
+# size of the length field that follows the header of a packed frame
+PACKED_LENGTH_SIZE = 2
+# largest segment that fits in a packed frame's length field
+MAX_PACKED_SIZE = 65535
+# flag bits in the frame header
+MORE_DATA_FLAG = 1<<7
+SYN_FLAG = 1<<6
+LONG_POLL_FLAG = 1<<5
+PACKED_FLAG = 1<<4
+BACKPRESSURE_FLAG = 1<<3
+ACK_FLAG = 1<<2
+# the header is version 2: the high 16 bits of the sequence number and
+# session ID follow the 4 byte header
+EXT_FLAG = 1<<1
+# size of the acknowledgement that follows the header when ACK_FLAG is set
+ACK_SIZE = 8
+# size of the acknowledgement after a version 2 header
+EXT_ACK_SIZE = 10
+# frames after the cumulative ACK covered by the SACK bitmap
+SACK_BITS = 32
+# bytes per unit of the receive credit in an acknowledgement
+CREDIT_UNIT = 1024
+# largest receive credit an acknowledgement can carry, in CREDIT_UNITs
+MAX_CREDIT = 65535
+# bytes a sender may have unacked before the peer's first acknowledgement
+INITIAL_CREDIT = 64 * 1024
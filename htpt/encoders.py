@@ -0,0 +1,257 @@
+# Georgia Tech
+# Spring 2014
+# encoders.py: registry of the url and image encodings, what each can
+# carry and what it costs
+
+import math
+import os
+import threading
+import timeit
+
+import imageEncode
+import urlEncode
+
+# payload bytes each encoder is measured with, or its capacity if that
+# is smaller
+SAMPLE_SIZE = 4096
+# times the measurement is repeated. The fastest run is kept
+MEASURE_REPEAT = 3
+# measurements within this fraction of each other count as equal, so
+# encoders that are about as good are not picked by timing noise
+TIE_TOLERANCE = 0.1
+
+
+class EncoderException(Exception):
+  pass
+
+
+class Encoder():
+  """
+  One way of hiding data, in the url and cookies of a request or in the
+  image of a response
+
+  Every encoder declares how many bytes one request or response can
+  carry. Its expansion ratio, the bytes sent per byte of data, and its
+  CPU cost per byte of data, for encoding and decoding it again, are
+  measured by measure, since both depend on the machine and on how the
+  encoder is implemented.
+
+  """
+
+  def __init__(self, name, kind, encode, decode, capacity=None,
+               mimeType=None, magic=None):
+    """
+    Parameters:
+    name- the type passed to urlEncode.encode or imageEncode.encode
+    kind- 'url' or 'image'
+    encode, decode- functions turning data into what is sent and back
+    capacity- function from the number of characters a request may
+    take up to the bytes of data it carries, or None if there is no
+    limit, as for images
+    mimeType- the Content-Type images of this kind are served with
+    magic- the bytes every encoded image starts with, see
+    EncoderRegistry.identify
+
+    """
+    self.name = name
+    self.kind = kind
+    self.encodeFunction = encode
+    self.decodeFunction = decode
+    self.capacityFunction = capacity
+    self.mimeType = mimeType
+    self.magic = magic
+    # None until measured
+    self.expansion = None
+    self.costPerByte = None
+    # set if measuring failed, e.g. an external tool is missing
+    self.available = True
+
+  def encode(self, data):
+    return self.encodeFunction(data)
+
+  def decode(self, encoded, **kwargs):
+    return self.decodeFunction(encoded, **kwargs)
+
+  def getCapacity(self, maxSize=urlEncode.MAX_REQUEST_SIZE):
+    """Return the bytes of data one request can carry in maxSize
+    characters, or None if there is no limit"""
+    if self.capacityFunction is None:
+      return None
+    return self.capacityFunction(maxSize)
+
+  def countRequests(self, size, maxSize=urlEncode.MAX_REQUEST_SIZE):
+    """Return the number of requests (or responses) it takes to carry
+    size bytes of data"""
+    capacity = self.getCapacity(maxSize)
+    if capacity is None or size <= capacity:
+      return 1
+    if capacity <= 0:
+      raise EncoderException("A {} request cannot carry any data"
+                             .format(self.name))
+    return int(math.ceil(float(size) / capacity))
+
+  def getWireSize(self, encoded):
+    """Return the bytes sent for something this encoder returned: the
+    url and cookies of a request or the image of a response"""
+    if self.kind == 'url':
+      return len(encoded['url']) + sum([len(cookie)
+                                        for cookie in encoded['cookie']])
+    return len(encoded)
+
+  def measure(self, size=SAMPLE_SIZE):
+    """
+    Measure the expansion ratio and the CPU cost per byte on random
+    data
+
+    Parameters: size- the bytes of data to measure with. Url encoders
+    are measured with at most one request's worth
+
+    Note: if the encoder fails, e.g. because an external tool it runs
+    is missing, it is marked as not available instead of raising
+
+    """
+    capacity = self.getCapacity()
+    if capacity is not None:
+      size = min(size, capacity)
+    data = os.urandom(max(size, 1))
+    try:
+      encoded = self.encode(data)
+      if str(self.decode(encoded)) != data:
+        raise EncoderException("{} does not decode what it encodes"
+                               .format(self.name))
+      seconds = min(timeit.repeat(lambda: self.decode(self.encode(data)),
+                                  number=1, repeat=MEASURE_REPEAT))
+    except Exception as e:
+      print "Encoder {} is not available: {}".format(self.name, e)
+      self.available = False
+      return
+    self.expansion = float(self.getWireSize(encoded)) / len(data)
+    self.costPerByte = seconds / len(data)
+
+  def getStats(self):
+    """Return a dictionary of what the encoder declares and measured"""
+    return {'kind': self.kind,
+            'capacity': self.getCapacity(),
+            'expansion': self.expansion,
+            'costPerByte': self.costPerByte,
+            'available': self.available}
+
+
+class EncoderRegistry():
+  """
+  Every encoder, looked up by name, with a choice of the best one for a
+  payload
+
+  Note: encoders are measured the first time they are chosen between,
+  so calibrate can be called at start up to move that cost out of the
+  first request. Measuring holds lock, so an encoder is measured once
+  even if several requests choose at the same time
+
+  """
+
+  def __init__(self):
+    self.encoders = {}
+    self.lock = threading.Lock()
+
+  def register(self, encoder):
+    """Add an encoder, raising an EncoderException if its name is
+    taken"""
+    if encoder.name in self.encoders:
+      raise EncoderException("Encoder {} is already registered"
+                             .format(encoder.name))
+    self.encoders[encoder.name] = encoder
+
+  def get(self, name):
+    """Return the encoder with the given name"""
+    if name not in self.encoders:
+      raise EncoderException("No encoder named {}".format(name))
+    return self.encoders[name]
+
+  def getEncoders(self, kind, names=None):
+    """Return the encoders of a kind, only those in names if it is
+    given, sorted by name"""
+    return [encoder for name, encoder in sorted(self.encoders.items())
+            if encoder.kind == kind and (names is None or name in names)]
+
+  def calibrate(self, names=None):
+    """Measure every encoder (in names, if given) not measured yet"""
+    self.lock.acquire()
+    try:
+      for name, encoder in self.encoders.items():
+        if (names is None or name in names) and encoder.available and \
+           encoder.costPerByte is None:
+          encoder.measure()
+    finally:
+      self.lock.release()
+
+  def choose(self, kind, size, names=None,
+             maxSize=urlEncode.MAX_REQUEST_SIZE):
+    """
+    Return the name of the best encoder of a kind for size bytes
+
+    Parameters:
+    kind- 'url' or 'image'
+    size- the bytes of data to send
+    names- the encoders the peer can decode, most preferred first, by
+    default all of them by name
+    maxSize- the number of characters a request may take up
+
+    Note: the encoder that needs the fewest requests wins, since every
+    request costs a round trip. Ties go to the lowest expansion, the
+    fewest bytes on the wire, and then to the lowest CPU cost. Values
+    within TIE_TOLERANCE of the lowest count as ties, and the encoder
+    that comes first in names wins those, so the choice does not change
+    with timing noise between runs
+
+    Note: images have no capacity limit, so one response carries any
+    size and size plays no part in choosing between image encoders
+
+    """
+    candidates = self.getEncoders(kind, names)
+    if names is not None:
+      candidates.sort(key=lambda encoder: names.index(encoder.name))
+    self.calibrate([encoder.name for encoder in candidates])
+    candidates = [encoder for encoder in candidates if encoder.available]
+    if candidates == []:
+      raise EncoderException("No {} encoder is available".format(kind))
+    fewest = min([encoder.countRequests(size, maxSize)
+                  for encoder in candidates])
+    candidates = [encoder for encoder in candidates
+                  if encoder.countRequests(size, maxSize) == fewest]
+    for measured in ['expansion', 'costPerByte']:
+      lowest = min([getattr(encoder, measured) for encoder in candidates])
+      candidates = [encoder for encoder in candidates
+                    if getattr(encoder, measured) <=
+                    lowest * (1 + TIE_TOLERANCE)]
+    return candidates[0].name
+
+  def identify(self, image):
+    """Return the name of the image encoder that made an image, from
+    the bytes it starts with, or None if none of them did"""
+    for encoder in self.getEncoders('image'):
+      if encoder.magic is not None and \
+         str(image[:len(encoder.magic)]) == encoder.magic:
+        return encoder.name
+    return None
+
+  def getStats(self):
+    """Return the stats of every encoder, keyed by name"""
+    return dict([(name, encoder.getStats())
+                 for name, encoder in self.encoders.items()])
+
+def makeRegistry():
+  """Return a registry of every encoder in urlEncode and imageEncode"""
+  registry = EncoderRegistry()
+  for name in urlEncode.AVAILABLE_TYPES:
+    registry.register(Encoder(name, 'url', urlEncode.ENCODERS[name],
+                              urlEncode.decode, urlEncode.CAPACITIES[name]))
+  for name in imageEncode.AVAILABLE_TYPES:
+    decode = lambda image, name=name, **kwargs: \
+             imageEncode.decode(image, name, **kwargs)
+    registry.register(Encoder(name, 'image', imageEncode.ENCODERS[name],
+                              decode, mimeType=imageEncode.MIME_TYPES[name],
+                              magic=imageEncode.MAGIC.get(name)))
+  return registry
+
+# the encoders shared by the client and the bridge
+registry = makeRegistry()
@@ -4,9 +4,11 @@
 # frame.py: ensure in-order delivery of frames for the htpt project
 
 import threading
-import struct
+from collections import deque
 #from random import randint
 
+import headerCodec
+import retransmit
 from buffers import Buffer
 from constants import *
 
@@ -16,59 +18,270 @@ class FramingException(Exception):
 
 
 class SeqNumber():
-  # initialize this to -1 so that the first sequence number comes out to 0
-  _seqNum = -1
-  _lock = threading.Lock()
-  @classmethod
-  def setSeqNum(cls, seqNum):
-    cls._lock.acquire()
-    cls._seqNum = seqNum
-    cls._lock.release()
+  """
+  Sequence numbers handed out by one Assembler
 
-  @classmethod  
-  def getSequenceAndIncrement(cls):
+  Each Assembler owns its own SeqNumber, so every session numbers its
+  frames from its own sequence space and framing for one session never
+  waits on another.
+
+  Note: there is no lock. An Assembler is only used by one thread at a
+  time (readTor on the client, the request holding the session's lock
+  on the bridge), so the counter needs no protection of its own
+
+  """
+
+  def __init__(self, seqNum=-1, maxSeqNum=MAX_SEQ_NUM):
     """
-    In a thread safe manner, get the sequence number and increment.
-    
-    Note: this function is called only when a new client connects
+    Parameters: seqNum- the number before the first one handed out.
+    The default of -1 makes the first sequence number 0
+    maxSeqNum- where the sequence numbers wrap, MAX_EXT_SEQ_NUM for
+    version 2 headers
+
+    """
+    self.seqNum = seqNum
+    self.maxSeqNum = maxSeqNum
+    self.initialized = True
+
+  def setSeqNum(self, seqNum):
+    self.seqNum = seqNum
+
+  def getSequenceAndIncrement(self):
+    """Increment the sequence number, wrapping at maxSeqNum, and
+    return it"""
+    self.seqNum = (self.seqNum + 1) % self.maxSeqNum
+    return self.seqNum
+
+class SessionIDAllocator():
+  """
+  Hand out the session IDs in one range and take them back
+
+  IDs that have never been used are handed out in order from the start
+  of the range. Released IDs go on a free list and are handed out again
+  once the unused ones run out, oldest release first, so an ID is
+  reused as late as possible in case a request for the old session is
+  still on its way. Both take the same time however many sessions are
+  live.
+
+  Note: allocate and release take the allocator's lock, so requests for
+  new sessions may be handled on several threads
+
+  """
+
+  def __init__(self, first, limit):
+    """
+    Parameters:
+    first- the lowest ID handed out
+    limit- one past the highest ID handed out
+
+    """
+    self.first = first
+    self.limit = limit
+    # the lowest ID that has never been handed out
+    self.nextUnused = first
+    self.free = deque()
+    self.live = set()
+    self.allocated = 0
+    self.released = 0
+    self.exhausted = 0
+    self.peakLive = 0
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.live)
+
+  def getCapacity(self):
+    """Return the number of IDs in the range"""
+    return self.limit - self.first
+
+  def allocate(self):
+    """
+    Return a session ID that no live session has
+
+    Note: raises a FramingException if every ID in the range is live
+
+    """
+    self.lock.acquire()
+    try:
+      if self.nextUnused < self.limit:
+        sessionID = self.nextUnused
+        self.nextUnused += 1
+      elif self.free:
+        sessionID = self.free.popleft()
+      else:
+        self.exhausted += 1
+        raise FramingException("All {} session IDs are in use"
+                               .format(self.getCapacity()))
+      self.live.add(sessionID)
+      self.allocated += 1
+      if len(self.live) > self.peakLive:
+        self.peakLive = len(self.live)
+      return sessionID
+    finally:
+      self.lock.release()
+
+  def release(self, sessionID):
     """
-    cls._lock.acquire()
-    cls._seqNum = ((cls._seqNum + 1) % MAX_SEQ_NUM)
-    cls._lock.release()
-    return cls._seqNum
+    Take back the ID of a session that closed or expired
+
+    Returns: True if the ID was live, False if it was not handed out by
+    this allocator or was already released
+
+    """
+    self.lock.acquire()
+    try:
+      if sessionID not in self.live:
+        return False
+      self.live.remove(sessionID)
+      self.free.append(sessionID)
+      self.released += 1
+      return True
+    finally:
+      self.lock.release()
+
+  def isLive(self, sessionID):
+    """Return True if the ID is held by a session"""
+    return sessionID in self.live
+
+  def getStats(self):
+    """Return a dictionary of the IDs handed out and how full the range
+    is"""
+    return {'live': len(self.live),
+            'peakLive': self.peakLive,
+            'capacity': self.getCapacity(),
+            'occupancy': float(len(self.live)) / self.getCapacity(),
+            'allocated': self.allocated,
+            'released': self.released,
+            'exhausted': self.exhausted}
+
 
 class SessionID():
-  """Class to generate a new session ID when a new client connects to the server"""
-  
-  _sessionID = 0
-  _lock = threading.Lock()
+  """
+  Generate a new session ID when a new client connects to the server
+
+  Clients with version 1 headers get IDs from 1 up to MAX_SESSION_NUM
+  and clients with version 2 headers from MAX_SESSION_NUM up to
+  MAX_EXT_SESSION_NUM, so the two never clash. ID 0 is never handed
+  out, since it is the ID a client sends before it has one.
+
+  Note: an ID stays taken until releaseSessionID is called for it, see
+  session.SessionTable.remove
+
+  """
+
+  _allocator = SessionIDAllocator(1, MAX_SESSION_NUM)
+  _extAllocator = SessionIDAllocator(MAX_SESSION_NUM, MAX_EXT_SESSION_NUM)
+
   @classmethod
-  def setSessionID(cls, sessionID):
-    cls._lock.acquire()
-    cls._sessionID = sessionID
-    cls._lock.release()
+  def reset(cls):
+    """Forget every ID handed out, e.g. between tests"""
+    cls._allocator = SessionIDAllocator(1, MAX_SESSION_NUM)
+    cls._extAllocator = SessionIDAllocator(MAX_SESSION_NUM,
+                                           MAX_EXT_SESSION_NUM)
 
   @classmethod  
   def getSessionIDAndIncrement(cls):
     """
     In a thread safe manner, get the session ID.
     
-    Note: this function is called only when a new client connects
+    Note: this function is called only when a new client connects. It
+    raises a FramingException if all the IDs are taken
 
     """
-    cls._lock.acquire()
-    cls._sessionID = ((cls._sessionID + 1) % MAX_SESSION_NUM)
-    cls._lock.release()
-    return cls._sessionID
+    return cls._allocator.allocate()
+
+  @classmethod
+  def getExtSessionIDAndIncrement(cls):
+    """
+    In a thread safe manner, get a session ID for a client that speaks
+    version 2 headers
+
+    Note: raises a FramingException if all the IDs are taken
+
+    """
+    return cls._extAllocator.allocate()
+
+  @classmethod
+  def releaseSessionID(cls, sessionID):
+    """Make the ID of a closed session available again. Returns False
+    if the ID was not taken"""
+    if sessionID < MAX_SESSION_NUM:
+      return cls._allocator.release(sessionID)
+    return cls._extAllocator.release(sessionID)
+
+  @classmethod
+  def getStats(cls):
+    """Return the stats of both ID ranges, see
+    SessionIDAllocator.getStats"""
+    return {'sessionIDs': cls._allocator.getStats(),
+            'extSessionIDs': cls._extAllocator.getStats()}
 
 class Assembler():
   """Class to Assemble a data frame with headers before sending to encoder"""
 
-  def __init__(self, sessionID=0):
-    """Initialize SeqNumber object and sessionID"""
-    # initialize the seq number to 0 and start sending frames
+  def __init__(self, sessionID=0, reliable=False, version=1):
+    """Initialize SeqNumber object and sessionID
+
+    Parameters:
+    sessionID- the session ID put in every header
+    reliable- if True, every frame is kept until the peer acknowledges
+    it, see setReliable, recvAck and getRetransmits
+    version- the header version to write, see setVersion"""
+    # every assembler numbers its frames from 0, independently of the
+    # other sessions
     self.seqNum = SeqNumber()
     self.setSessionID(sessionID)
+    self.unacked = None
+    self.setVersion(version)
+    if reliable:
+      self.setReliable()
+
+  def setReliable(self):
+    """
+    Keep every new frame until the peer acknowledges it and put acks on
+    the frames sent to it
+
+    Note: this should only be called once the peer is known to
+    understand acks, i.e. it has agreed on version 2 headers or sent an
+    ack itself (see recvAck). Until then the assembler writes frames in
+    the original format, a header followed by the data, since an older
+    peer would take an ack for data
+
+    """
+    if self.unacked is None:
+      self.unacked = retransmit.RetransmitQueue(
+        maxSeqNum=headerCodec.getMaxSeqNum(self.version))
+
+  def isReliable(self):
+    """Return True if frames are kept until the peer acknowledges them
+    and acks are put on the frames sent to it"""
+    return self.unacked is not None
+
+  def setVersion(self, version):
+    """
+    Set the header version written on every frame
+
+    Version 1 headers are 4 bytes with 16-bit sequence numbers and an
+    8-bit session ID. Version 2 headers set the ext flag and carry
+    another 4 bytes with the high bits of 32-bit sequence numbers and
+    24-bit session IDs, and their acks have a 32-bit cumulative ACK.
+
+    Note: the client starts with version 1 and switches to version 2
+    once the bridge has answered its connect request with a version 2
+    header, so this has to be called before the sequence numbers wrap
+
+    """
+    if version not in headerCodec.HEADER_VERSIONS:
+      raise FramingException("Unknown header version {}".format(version))
+    self.version = version
+    maxSeqNum = headerCodec.getMaxSeqNum(version)
+    self.seqNum.maxSeqNum = maxSeqNum
+    if self.unacked is not None:
+      self.unacked.maxSeqNum = maxSeqNum
+
+  def getVersion(self):
+    """Return the header version written on every frame"""
+    return self.version
 
   def setSessionID(self, sessionID):
     """
@@ -95,72 +308,210 @@ class Assembler():
     return self.sessionID
 
   def generateFlags(self, **kwargs):
-    """Generates a 4-bit string of bits
+    """Generates the 8-bit flags of a header
 
     Parameters: kwargs- additional keyword arguments specified for the
-    function. Currently, the only additional option is 'more_data' and
-    'SYN', which are assigned a boolean integer value (0/1). These
-    set appropriate bits in flags.
+    function. Currently, the additional options are 'more_data', 'SYN',
+    'long_poll', 'packed', 'backpressure' and 'ack', which are assigned
+    a boolean integer value (0/1). These set appropriate bits in flags.
     Example syntax: generateFlags(more_data=1, SYN=0)
 
-    flags format: [ more_data | SYN | X | X | X | X | X | X ]"""
+    flags format:
+    [ more_data | SYN | long_poll | packed | backpressure | ack | ext | X ]
+
+    Note: the ext flag is set by getHeaders for version 2 headers"""
 
-    flags = '00000000'
-    flag_list = list(flags)
-    if 'more_data' in kwargs:
-      more_data = kwargs['more_data']
-      flag_list[0]=str(more_data)
-    if 'SYN' in kwargs:
-      SYN_flag = kwargs['SYN']
-      flag_list[1]=str(SYN_flag)
-    flags = "".join(flag_list)
-    return int(flags, 2)
+    return headerCodec.makeFlags(**kwargs)
 
   def getSeqNum(self):
     """Get sequence number after incrementing"""
     sequenceNumber = self.seqNum.getSequenceAndIncrement()
     return sequenceNumber
 
-  def getHeaders(self, **kwargs):
+  def getHeaders(self, seqNum=None, ack=None, **kwargs):
     """Create a 4 byte struct header in network byte order
 
     16-bit sequence num | 8-bit session ID | 8-bit flag
     unsigned short (H) | unsigned char (B) | unsigned char (B) packed
 
     Calls functions to get:
-    seqNum- 2 byte sequence number of the frame
+    seqNum- 2 byte sequence number of the frame. If one is given, the
+    frame is being sent again and keeps its sequence number
     sessionID - 1 byte char int assigned by server
     flags - 8 bit int. check kwargs and set appropriate bit
 
+    If ack, a (cumAck, bitmap, credit) tuple from Disassembler.getAck,
+    is given and the assembler is reliable, the ack flag is set and the
+    8 byte acknowledgement follows the header:
+
+    16-bit cumulative ACK | 32-bit SACK bitmap | 16-bit receive credit
+
+    Version 2 headers have the ext flag set and 4 more bytes, and their
+    acks a 32-bit cumulative ACK:
+
+    low 16 bits of seq num | low 8 bits of session ID | 8-bit flag |
+    high 16 bits of seq num | high 16 bits of session ID
+
     returns: header string (struct) packedused in assemble function
 
     """
-    self.sequenceNumber = self.getSeqNum()
+    if self.unacked is None:
+      # the peer may not understand acks, see setReliable
+      ack = None
+    if seqNum is None:
+      seqNum = self.getSeqNum()
+    self.sequenceNumber = seqNum
     self.sessionID = self.getSessionID()
-    self.flags = self.generateFlags(**kwargs)
-
-    headerString = struct.pack('!HBB', self.sequenceNumber, self.sessionID, self.flags)
+    self.flags = self.generateFlags(ack=int(ack is not None), **kwargs)
+
+    if self.version == 1:
+      headerString = headerCodec.packHeader(self.sequenceNumber,
+                                            self.sessionID, self.flags)
+      if ack is not None:
+        headerString += headerCodec.packAck(*ack)
+    else:
+      headerString = headerCodec.packExtHeader(self.sequenceNumber,
+                                               self.sessionID, self.flags)
+      if ack is not None:
+        headerString += headerCodec.packExtAck(*ack)
 
     return headerString
 
-  def assemble(self, data, **kwargs):
+  def assemble(self, data, seqNum=None, ack=None, **kwargs):
     """Assemble frame as headers + data
 
-    Parameters: data, **kwargs
+    Parameters: data, seqNum, ack, **kwargs
     data is simply a string
-    **kwargs is dict of flags to be set in headers"""
+    seqNum is the sequence number of a frame being sent again, as
+    returned by getRetransmits. By default the frame gets the next one
+    ack is the acknowledgement to piggyback, see getHeaders
+    **kwargs is dict of flags to be set in headers
+
+    Note: if the assembler is reliable, a new frame is kept until the
+    peer acknowledges it. Otherwise ack is left out"""
 
-    headers = self.getHeaders(**kwargs)
+    headers = self.getHeaders(seqNum, ack, **kwargs)
+    if self.unacked is not None and seqNum is None:
+      self.unacked.add(self.sequenceNumber, data)
     frame = headers+data
     return frame
 
+  def assembleMany(self, segments, seqNums=None, ack=None, **kwargs):
+    """Assemble several frames to be carried by a single url or image
+
+    Parameters: segments, seqNums, ack, **kwargs
+    segments is a list of strings, each of which becomes one frame
+    seqNums is the list of sequence numbers of segments being sent
+    again, as returned by getRetransmits. By default each frame gets
+    the next one
+    ack is the acknowledgement to piggyback. It follows the header of
+    the first frame only, and is left out if the assembler is not
+    reliable
+    **kwargs is dict of flags to be set in the headers of every frame
+
+    Each frame has the packed flag set and a 2 byte payload length
+    after its header, so the Disassembler can find where the next
+    frame starts:
+
+    header | [ack] | length | data | header | length | data | ..."""
+
+    if self.unacked is None:
+      ack = None
+    kwargs['packed'] = 1
+    flags = self.generateFlags(**kwargs)
+    sessionID = self.getSessionID()
+    if self.version == 1:
+      packHeaderInto = headerCodec.packHeaderInto
+      packAckInto = headerCodec.packAckInto
+    else:
+      packHeaderInto = headerCodec.packExtHeaderInto
+      packAckInto = headerCodec.packExtAckInto
+    headerSize = headerCodec.getHeaderSize(self.version)
+    ackSize = headerCodec.getAckSize(self.version)
+    overhead = headerSize + PACKED_LENGTH_SIZE
+    size = 0
+    if ack is not None:
+      size += ackSize
+    for segment in segments:
+      if len(segment) > MAX_PACKED_SIZE:
+        raise FramingException("Segment of {} bytes is too long to pack"
+                               .format(len(segment)))
+      size += overhead + len(segment)
+    # write every header, length and segment into one buffer
+    frames = bytearray(size)
+    offset = 0
+    for index, segment in enumerate(segments):
+      if seqNums is None:
+        seqNum = self.getSeqNum()
+        if self.unacked is not None:
+          self.unacked.add(seqNum, segment)
+      else:
+        seqNum = seqNums[index]
+      if ack is not None and index == 0:
+        packHeaderInto(frames, offset, seqNum, sessionID, flags | ACK_FLAG)
+        # the ack goes between the header and the length, so the
+        # frame's fields are moved on by the size of the ack
+        packAckInto(frames, offset + headerSize, *ack)
+        offset += ackSize
+      else:
+        packHeaderInto(frames, offset, seqNum, sessionID, flags)
+      headerCodec.packLengthInto(frames, offset + headerSize, len(segment))
+      offset += overhead
+      frames[offset:offset + len(segment)] = segment
+      offset += len(segment)
+    return str(frames)
+
+  def recvAck(self, ack):
+    """
+    Forget the frames the peer has acknowledged
+
+    Parameters: ack- a (cumAck, bitmap, credit) tuple as returned by
+    Disassembler.getPeerAck, or None if the peer sent no ack
+
+    Note: a peer that sends an ack understands them, so the assembler
+    becomes reliable if it was not yet, see setReliable
+
+    """
+    if ack is None:
+      return
+    self.setReliable()
+    self.unacked.ack(*ack)
+
+  def getRetransmits(self, limit=None):
+    """Return up to limit (seqNum, data) tuples of frames that have to
+    be sent again, see retransmit.RetransmitQueue.getRetransmits"""
+    if self.unacked is None:
+      return []
+    return self.unacked.getRetransmits(limit)
+
+  def getSendAllowance(self):
+    """Return how many more bytes of new frames the peer has room for,
+    see retransmit.RetransmitQueue.getAllowance, or None if the
+    assembler is not reliable and so does not know"""
+    if self.unacked is None:
+      return None
+    return self.unacked.getAllowance()
+
+  def getRetransmitTimeout(self):
+    """Return the seconds until a frame has to be sent again, or None
+    if no frame is waiting for an ack"""
+    if self.unacked is None:
+      return None
+    return self.unacked.getTimeout()
+
 
 class Disassembler:
   """Class to Disassemble a decoded packet into headers+data before sending to buffers"""
-  def __init__(self, callback):
+  def __init__(self, callback, **kwargs):
+    """Parameters: callback- function to pass reordered data up to
+    kwargs- passed on to the Buffer, e.g. minSeqNum to fix the first
+    sequence number expected instead of taking it from the first frame"""
     self.callback = callback
+    # acknowledgement carried by the last frame(s) disassembled
+    self.peerAck = None
+    self.flags = 0
     # allocate a buffer to receive data
-    self.buffer = Buffer()
+    self.buffer = Buffer(**kwargs)
     self.buffer.addCallback(self.callback)
 
   def disassemble(self, frame):
@@ -173,24 +524,64 @@ class Disassembler:
     should be called from main() after urlEncode.decode(). raw data,
     seqNum are then sent to Buffer.recvData() to flush it.
 
-    we assume data is simply a string
-    """
+    If the packed flag is set, the header is followed by the length of
+    the data and another frame may follow it, as put together by
+    Assembler.assembleMany. Every frame is passed to the buffer in one
+    pass over the string
 
-    # split to headers + data
-    headers = frame[:4]
-    self.retrieveHeaders(headers)
+    frame can be a string or any buffer-protocol object, e.g. the
+    memoryview returned by imageEncode.decode(..., asView=True). The
+    data of each frame goes to the buffer as a memoryview slice of it,
+    so no payload bytes are copied here
 
-    data = frame[4:]
+    If the ack flag is set, the acknowledgement after the header is kept
+    for getPeerAck
 
-    # receive, reorder and flush at buffer
-#    print "In disassemble: {} {}".format(data, self.buffer.buffer)
-    self.buffer.recvData(data, self.seqNum)
-    return data
+    Frames with version 1 and version 2 headers are both understood,
+    the ext flag telling them apart
 
-  def retrieveHeaders(self, headers):
-    """Extract 4 byte header to seqNum, sessionID, Flags"""
+    Returns: the number of data bytes in the frame(s)
+    """
 
-    seqNum, sessionID, flags = parseHeaders(headers)
+    if not isinstance(frame, memoryview):
+      frame = memoryview(frame)
+    received = 0
+    offset = 0
+    self.peerAck = None
+    while True:
+      # split to headers + data
+      offset += self.retrieveHeaders(frame, offset)
+      if self.flags & ACK_FLAG:
+        if self.flags & EXT_FLAG:
+          self.peerAck = headerCodec.unpackExtAck(frame, offset)
+          offset += EXT_ACK_SIZE
+        else:
+          self.peerAck = headerCodec.unpackAck(frame, offset)
+          offset += ACK_SIZE
+      if self.flags & PACKED_FLAG:
+        length = headerCodec.unpackLength(frame, offset)
+        offset += PACKED_LENGTH_SIZE
+        data = frame[offset:offset + length]
+        offset += length
+      else:
+        data = frame[offset:]
+        offset = len(frame)
+
+      # receive, reorder and flush at buffer
+#      print "In disassemble: {} {}".format(data, self.buffer.buffer)
+      self.buffer.recvData(data, self.seqNum)
+      received += len(data)
+      if offset >= len(frame):
+        break
+    return received
+
+  def retrieveHeaders(self, headers, offset=0):
+    """Extract the header at offset in headers to seqNum, sessionID,
+    Flags and return its size, 4 bytes for version 1 and 8 for version
+    2 headers"""
+
+    seqNum, sessionID, flags, size = headerCodec.unpackAnyHeader(headers,
+                                                                 offset)
 
     self.seqNum = seqNum
 
@@ -204,8 +595,58 @@ class Disassembler:
     #if self.flags & (1<<7):
     self.setSessionID(sessionID)
 
-    # TODO: if flags = '1000' i.e. more_data, then send pull_request to
-    # server for more data
+    # if flags = '1000' i.e. more_data, the sender has more data
+    # queued, see hasMoreData
+    return size
+
+  def getHeaderVersion(self):
+    """Return the header version of the last frame, 2 if it had the ext
+    flag set and 1 otherwise"""
+    if self.flags & EXT_FLAG:
+      return 2
+    return 1
+
+  def setVersion(self, version):
+    """
+    Expect the sequence numbers of the given header version, see
+    Assembler.setVersion
+
+    Note: frames of either version are always understood, but the
+    reorder buffer has to know where the sender's sequence numbers wrap
+
+    """
+    if version not in headerCodec.HEADER_VERSIONS:
+      raise FramingException("Unknown header version {}".format(version))
+    self.buffer.setMaxSeqNum(headerCodec.getMaxSeqNum(version))
+
+  def hasMoreData(self):
+    """Return True if the last frame had the more_data flag set"""
+    return bool(self.flags & MORE_DATA_FLAG)
+
+  def wantsLongPoll(self):
+    """Return True if the last frame had the long_poll flag set"""
+    return bool(self.flags & LONG_POLL_FLAG)
+
+  def hasBackpressure(self):
+    """Return True if the last frame had the backpressure flag set,
+    i.e. the sender's reorder buffer is filling up"""
+    return bool(self.flags & BACKPRESSURE_FLAG)
+
+  def isCongested(self):
+    """Return True if this side's reorder buffer is full enough that
+    the sender should hold back"""
+    return self.buffer.isCongested()
+
+  def getAck(self):
+    """Return the (cumAck, bitmap, credit) acknowledgement of the frames
+    received so far, to be sent back to the peer, or None before the first one.
+    See buffers.Buffer.getAck"""
+    return self.buffer.getAck()
+
+  def getPeerAck(self):
+    """Return the (cumAck, bitmap, credit) acknowledgement carried by the last
+    frame(s) disassembled, or None if there was none"""
+    return self.peerAck
 
   def getSessionID(self):
     """Return session ID to upper abstraction"""
@@ -219,12 +660,11 @@ class Disassembler:
   #  self.buffer.flush()
 
 def parseHeaders(headers):
-  """ Parse the headers and return the values"""
-  headerTuple = struct.unpack('!HBB', headers)
-  seqNum = headerTuple[0]
-  sessionID = headerTuple[1]
-  flags = headerTuple[2]
-  return seqNum, sessionID, flags
+  """ Parse the headers at the start of a string or buffer and return
+  the values
+
+  Note: the header may be either version, see Assembler.setVersion"""
+  return headerCodec.unpackAnyHeader(headers)[:3]
 
 def initServerConnection(frame, passwords, callback):
   """
@@ -235,14 +675,22 @@ def initServerConnection(frame, passwords, callback):
   2. initialize the sessionID for this client
   3. return an assembler and disassembler for this client
 
+  The client asks for version 2 headers by setting the SYN flag on its
+  connect request. Such a client gets a session ID from the extended
+  range, and the frames sent back have version 2 headers, which tells
+  the client the bridge understood. Older clients leave the flag unset
+  and keep version 1 headers. Their frames are a header followed by the
+  data, with no acks and no retransmission, as they have always been.
+
   Note: this is a module method, it is not associated with an object
 
+  Note: raises a FramingException if every session ID is taken
+
   """
 
   # parse the headers
-  headers = frame[:4]
-  seqNum, sessionID, flags = parseHeaders(headers)
-  data = frame[4:]
+  seqNum, sessionID, flags, size = headerCodec.unpackAnyHeader(frame)
+  data = frame[size:]
 
   # Part 1: validate the password
   # if this is a bad login attempt, then return False
@@ -251,13 +699,26 @@ def initServerConnection(frame, passwords, callback):
     return False, False
 
   # Part 2: initialize the session id using the SessionID class methods
-  sessionID = SessionID.getSessionIDAndIncrement()
-
-  # Part 3: return an assembler and disassembler for the client
-  sender = Assembler()
-#  print "seqNum: {}".format(sender.seqNum._seqNum)
+  if flags & SYN_FLAG:
+    version = 2
+    sessionID = SessionID.getExtSessionIDAndIncrement()
+  else:
+    version = 1
+    sessionID = SessionID.getSessionIDAndIncrement()
+
+  # Part 3: return an assembler and disassembler for the client. Acks
+  # and retransmission are only used with clients that asked for
+  # version 2, older ones get frames in the format they know
+  sender = Assembler(reliable=(version == 2), version=version)
   sender.setSessionID(sessionID)
-  receiver = Disassembler(callback)
+  # the client may have several frames in flight as soon as the
+  # session is up, so the buffer must not take its window from
+  # whichever frame happens to arrive first. The client switches to
+  # version 2 only after the bridge has answered, so it numbers its
+  # first frames like any client
+  maxSeqNum = headerCodec.getMaxSeqNum(version)
+  receiver = Disassembler(callback, minSeqNum=(seqNum + 1) % MAX_SEQ_NUM,
+                          maxSeqNum=maxSeqNum)
   receiver.setSessionID(sessionID)
 
   return sender, receiver
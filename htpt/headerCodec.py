@@ -0,0 +1,210 @@
+# Georgia Tech
+# Spring 2014
+# headerCodec.py: pack and unpack frame headers
+
+import struct
+from itertools import chain
+
+from constants import *
+
+# 16-bit sequence num | 8-bit session ID | 8-bit flags
+HEADER = struct.Struct('!HBB')
+# payload length after the header of a packed frame
+LENGTH = struct.Struct('!H')
+# 16-bit cumulative ACK | 32-bit SACK bitmap | 16-bit receive credit,
+# after the header when the ack flag is set
+ACK = struct.Struct('!HIH')
+# version 2 header: the 4 byte header with the ext flag set, followed by
+# the high 16 bits of the sequence number | high 16 bits of session ID
+EXT_HEADER = struct.Struct('!HBBHH')
+EXTENSION = struct.Struct('!HH')
+# 32-bit cumulative ACK | 32-bit SACK bitmap | 16-bit receive credit,
+# after a version 2 header
+EXT_ACK = struct.Struct('!IIH')
+
+# the header versions frame.Assembler can write
+HEADER_VERSIONS = [1, 2]
+
+# batches of up to this many headers are packed with a single Struct
+MAX_BATCH_STRUCT = 1024
+# the struct format of one header of each version, for batches
+BATCH_FORMATS = {1: 'HBB', 2: 'HBBHH'}
+
+# flag bits, in the order the keyword arguments of
+# frame.Assembler.generateFlags are checked
+FLAG_BITS = [('more_data', MORE_DATA_FLAG), ('SYN', SYN_FLAG),
+             ('long_poll', LONG_POLL_FLAG), ('packed', PACKED_FLAG),
+             ('backpressure', BACKPRESSURE_FLAG), ('ack', ACK_FLAG),
+             ('ext', EXT_FLAG)]
+
+# Structs for batches of headers, keyed by (version, number of headers)
+batchStructs = {}
+
+
+def getBatchStruct(count, version=1):
+  """Return a Struct for count headers of the given version back to
+  back"""
+  batch = batchStructs.get((version, count))
+  if batch is None:
+    batch = struct.Struct('!' + BATCH_FORMATS[version] * count)
+    if count <= MAX_BATCH_STRUCT:
+      batchStructs[(version, count)] = batch
+  return batch
+
+def splitExtHeader(seqNum, sessionID, flags):
+  """Return the fields of a version 2 header as EXT_HEADER lays them
+  out, with the ext flag set"""
+  return (seqNum & 0xffff, sessionID & 0xff, flags | EXT_FLAG,
+          seqNum >> 16, sessionID >> 8)
+
+def makeFlags(**kwargs):
+  """
+  Return the flags byte for the given keyword arguments
+
+  Parameters: kwargs- any of 'more_data', 'SYN', 'long_poll',
+  'packed', 'backpressure', 'ack' and 'ext' with a boolean integer value (0/1)
+
+  """
+  flags = 0
+  for name, bit in FLAG_BITS:
+    if kwargs.get(name):
+      flags |= bit
+  return flags
+
+# the single header functions are the Struct's own methods, so packing
+# or parsing one header costs no extra function call:
+# packHeader(seqNum, sessionID, flags)- return the 4 byte header
+# packHeaderInto(buf, offset, seqNum, sessionID, flags)- write the
+#   header into buf (e.g. a bytearray) at offset
+# unpackHeader(data, offset=0)- return (seqNum, sessionID, flags) from
+#   the header at offset in data without copying it
+packHeader = HEADER.pack
+packHeaderInto = HEADER.pack_into
+unpackHeader = HEADER.unpack_from
+
+def packHeaders(headers, buf=None, offset=0, version=1):
+  """
+  Pack the headers of many frames back to back
+
+  Parameters:
+  headers- a list of (seqNum, sessionID, flags) tuples
+  buf- a bytearray to write into, e.g. one reused between batches. A
+  new one is allocated if this is None
+  offset- where in buf the first header goes
+  version- the header version to write. Version 2 headers get the ext
+  flag set, as packExtHeader does
+
+  Returns: buf
+
+  """
+  if buf is None:
+    buf = bytearray(offset + len(headers) * getHeaderSize(version))
+  if version != 1:
+    headers = [splitExtHeader(*header) for header in headers]
+  getBatchStruct(len(headers), version).pack_into(buf, offset,
+                                                  *chain(*headers))
+  return buf
+
+def unpackHeaders(data, count=None, offset=0, version=1):
+  """
+  Unpack headers stored back to back, as written by packHeaders
+
+  Parameters:
+  data- the string or bytearray holding the headers
+  count- the number of headers to read. By default, every header up to
+  the end of data
+  offset- where in data the first header is
+  version- the version of every header in data
+
+  Returns: a list of (seqNum, sessionID, flags) tuples. The flags of
+  version 2 headers include the ext flag, as from unpackAnyHeader
+
+  """
+  if count is None:
+    count = (len(data) - offset) / getHeaderSize(version)
+  values = getBatchStruct(count, version).unpack_from(data, offset)
+  if version == 1:
+    return zip(values[0::3], values[1::3], values[2::3])
+  return [(seqHigh << 16 | seqNum, sessionHigh << 8 | sessionID, flags)
+          for seqNum, sessionID, flags, seqHigh, sessionHigh
+          in zip(values[0::5], values[1::5], values[2::5], values[3::5],
+                 values[4::5])]
+
+def unpackFrameHeaders(frames, version=1):
+  """Return the (seqNum, sessionID, flags) header of every frame in a
+  list of frames whose headers are all of the given version"""
+  if version == 1:
+    unpack = HEADER.unpack_from
+    return [unpack(frame) for frame in frames]
+  unpack = EXT_HEADER.unpack_from
+  return [(seqHigh << 16 | seqNum, sessionHigh << 8 | sessionID, flags)
+          for seqNum, sessionID, flags, seqHigh, sessionHigh
+          in [unpack(frame) for frame in frames]]
+
+def packLengthInto(buf, offset, length):
+  """Write the payload length of a packed frame into buf at offset"""
+  LENGTH.pack_into(buf, offset, length)
+
+def unpackLength(data, offset):
+  """Return the payload length of the packed frame whose length field
+  is at offset in data"""
+  return LENGTH.unpack_from(data, offset)[0]
+
+# the acknowledgement after the header works the same way:
+# packAck(cumAck, bitmap, credit)- return the 8 byte acknowledgement
+# packAckInto(buf, offset, cumAck, bitmap, credit)- write it into buf at
+#   offset
+# unpackAck(data, offset=0)- return (cumAck, bitmap, credit)
+packAck = ACK.pack
+packAckInto = ACK.pack_into
+unpackAck = ACK.unpack_from
+
+def getHeaderSize(version):
+  """Return the size of a header of the given version"""
+  if version == 1:
+    return HEADER_SIZE
+  return EXT_HEADER_SIZE
+
+def getAckSize(version):
+  """Return the size of the acknowledgement after a header of the given
+  version"""
+  if version == 1:
+    return ACK_SIZE
+  return EXT_ACK_SIZE
+
+def getMaxSeqNum(version):
+  """Return the number of sequence numbers a header of the given version
+  can carry, i.e. where they wrap"""
+  if version == 1:
+    return MAX_SEQ_NUM
+  return MAX_EXT_SEQ_NUM
+
+def packExtHeader(seqNum, sessionID, flags):
+  """Return the 8 byte version 2 header. The ext flag is set in flags"""
+  return EXT_HEADER.pack(*splitExtHeader(seqNum, sessionID, flags))
+
+def packExtHeaderInto(buf, offset, seqNum, sessionID, flags):
+  """Write the version 2 header into buf at offset"""
+  EXT_HEADER.pack_into(buf, offset, *splitExtHeader(seqNum, sessionID, flags))
+
+def unpackAnyHeader(data, offset=0):
+  """
+  Unpack the header at offset in data, whichever version it is
+
+  Note: the first 4 bytes are laid out the same in both versions, so
+  the ext flag in them tells if the extension follows
+
+  Returns: (seqNum, sessionID, flags, size), where size is the number of
+  bytes the header takes up
+
+  """
+  seqNum, sessionID, flags = HEADER.unpack_from(data, offset)
+  if flags & EXT_FLAG:
+    seqHigh, sessionHigh = EXTENSION.unpack_from(data, offset + HEADER_SIZE)
+    return (seqHigh << 16 | seqNum, sessionHigh << 8 | sessionID, flags,
+            EXT_HEADER_SIZE)
+  return seqNum, sessionID, flags, HEADER_SIZE
+
+packExtAck = EXT_ACK.pack
+packExtAckInto = EXT_ACK.pack_into
+unpackExtAck = EXT_ACK.unpack_from
@@ -10,16 +10,26 @@ import select
 import socket
 import socks
 import sys
-import urllib2
+import threading
+import time
+from Queue import Queue
 
 #flask stuff
 from flask import Flask, request, make_response
 app = Flask(__name__)
 
 # local imports
+import congestion
+import connection
+import encoders
 import frame
 import urlEncode
 import imageEncode
+import scheduler
+import segmenter
+import session
+import torWriter
+import wsgiServer
 from socks4a.htptProxy import ThreadingSocks4Proxy, ReceiveSocksReq, ForwardSocksReq
 
 #from htpt import frame
@@ -31,7 +41,19 @@ CLIENT_SOCKS_PORT=8000 # communication b/w Tor and SOCKS server
 SERVER_SOCKS_PORT=9150 # communication b/w Tor and SOCKS client
 HTPT_CLIENT_SOCKS_PORT=8002   # communication b/w htpt and SOCKS
 #HTPT_SERVER_SOCKS_PORT=8003   # communication b/w htpt and SOCKS
-TIMEOUT = 0.5 #max number of seconds between calls to read from the server
+WINDOW_SIZE = 4 #requests outstanding to the bridge when a session starts
+MAX_WINDOW_SIZE = 16 #max number of requests outstanding to the bridge
+ENCODING_TYPE = 'market' #urlEncode type used for upstream data
+UPSTREAM_TYPES = ['market', 'b64'] #urlEncode types the bridge decodes
+TOR_READ_SIZE = 1024*1000 #max bytes read from Tor at once
+IMAGE_TYPES = ['bmp', 'png'] #imageEncode types the bridge picks from
+DECODE_QUEUE_SIZE = 8 #max number of responses waiting to be decoded
+LONG_POLL = False #ask the bridge to hold empty polls until it has data
+LONG_POLL_TIMEOUT = 10 #max seconds the bridge holds an empty poll open
+BACKLOG_SIZE = 64 #max segments held back while the request window is full
+BACKLOG_RETRY = 0.01 #seconds between checks for room in the window
+MAX_LOST_REQUESTS = 16 #failed requests in a row before giving up on the bridge
+STATS_INTERVAL = 60 #seconds between logs of every session's buffers, 0 for none
 
 #Constants just to make this work-> remove
 #TODO
@@ -42,72 +64,355 @@ PASSWORDS = [TOR_BRIDGE_PASSWORD]
 # Note: I wrote this hastily, so the function names within our modules
 # are likely different
 
+# state of every client connected to the bridge, keyed by session ID
+sessions = session.SessionTable()
+# image type clients with version 2 headers are answered with, see
+# chooseImageType
+servedImageType = None
+
 class HTPT():
   def __init__(self):
-    self.addressList = []
     self.disassembler = frame.Disassembler(callback)
+    self.recvLock = threading.Lock()
+    # set when the bridge's reorder buffer asks us to hold back
+    self.peerCongested = False
+    # urlEncode type of upstream data, see chooseEncoding
+    self.encodingType = ENCODING_TYPE
 
   def run_client(self):
     # initialize the connection
     while 1:
+      # frames to the bridge are kept until it acknowledges them once
+      # it has agreed on version 2 headers, see bridgeConnect
       self.assembler = frame.Assembler()
-      # bind to a local address and wait for Tor to connect
-      self.torBinder = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-      self.torBinder.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-      self.torBinder.bind(('localhost', HTPT_CLIENT_SOCKS_PORT))
-      self.torBinder.listen(1)
-      (self.torSock, address) = self.torBinder.accept()
+      self.acceptTor()
 
       #now that we have a Tor connection, start sending data to server
       self.bridgeConnect(TOR_BRIDGE_ADDRESS, TOR_BRIDGE_PASSWORD)
-      self.timeout = datetime.now()
+      # lost requests are repaired by retransmission, and the number of
+      # requests in flight adapts to the losses
+      self.congestion = congestion.CongestionWindow(WINDOW_SIZE,
+                                                    maximum=MAX_WINDOW_SIZE)
+      self.window = connection.RequestWindow(self.pool, self.recvImage,
+                                             MAX_WINDOW_SIZE, MAX_LOST_REQUESTS,
+                                             self.congestion)
+      self.readTor()
+      self.window.close()
+      self.writer.close()
+      self.torSock.close()
+      self.pool.close()
 
-      while 1:
-        # wait for data to send from Tor. Wait at most
-        readyToRead, readyToWrite, inError = \
-           select.select([self.torSock], [], [], TIMEOUT)
-        if readyToRead != []:
-          dataToSend = readyToRead[0].recv(1024*1000)
-          #        print "Client Sending: {}".format(dataToSend)
-          # if there is less than 35 bytes of data to send, then make
-          # sure that we still send it
-          while dataToSend != '':
-            segment = dataToSend[:35]
-            dataToSend = dataToSend[35:]
-            # put the headers on the data (not the actual function name)
-            framed = self.assembler.assemble(segment)
-            # encode the data
-            encoded = urlEncode.encode(framed, 'market')
-            # send the data with headless web kit
-            request = urllib2.Request(encoded['url'])
-            for cookie in encoded['cookie']:
-              request.add_header('Cookie:', cookie)
-            reader = urllib2.urlopen(request)
-            readData = reader.read()
-            # if we have received data from the Internet, then send it up to Tor
-            decoded = imageEncode.decode(readData, 'png')
-            self.disassembler.disassemble(decoded)
-            self.timeout = datetime.now()
-        else:
-          dataToSend = ''
-          # put the headers on the data (not the actual function name)
-          framed = self.assembler.assemble(dataToSend)
-          # encode the data
-          encoded = urlEncode.encode(framed, 'market')
-          # send the data with headless web kit
-          request = urllib2.Request(encoded['url'])
-          reader = urllib2.urlopen(request)
-          readData = reader.read()
-          # if we have received data from the Internet, then send it up to Tor
-          decoded = imageEncode.decode(readData, 'png')
-          self.disassembler.disassemble(decoded)
-
-        # if we go have not received or send data for 10 min, end the program
-        if (datetime.now() - self.timeout).total_seconds() > 30:
-        # close the local socket to tor
-          self.torSock.send("closing")
-          self.torSock.close()
-          break
+  def run_concurrent_client(self):
+    """
+    Run the client as concurrent stages instead of a single loop
+
+    Reading from Tor, the requests to the bridge and decoding the
+    responses each run on their own threads, connected by queues:
+
+    Tor -> readTor (segment, frame, encode) -> window (HTTP requests)
+        -> decodeResponses (decode, disassemble) -> Tor
+
+    A slow bridge response does not hold up reading from Tor, and a
+    slow image decode does not tie up a connection to the bridge.
+
+    Note: this is selected with -client 2. -client 1 still runs
+    run_client, where the window's threads decode their own responses
+
+    """
+    while 1:
+      # frames to the bridge are kept until it acknowledges them once
+      # it has agreed on version 2 headers, see bridgeConnect
+      self.assembler = frame.Assembler()
+      self.acceptTor()
+
+      #now that we have a Tor connection, start sending data to server
+      self.bridgeConnect(TOR_BRIDGE_ADDRESS, TOR_BRIDGE_PASSWORD)
+      # responses wait here to be decoded. Once it is full, the window
+      # stops sending requests until the decoder catches up
+      self.responses = Queue(DECODE_QUEUE_SIZE)
+      self.congestion = congestion.CongestionWindow(WINDOW_SIZE,
+                                                    maximum=MAX_WINDOW_SIZE)
+      self.window = connection.RequestWindow(self.pool, self.responses.put,
+                                             MAX_WINDOW_SIZE, MAX_LOST_REQUESTS,
+                                             self.congestion)
+      decoder = threading.Thread(target=self.decodeResponses)
+      decoder.daemon = True
+      decoder.start()
+      self.readTor()
+      # let the outstanding requests finish before stopping the decoder
+      self.window.close()
+      self.responses.put(None)
+      decoder.join()
+      self.writer.close()
+      self.torSock.close()
+      self.pool.close()
+
+  def acceptTor(self):
+    """Bind to a local address and wait for Tor to connect"""
+    self.torBinder = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.torBinder.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    self.torBinder.bind(('localhost', HTPT_CLIENT_SOCKS_PORT))
+    self.torBinder.listen(1)
+    (self.torSock, address) = self.torBinder.accept()
+    # data from the bridge is written to Tor in the background
+    self.writer = torWriter.TorWriter(self.torSock)
+
+  def readTor(self):
+    """
+    Send data from Tor to the bridge until the session goes idle
+
+    Note: frames are handed to the request window, so this only blocks
+    on the bridge when the window is full.
+    Responses are handled by whatever callback the window was given.
+    While the window is full, data from Tor waits in self.backlog and
+    segments that are small enough go out together in one request
+
+    Note: with a bridge that agreed on version 2 headers, every frame
+    carries an ack for the frames received from the bridge. Frames the
+    bridge has not acked are sent again by sendRetransmits
+
+    """
+    self.scheduler = scheduler.PollScheduler()
+    self.encodingType = chooseEncoding(self.assembler.getVersion())
+    self.segmenter = segmenter.Segmenter(self.encodingType,
+                                         version=self.assembler.getVersion())
+    self.timeout = datetime.now()
+    self.longPollOpen = False
+    self.backlog = []
+    self.peerCongested = False
+
+    while 1:
+      # wait for data to send from Tor. Wait at most as long as the
+      # poll scheduler allows before asking the bridge for data, or
+      # check back soon for room in the window if data is waiting
+      timeout = self.scheduler.getTimeout()
+      if self.backlog != []:
+        timeout = min(timeout, BACKLOG_RETRY)
+      retransmitTimeout = self.assembler.getRetransmitTimeout()
+      if retransmitTimeout is not None:
+        timeout = min(timeout, retransmitTimeout)
+      # once the backlog is full, leave Tor's data in its socket until
+      # the bridge has room for more
+      readFrom = [self.torSock]
+      if len(self.backlog) > BACKLOG_SIZE:
+        readFrom = []
+      readyToRead, readyToWrite, inError = \
+         select.select(readFrom, [], [], timeout)
+      if readyToRead != []:
+        dataToSend = readyToRead[0].recv(TOR_READ_SIZE)
+        #        print "Client Sending: {}".format(dataToSend)
+        self.scheduler.dataSent()
+        # cut the data into as many bytes as one request can carry
+        self.backlog.extend(self.segmenter.segment(dataToSend))
+        self.sendBacklog()
+        self.timeout = datetime.now()
+      elif self.backlog != []:
+        self.sendBacklog()
+      elif LONG_POLL:
+        # keep exactly one hanging poll open at the bridge. The next one
+        # goes out as soon as it is answered, so there is no backoff
+        if not self.longPollOpen:
+          self.longPollOpen = True
+          framed = self.assembler.assemble('', long_poll=1,
+                                           backpressure=self.backpressure(),
+                                           ack=self.getAck())
+          self.sendFrame(framed, self.recvLongPoll)
+      else:
+        dataToSend = ''
+        # put the headers on the data (not the actual function name)
+        framed = self.assembler.assemble(dataToSend,
+                                         backpressure=self.backpressure(),
+                                         ack=self.getAck())
+        self.sendFrame(framed)
+        self.scheduler.idlePoll()
+      self.sendRetransmits()
+
+      # if we go have not received or send data for 10 min, end the program
+      if (datetime.now() - self.timeout).total_seconds() > 30:
+      # close the local socket to tor
+        self.writer.write("closing")
+        return
+
+  def sendBacklog(self):
+    """
+    Send the segments in self.backlog while there is room in the window
+
+    Note: as many segments as fit in one request are packed together,
+    if the bridge agreed on version 2 headers.
+    Once more than BACKLOG_SIZE segments are waiting, this blocks on the
+    window instead of letting the backlog grow
+
+    Note: while the bridge asks for backpressure, only one request with
+    data is let out at a time, so its reorder buffer can drain
+
+    Note: no more data is sent than the receive credit in the bridge's
+    last ack allows. If the credit is used up and no request is in
+    flight to bring a new ack, an empty poll is sent for one
+
+    """
+    while self.backlog != []:
+      if self.peerCongested:
+        full = self.window.outstanding > 0
+      else:
+        full = self.window.isFull()
+      if full and len(self.backlog) <= BACKLOG_SIZE:
+        return
+      count = self.countPacked(self.backlog)
+      size = sum([len(segment) for segment in self.backlog[:count]])
+      allowance = self.assembler.getSendAllowance()
+      if allowance is not None and allowance < size:
+        if self.window.outstanding == 0:
+          framed = self.assembler.assemble('', backpressure=self.backpressure(),
+                                           ack=self.getAck())
+          self.sendFrame(framed)
+        return
+      if count == 1:
+        # put the headers on the data (not the actual function name)
+        framed = self.assembler.assemble(self.backlog[0],
+                                         backpressure=self.backpressure(),
+                                         ack=self.getAck())
+      else:
+        framed = self.assembler.assembleMany(self.backlog[:count],
+                                             backpressure=self.backpressure(),
+                                             ack=self.getAck())
+      del self.backlog[:count]
+      self.sendFrame(framed)
+
+  def sendRetransmits(self):
+    """
+    Send again the frames the bridge has not acknowledged in time
+
+    Note: frames are kept by self.assembler until the bridge acks them.
+    They are sent with the sequence numbers they had, packed together
+    as far as they fit in one request
+
+    Note: only lost frames with data count as a loss for the congestion
+    window. Empty polls are sent again to fill the bridge's reorder
+    buffer, but are not timed, see retransmit.RetransmitQueue
+
+    """
+    frames = self.assembler.getRetransmits()
+    if [data for seqNum, data in frames if len(data) > 0] != []:
+      # the frames were lost, most likely to congestion
+      self.congestion.onLoss()
+    while frames != []:
+      segments = [data for seqNum, data in frames]
+      count = self.countPacked(segments)
+      if count == 1:
+        seqNum, data = frames[0]
+        framed = self.assembler.assemble(data, seqNum=seqNum,
+                                         backpressure=self.backpressure(),
+                                         ack=self.getAck())
+      else:
+        seqNums = [seqNum for seqNum, data in frames[:count]]
+        framed = self.assembler.assembleMany(segments[:count], seqNums,
+                                             backpressure=self.backpressure(),
+                                             ack=self.getAck())
+      del frames[:count]
+      self.sendFrame(framed)
+
+  def countPacked(self, segments):
+    """
+    Return how many of the segments go out together in the next request
+
+    Note: only bridges that agreed on version 2 headers unpack frames,
+    older ones get one frame per request, see segmenter.countPacked
+
+    """
+    if self.assembler.getVersion() != 2:
+      return 1
+    return self.segmenter.countPacked(segments)
+
+  def getAck(self):
+    """Return the acknowledgement of the frames received from the
+    bridge, to be piggybacked on the next frame"""
+    self.recvLock.acquire()
+    try:
+      return self.disassembler.getAck()
+    finally:
+      self.recvLock.release()
+
+  def backpressure(self):
+    """Return 1 if the reorder buffer for data from the bridge is
+    filling up, to be set as the backpressure flag of outgoing frames"""
+    return int(self.disassembler.isCongested())
+
+  def sendFrame(self, framed, callback=None):
+    """
+    Send a frame to the bridge without waiting for the response
+
+    Parameters:
+    framed- a frame as returned by Assembler.assemble
+    callback- function to handle the response instead of the window's
+
+    Note: the request goes over one of the persistent connections in
+    self.pool and the window decides how many requests are in flight.
+    This only blocks when the window is full. The response is handled
+    by recvImage
+
+    """
+    # encode the data
+    encoded = urlEncode.encode(framed, self.encodingType)
+    # send the data over a keep-alive connection to the bridge
+    self.window.send(encoded, callback)
+
+  def recvLongPoll(self, readData):
+    """Callback for the answer to a long poll: handle the response as
+    usual and let readTor open the next long poll"""
+    self.longPollOpen = False
+    self.window.callback(readData)
+
+  def recvImage(self, readData):
+    """
+    Callback for the request window: decode a response from the bridge
+    and pass the frame in it to the disassembler
+
+    Note: this is called from the window's worker threads, so the
+    disassembler is guarded by a lock. Frames may be passed in out of
+    order and are reordered by the disassembler's buffer
+
+    """
+    # if we have received data from the Internet, then send it up to Tor
+    # the frame is a view on the decoded image, so its data is only
+    # copied when it is written to Tor
+    decoded = decodeImage(readData, asView=True)
+    self.recvLock.acquire()
+    try:
+      received = self.disassembler.disassemble(decoded)
+      ack = self.disassembler.getPeerAck()
+      moreData = self.disassembler.hasMoreData()
+      self.peerCongested = self.disassembler.hasBackpressure()
+      congested = self.disassembler.isCongested()
+    finally:
+      self.recvLock.release()
+    # forget the frames the bridge has received
+    self.assembler.recvAck(ack)
+    # let the bridge's response drive how soon we poll again. If our
+    # reorder buffer is filling up, back off instead so fewer responses
+    # pile up behind the missing frame
+    if congested:
+      self.scheduler.idlePoll()
+    elif moreData:
+      self.scheduler.moreData()
+    elif received > 0:
+      self.scheduler.dataReceived()
+
+  def decodeResponses(self):
+    """
+    Decode stage of run_concurrent_client: decode the responses queued
+    by the request window until None is queued
+
+    Note: a response that cannot be decoded is dropped like a lost
+    request, and the frames in it are sent again by the bridge
+    """
+    while True:
+      readData = self.responses.get()
+      if readData is None:
+        return
+      try:
+        self.recvImage(readData)
+      except Exception as e:
+        print "Dropping a response that could not be decoded: {}".format(e)
 
   def bridgeConnect(self, address, password):
     """
@@ -125,97 +430,304 @@ class HTPT():
     password. After sending the GET request, the function will use the
     returned image (just padding) to initialize the session ID
 
+    Note: the connect request has the SYN flag set to ask for version 2
+    headers (see frame.initServerConnection). If the bridge answers
+    with a version 2 header, both sides use them from then on, along
+    with acks, retransmission, receive credit and packed frames. Older
+    bridges ignore the flag and the session keeps version 1 headers and
+    the original frame format, a header followed by the data
+
     Returns: whatever state you need to keep using headless web kit
     """
 
-    data = self.assembler.assemble(password)
+    # keep-alive connections reused for every frame in this session
+    self.pool = connection.ConnectionPool(address, MAX_WINDOW_SIZE)
+    self.disassembler = frame.Disassembler(callback)
+    data = self.assembler.assemble(password, SYN=1)
     encodedData = urlEncode.encodeAsMarket(data)
-    request = urllib2.Request(encodedData['url'])
-    for cookie in encodedData['cookie']:
-      request.add_header('Cookie:', cookie)
-    reader = urllib2.urlopen(request)
-    image = reader.read()
+    image = self.pool.request(encodedData)
     # use the returned image to initialize the session ID
-    decodedData = imageEncode.decode(image, 'png')
+    decodedData = decodeImage(image)
     self.disassembler.disassemble(decodedData)
+    version = self.disassembler.getHeaderVersion()
+    self.assembler.setVersion(version)
+    self.disassembler.setVersion(version)
     self.assembler.setSessionID(self.disassembler.getSessionID())
+    # only a bridge that knows version 2 headers understands acks
+    if version == 2:
+      self.assembler.setReliable()
+    self.assembler.recvAck(self.disassembler.getPeerAck())
 
   def recvData(self, data):
     """
     Callback function for the dissassemblers
     
     Parameters:
-    data- the string of received data to be passed up to Tor
+    data- the received data to be passed up to Tor, a string or a
+    buffer such as a memoryview
     
     Notes: this functions is used by both the client and server to
     pass data up to Tor
 
+    Note: the data is only queued for self.writer, so decoding the next
+    response does not wait for Tor to read this one
+
     Returns: nothing
 
     """
 #    print "htpt: {}".format(data)
-    self.torSock.send(data)
+    self.writer.write(data)
     return
 
-@app.route('/')
-def processRequest():
+@app.route('/', defaults={'path': ''})
+@app.route('/<path:path>')
+def processRequest(path=''):
   """Process incoming requests from Apache
   
   Structure: this function determines whether data should go through
   to htpt decoding or if it should be passed to the image
   gallery. This is a function due to constraints from flask
 
+  Note: the session of a request is looked up by the session ID in its
+  frame header, so each client gets its own assembler, disassembler
+  and connection to Tor
+
+  Note: b64 urls hide data in the path as well as the query string, so
+  every path is routed here. The path is read from request.url
+
   """
-  # if we are not in the address list, then this is not an initialized connection
-  if request.remote_addr not in addressList:
-      # if the address is not in the list and it is not a market
-      # request, then it is web gallery traffic
-      if not urlEncode.isMarket(request.url):
-        sendToImageGallery(request)
-        return
-      # if this is a market request, then proceed with new session initialization
-      else:
-        encoded = {'url':request.url, 'cookie':[]}
-        decoded = urlEncode.decode(encoded)
-        sender, receiver = frame.initServerConnection(decoded, PASSWORDS, callback)
-        # if the client sent a bad password, print an error message
-        # and return an empty image
-        if sender == False:
-          print "Bad password entered"
-          return sendToImageGallery(request)
-        # Note: this will need to change to accomodate multiple client sessions
-        htptObject.assembler = sender
-        htptObject.disassembler = receiver
-        addressList.append(request.remote_addr)
-        #send back a blank image with the new session id
-        framed = htptObject.assembler.assemble('')
-        image = imageEncode.encode(framed, 'png')
-        return serveImage(image)
-          #TODO
-          #setup some way to maintain a single Internet connection per client
+  # if this is not a market or b64 request, then it is web gallery
+  # traffic. The url is only matched once, the decoder reuses what was
+  # found
+  carrier = urlEncode.classify(request.url)
+  if carrier[0] not in UPSTREAM_TYPES:
+    return sendToImageGallery(request)
+  encoded = {'url':request.url, 'cookie':getCookies(request)}
+  decoded = urlEncode.decode(encoded, carrier)
+  seqNum, sessionID, flags = frame.parseHeaders(decoded)
+  clientSession = sessions.get(sessionID)
+  # if there is no session with this ID, then this is a new client
+  if clientSession is None:
+    return initSession(decoded)
   # if this is an initialized client, then receive the data and see
   # if we have anything to send
-  else:
+  return serveSession(clientSession, decoded)
+
+def logSessionStats(interval=STATS_INTERVAL):
+  """
+  Print the reorder buffer and retransmission counters of every
+  session every interval seconds, see session.SessionTable.getStats
+
+  Note: this runs forever, so it should be started on a daemon thread.
+  The stats are logged rather than served, since a status page would
+  set the bridge apart from the image gallery it poses as
+
+  """
+  while True:
+    time.sleep(interval)
+    for sessionID, stats in sorted(sessions.getStats().items()):
+      print ("Session {}: {} bytes buffered (peak {}), {} frames dropped, "
+             "{} duplicates, {} unacked, {} retransmits").format(
+        sessionID, stats['bufferedBytes'], stats['peakBufferedBytes'],
+        stats['droppedFrames'], stats['duplicateFrames'],
+        stats.get('unackedFrames', 0), stats.get('retransmits', 0))
+
+def startStatsLog(interval=STATS_INTERVAL):
+  """Start logging session stats in the background, unless interval is
+  0"""
+  if interval <= 0:
+    return
+  logger = threading.Thread(target=logSessionStats, args=(interval,))
+  logger.daemon = True
+  logger.start()
+
+def initSession(decoded):
+  """
+  Set up a session for a new client from its connect request
+
+  Parameters: decoded- the frame decoded from the request, which should
+  hold one of the bridge's passwords
+
+  Returns: a blank image carrying the new session ID, or a gallery
+  image if the password was wrong or the bridge is full
+
+  Note: sessions of clients that have gone quiet are closed first, so
+  their slots and session IDs can be given to the new client
+
+  """
+  sessions.expire()
+  if sessions.isFull():
+    print "Too many sessions, turning away a client"
+    return sendToImageGallery(request)
+  newSession = session.Session()
+  try:
+    sender, receiver = frame.initServerConnection(decoded, PASSWORDS,
+                                                  newSession.recvData)
+  except frame.FramingException as e:
+    print e
+    return sendToImageGallery(request)
+  # if the client sent a bad password, print an error message
+  # and return an empty image
+  if sender == False:
+    print "Bad password entered"
+    return sendToImageGallery(request)
+  newSession.sessionID = sender.getSessionID()
+  newSession.assembler = sender
+  newSession.disassembler = receiver
+  # each client gets its own connection to Tor
+  try:
+    newSession.connectTor(("localhost", SERVER_SOCKS_PORT))
+  except socket.error as e:
+    print "Could not connect to Tor: {}".format(e)
+    newSession.close()
+    frame.SessionID.releaseSessionID(newSession.sessionID)
+    return sendToImageGallery(request)
+  try:
+    sessions.add(newSession)
+  except session.SessionException as e:
+    print e
+    newSession.close()
+    frame.SessionID.releaseSessionID(newSession.sessionID)
+    return sendToImageGallery(request)
+  #send back a blank image with the new session id
+  framed = newSession.assembler.assemble('', ack=receiver.getAck())
+  return serveFrame(framed, sender.getVersion())
+
+def serveSession(clientSession, decoded):
+  """
+  Pass a frame from a client up to Tor and answer with any data Tor
+  has queued for that client
+
+  Note: if the frame is an empty poll with the long_poll flag set and
+  Tor has nothing queued, the answer is held back until Tor sends
+  something or LONG_POLL_TIMEOUT runs out. The session lock is not
+  held while waiting, so the client's uploads still get through
+
+  Note: frames carry the backpressure flag when the sender's reorder
+  buffer is filling up. The bridge sends no data from Tor while the
+  client's flag is set, and sets it on its answers when the session's
+  own buffer is filling up
+
+  Note: no more data is read from Tor than the receive credit in the
+  client's last ack allows, see session.Session.getReadSize. The rest
+  waits in Tor's socket
+
+  Note: with clients that agreed on version 2 headers, frames carry
+  acks both ways. Frames the client has not acked in time are sent
+  again, one per answer and ahead of any new data from Tor. They are
+  sent even while the client asks for backpressure, since they fill
+  the gap its buffer is waiting on
+
+  """
+  clientSession.lock.acquire()
+  try:
+    clientSession.touch()
     #receive the data
-    decoded = urlEncode.decode({'url':request.url, 'cookie':request.cookies})
-    htptObject.disassembler.disassemble(decoded)
-    # see if we have any data to return
-    readyToRead, readyToWrite, inError = \
-        select.select([htptObject.torSock], [], [], 0)
-    # if we have received data from the Tor network for the Tor
-    # client, then send it
-    if readyToRead != []:
-      # get up to a megabyte
-      dataToSend = readyToRead[0].recv(1024*1000)
-#      print "Server Sending: {}".format(dataToSend)
+    received = clientSession.disassembler.disassemble(decoded)
+    clientSession.assembler.recvAck(clientSession.disassembler.getPeerAck())
+    # while the client's reorder buffer is filling up, hold back data
+    # from Tor until it catches up. Tor's data waits in the socket
+    clientCongested = clientSession.disassembler.hasBackpressure()
+    longPoll = received == 0 and clientSession.disassembler.wantsLongPoll() \
+               and not clientCongested
+    torSock = clientSession.torSock
+    # do not hold the poll past the time a frame has to be sent again
+    timeout = clientSession.assembler.getRetransmitTimeout()
+    if timeout is None:
+      timeout = LONG_POLL_TIMEOUT
+    timeout = min(timeout, LONG_POLL_TIMEOUT)
+  finally:
+    clientSession.lock.release()
+  if longPoll and timeout > 0:
+    try:
+      select.select([torSock], [], [], timeout)
+    except (select.error, socket.error):
+      # the session was closed while we were waiting
+      return sendToImageGallery(request)
+
+  clientSession.lock.acquire()
+  try:
+    if clientSession.torSock is None:
+      return sendToImageGallery(request)
+    congested = int(clientSession.disassembler.isCongested())
+    ack = clientSession.disassembler.getAck()
+    resend = clientSession.assembler.getRetransmits(1)
+    if resend != []:
+      # send a frame the client has not acked again instead of new data
+      seqNum, dataToSend = resend[0]
+      moreData = int(clientSession.assembler.getRetransmitTimeout() == 0)
+      framed = clientSession.assembler.assemble(dataToSend, seqNum=seqNum,
+                                                more_data=moreData,
+                                                backpressure=congested,
+                                                ack=ack)
     else:
-      dataToSend = ''
-    # put the headers on the data (not the actual function name)
-    framed = htptObject.assembler.assemble(dataToSend)
-    # encode the data
-    encoded = imageEncode.encode(framed, 'png')
-    # send the data with apache
-    return serveImage(encoded)
+      # see if we have any data to return, as long as the client's
+      # reorder buffer has room for it
+      readSize = clientSession.getReadSize(TOR_READ_SIZE)
+      if clientCongested or readSize <= 0:
+        readyToRead = []
+      else:
+        readyToRead, readyToWrite, inError = \
+            select.select([clientSession.torSock], [], [], 0)
+      # if we have received data from the Tor network for the Tor
+      # client, then send it
+      moreData = 0
+      if readyToRead != []:
+        # get up to a megabyte
+        dataToSend = readyToRead[0].recv(readSize)
+#        print "Server Sending: {}".format(dataToSend)
+        # if Tor closed the connection, then the session is over
+        if dataToSend == '':
+          sessions.remove(clientSession.sessionID)
+          return sendToImageGallery(request)
+        # tell the client to poll again right away if Tor has more queued
+        readyToRead, readyToWrite, inError = \
+            select.select([clientSession.torSock], [], [], 0)
+        if readyToRead != []:
+          moreData = 1
+      else:
+        dataToSend = ''
+      # put the headers on the data (not the actual function name)
+      framed = clientSession.assembler.assemble(dataToSend, more_data=moreData,
+                                                backpressure=congested, ack=ack)
+  finally:
+    clientSession.lock.release()
+  # encode the data and send it with apache
+  return serveFrame(framed, clientSession.assembler.getVersion())
+
+def getCookies(request):
+  """
+  Return the cookies of a request in the form urlEncode.decode expects
+
+  Note: the order of the cookies matters because each one holds the
+  next piece of the data, so this reads the raw header instead of
+  flask's cookie dictionary
+
+  """
+  header = request.headers.get('Cookie')
+  # werkzeug hands back unicode, but the decoders work on byte strings
+  if header is not None:
+    header = header.encode('ascii')
+  return connection.splitCookieHeader(header)
+
+def chooseEncoding(version):
+  """
+  Return the urlEncode type the client sends upstream data with
+
+  Parameters: version- the header version agreed on with the bridge
+
+  Note: bridges that answer with version 2 headers decode every type
+  in UPSTREAM_TYPES, so the one that carries a full read from Tor in
+  the fewest requests is used. Older bridges only decode ENCODING_TYPE
+
+  Note: the type is chosen once per session for TOR_READ_SIZE, not for
+  each payload, since the segmenter cuts every segment to what one
+  request of this type carries
+
+  """
+  if version != 2:
+    return ENCODING_TYPE
+  return encoders.registry.choose('url', TOR_READ_SIZE, UPSTREAM_TYPES)
 
 def sendToImageGallery(request):
   image = imageEncode.encode('', 'png')
@@ -224,12 +736,62 @@ def sendToImageGallery(request):
   response.headers['Content-Disposition'] = 'attachment; filename=img.png'
   return response
 
-def serveImage(image):
+def serveImage(image, imageType='png'):
   response = make_response(image)
-  response.headers['Content-Type'] = 'image/png'
-  response.headers['Content-Disposition'] = 'attachment; filename=img.png'
+  response.headers['Content-Type'] = imageEncode.MIME_TYPES[imageType]
+  response.headers['Content-Disposition'] = 'attachment; filename=img.' + \
+                                            imageType
   return response
 
+def serveFrame(framed, version=2):
+  """
+  Hide a frame in an image and serve it
+
+  Parameters:
+  framed- the frame to send
+  version- the header version agreed on with the client
+
+  Note: the image type is the same for every frame, see
+  chooseImageType. Clients tell the types apart by the bytes the image
+  starts with. Clients with version 1 headers only decode png images,
+  so they always get png
+
+  """
+  if version != 2:
+    return serveImage(imageEncode.encode(framed, 'png'))
+  chosen = chooseImageType()
+  image = encoders.registry.get(chosen).encode(framed)
+  return serveImage(image, chosen)
+
+def chooseImageType():
+  """
+  Return the type from IMAGE_TYPES that frames are served in
+
+  Note: one image carries a frame of any size, so the size of the frame
+  plays no part. The choice rests on the measured expansion and CPU
+  cost alone (see encoders.EncoderRegistry.choose) and is made once,
+  at start up or for the first frame served
+
+  """
+  global servedImageType
+  if servedImageType is None:
+    servedImageType = encoders.registry.choose('image', 0, IMAGE_TYPES)
+  return servedImageType
+
+def decodeImage(image, asView=False):
+  """
+  Return the frame hidden in an image from the bridge
+
+  Note: the image type is found from the bytes the image starts with,
+  so the bridge may answer with any of the IMAGE_TYPES. Bridges that
+  only send png images still work
+
+  """
+  imageType = encoders.registry.identify(image)
+  if imageType is None:
+    imageType = 'png'
+  return imageEncode.decode(image, imageType, asView=asView)
+
 def callback(data):
   if data == '':
     return
@@ -245,21 +807,27 @@ if __name__ == '__main__':
     server.serve_forever()
   elif str(sys.argv[1]) == "-client" and str(sys.argv[2]) == "1":
     htptObject.run_client()
+  elif str(sys.argv[1]) == "-client" and str(sys.argv[2]) == "2":
+    htptObject.run_concurrent_client()
   elif str(sys.argv[1]) == "-server" and str(sys.argv[2]) == "0":
     server = ThreadingSocks4Proxy(ReceiveSocksReq, SERVER_SOCKS_PORT)
     server.serve_forever()
+  elif str(sys.argv[1]) == "-server" and str(sys.argv[2]) == "2":
+    # serve the bridge on a pool of worker threads, optionally giving
+    # the number of workers, e.g. -server 2 128
+    workers = wsgiServer.WORKERS
+    if len(sys.argv) > 3:
+      workers = int(sys.argv[3])
+    # measure the image encoders before the first client needs them
+    chooseImageType()
+    startStatsLog()
+    host, port = TOR_BRIDGE_ADDRESS.split(':')
+    server = wsgiServer.ThreadPoolWSGIServer(host, int(port), app, workers)
+    server.serve_forever()
   else:
-    addressList = []
     # setup the proxy server
-    # bind to a local address and wait for Tor to connect
-    # htptObject.torBinder = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    # htptObject.torBinder.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    # htptObject.torBinder.bind(('localhost', SERVER_SOCKS_PORT))
-    # htptObject.torBinder.listen(1)
-    # (htptObject.torSock, address) = htptObject.torBinder.accept()
-    # htptObject.torSock = socks.socksocket()
-    # htptObject.torSock.setproxy(socks.PROXY_TYPE_SOCKS4, "localhost", SERVER_SOCKS_PORT)
-    htptObject.torSock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    htptObject.torSock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    htptObject.torSock.connect(("localhost", SERVER_SOCKS_PORT))
+    # each session connects to Tor at SERVER_SOCKS_PORT when the client
+    # sends its password, see initSession
+    chooseImageType()
+    startStatsLog()
     app.run(debug=True, use_reloader=False)
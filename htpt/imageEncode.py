@@ -2,6 +2,7 @@
 # Georgia Tech Fall 2013
 # image-encode.py: Hide data in images
 import struct, random, math, os, time
+from cStringIO import StringIO
 from PIL import Image
 import numpy as np
 
@@ -25,15 +26,10 @@ def encode(data, imageType):
   if imageType not in AVAILABLE_TYPES:
       raise(ImageEncodeError("Non-supported or invalid image type."))
 
-  if imageType == 'bmp':
-    return encodeAsBMP(data)
-  if imageType =='png':
-    return encodeAsPNG(data)
-  if imageType =='llj':
-    return encodeAsLLJ(data)
+  return ENCODERS[imageType](data)
 
     
-def decode(Im, imageType):
+def decode(Im, imageType, asView=False):
   """
   Encode data as a image
 
@@ -41,6 +37,8 @@ def decode(Im, imageType):
   data - a string holding the data to be encoded
   imageType - an string indicating what type of expression to hide
   the data in
+  asView - if True, bmp and png images return a memoryview on the
+  decoded image instead of copying the data out of it
 
   Returns: a data stream of image
 
@@ -48,12 +46,9 @@ def decode(Im, imageType):
   if imageType not in AVAILABLE_TYPES:
       raise(ImageEncodeError("Non-supported or invalid image type."))
 
-  if imageType == 'bmp':
-    return decodeAsBMP(Im)
-  if imageType =='png':
-    return decodeAsPNG(Im)
-  if imageType =='llj':
-    return decodeAsLLJ(Im)    
+  if imageType == 'llj':
+    return decodeAsLLJ(Im)
+  return DECODERS[imageType](Im, asView)
         
     
 def appendBytes (byteArray, appendedPart):
@@ -135,9 +130,12 @@ def encodeAsBMP(data):
     bitmapImage = appendBytes(bitmapImage, padbytes)
     return bitmapImage
 
-def decodeAsBMP(bitmapImage):
-    dataOffset = struct.unpack('<L', bitmapImage[10:14])[0]
-    dataLength = struct.unpack('<L', bitmapImage[dataOffset:dataOffset + 4])[0]
+def decodeAsBMP(bitmapImage, asView=False):
+    dataOffset = struct.unpack_from('<L', bitmapImage, 10)[0]
+    dataLength = struct.unpack_from('<L', bitmapImage, dataOffset)[0]
+    if asView:
+        # the data stays in bitmapImage, which the view keeps alive
+        return memoryview(bitmapImage)[dataOffset + 4:dataOffset + 4 + dataLength]
     data = bitmapImage[dataOffset + 4:dataOffset + 4 + dataLength]
     return data
 
@@ -146,29 +144,30 @@ def getRandomByte():
     return x
 
 def encodeAsPNG(data):
+    """
+    Encode data in a PNG Image
+
+    Note: the conversion is done in memory rather than through a file
+    on disk, so several images can be encoded at the same time
+    """
     bitmapImage = encodeAsBMP(data)
-    outfile = open('myImage.bmp','w')
-    outfile.write(bitmapImage)
-    outfile.close()
-    
-    img = Image.open('myImage.bmp')
-    img.save('myImage.png', 'PNG')
-    
-    file = open('myImage.png', 'r')
-    PNGImage = file.read()
-    return PNGImage
-    
-def decodeAsPNG(PNGImage):
-    outfile = open('myImage.png','w')
-    outfile.write(PNGImage)
-    outfile.close()
-    
-    img = Image.open('myImage.png')
-    img.save('myImage.bmp', 'BMP')
-    
-    file = open('myImage.bmp', 'r')
-    bitmapImage = file.read()
-    return decodeAsBMP(bitmapImage)
+    img = Image.open(StringIO(str(bitmapImage)))
+    outfile = StringIO()
+    img.save(outfile, 'PNG')
+    return outfile.getvalue()
+
+def decodeAsPNG(PNGImage, asView=False):
+    """
+    Decode data from a PNG Image
+
+    Note: like encodeAsPNG, this does not touch the disk and is safe to
+    call from several threads. With asView, the data is returned as a
+    memoryview on the converted bitmap, see decodeAsBMP
+    """
+    img = Image.open(StringIO(PNGImage))
+    outfile = StringIO()
+    img.save(outfile, 'BMP')
+    return decodeAsBMP(outfile.getvalue(), asView)
     
     
 def encodeAsLLJ(data):
@@ -193,6 +192,15 @@ def decodeAsLLJ(LLJImage):
     file = open('myImage.bmp', 'r')
     bitmapImage = file.read()
     return decodeAsBMP(bitmapImage)
+
+
+# the encoder and decoder of every type in AVAILABLE_TYPES
+ENCODERS = {'bmp': encodeAsBMP, 'png': encodeAsPNG, 'llj': encodeAsLLJ}
+DECODERS = {'bmp': decodeAsBMP, 'png': decodeAsPNG, 'llj': decodeAsLLJ}
+# the bytes every image of a type starts with
+MAGIC = {'bmp': 'BM', 'png': '\x89PNG\r\n\x1a\n'}
+# the Content-Type and file extension an image of a type is served with
+MIME_TYPES = {'bmp': 'image/bmp', 'png': 'image/png', 'llj': 'image/jpeg'}
     
     
 if __name__ == '__main__':
@@ -0,0 +1,319 @@
+# Georgia Tech
+# Spring 2014
+# retransmit.py: keep sent frames until the peer acknowledges them
+
+import threading
+import time
+from collections import deque, OrderedDict
+
+from constants import *
+
+# seconds to wait for an acknowledgement before the first RTT sample
+INITIAL_RTO = 1.0
+# bounds on the retransmission timeout, in seconds
+MIN_RTO = 0.2
+MAX_RTO = 60.0
+# a frame is sent again once this many frames sent after it are acked
+DUP_THRESHOLD = 3
+# most frames and bytes kept for retransmission. A peer that does not
+# acknowledge anything cannot make the queue grow without limit
+MAX_UNACKED_FRAMES = BUFFER_SIZE
+MAX_UNACKED_BYTES = 16 * 1024 * 1024
+
+
+def seqDistance(start, end, maxSeqNum=MAX_SEQ_NUM):
+  """Return how many sequence numbers end is ahead of start, allowing
+  for the sequence number wrapping at maxSeqNum"""
+  return (end - start) % maxSeqNum
+
+
+class SentFrame():
+  """A frame waiting to be acknowledged"""
+
+  def __init__(self, seqNum, data, sentTime):
+    self.seqNum = seqNum
+    self.data = data
+    self.sentTime = sentTime
+    # RTT samples are only taken from frames sent once (Karn's rule)
+    self.retransmitted = False
+    # frames sent after this one that the peer has acked, see
+    # RetransmitQueue.ack
+    self.nacks = 0
+    self.lost = False
+
+
+class RetransmitQueue():
+  """
+  Frames sent to the peer that it has not acknowledged yet
+
+  The peer acknowledges frames with a cumulative ACK, the next sequence
+  number it is waiting for, and a SACK bitmap of the SACK_BITS frames
+  after that one which it is holding in its reorder buffer. Acked
+  frames are forgotten. A frame is sent again when it has not been
+  acked within the retransmission timeout (RTO), or as soon as
+  DUP_THRESHOLD frames sent after it have been acked, so one lost
+  request is repaired without waiting for the timer.
+
+  The RTO follows RFC 6298: it is estimated from the round trip times
+  of acked frames and doubles every time it runs out, up to MAX_RTO.
+
+  Acks also carry the peer's receive credit, the bytes its reorder
+  buffer has free. getAllowance tells the sender how much more it may
+  send before frames could be dropped for lack of room.
+
+  Note: the frames are kept in the order they were (last) sent, so the
+  frames whose RTO has run out are always at the front
+
+  Note: empty frames, i.e. polls, are kept so that a gap they leave in
+  the peer's reorder buffer can be filled once SACKs show them lost,
+  but they have no RTO and give no RTT samples. The bridge may hold a
+  long poll for up to LONG_POLL_TIMEOUT before answering it, which is
+  neither a loss nor a round trip time
+
+  Note: acks come in on the thread that decodes responses while frames
+  are added by the thread that sends requests, so every method takes
+  the queue's lock
+
+  """
+
+  def __init__(self, clock=time.time, maxSeqNum=MAX_SEQ_NUM):
+    """
+    Parameters:
+    clock- function returning the current time in seconds, replaced by
+    the tests
+    maxSeqNum- where the sequence numbers wrap
+
+    """
+    self.clock = clock
+    self.maxSeqNum = maxSeqNum
+    self.frames = OrderedDict()
+    self.unackedBytes = 0
+    # sequence numbers of the oldest frame not cumulatively acked and
+    # of the last frame added
+    self.lowest = None
+    self.highest = None
+    # bytes the peer's buffer had free at its last ack
+    self.credit = INITIAL_CREDIT
+    # frames found lost from the SACK bitmap, to be sent before any
+    # whose RTO ran out
+    self.lost = deque()
+    self.rto = INITIAL_RTO
+    self.srtt = None
+    self.rttvar = None
+    self.retransmits = 0
+    self.forgotten = 0
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.frames)
+
+  def add(self, seqNum, data):
+    """
+    Keep a frame that was just sent for the first time
+
+    Parameters:
+    seqNum- the sequence number in the frame's header
+    data- the frame's data, without the header
+
+    Note: once MAX_UNACKED_FRAMES or MAX_UNACKED_BYTES are kept, the
+    oldest frame is forgotten and cannot be sent again
+
+    """
+    self.lock.acquire()
+    try:
+      if self.lowest is None or len(self.frames) == 0:
+        self.lowest = seqNum
+      self.highest = seqNum
+      self.frames[seqNum] = SentFrame(seqNum, data, self.clock())
+      self.unackedBytes += len(data)
+      while len(self.frames) > MAX_UNACKED_FRAMES or \
+            (self.unackedBytes > MAX_UNACKED_BYTES and len(self.frames) > 1):
+        seqNum, frame = self.frames.popitem(last=False)
+        self.unackedBytes -= len(frame.data)
+        self.forgotten += 1
+    finally:
+      self.lock.release()
+
+  def ack(self, cumAck, bitmap, credit=None):
+    """
+    Forget the frames the peer has acknowledged
+
+    Parameters:
+    cumAck- the next sequence number the peer is waiting for. Every
+    frame before it has been received
+    bitmap- bit i is set if the peer holds the frame with sequence
+    number cumAck + 1 + i
+    credit- the peer's receive credit in CREDIT_UNITs, or None to keep
+    the last one
+
+    Note: a frame before the last newly SACKed one is counted as lost
+    once DUP_THRESHOLD frames sent after it have been SACKed. Acks that
+    repeat what earlier ones said do not count again
+
+    Returns: the number of frames newly acked
+
+    """
+    self.lock.acquire()
+    try:
+      now = self.clock()
+      acked = []
+      # cumulative part: every sequence number from the oldest one not
+      # yet acked up to cumAck. An old ack that is behind lowest is
+      # further than half the sequence space ahead and ignored
+      stale = False
+      if self.lowest is not None:
+        count = seqDistance(self.lowest, cumAck, self.maxSeqNum)
+        if count <= self.maxSeqNum / 2:
+          # no frame after the last one added can be waiting
+          count = min(count, seqDistance(self.lowest, self.highest,
+                                         self.maxSeqNum) + 1)
+          for offset in xrange(count):
+            frame = self.frames.pop((self.lowest + offset) % self.maxSeqNum,
+                                    None)
+            if frame is not None:
+              acked.append(frame)
+          self.lowest = cumAck
+        else:
+          stale = True
+      if credit is not None and not stale:
+        self.credit = credit * CREDIT_UNIT
+      # selective part
+      sacked = []
+      bit = 0
+      while bitmap >> bit:
+        if bitmap >> bit & 1:
+          frame = self.frames.pop((cumAck + 1 + bit) % self.maxSeqNum, None)
+          if frame is not None:
+            sacked.append((bit + 1, frame))
+        bit += 1
+      # look for lost frames up to the last one newly SACKed
+      span = 0
+      if sacked != []:
+        span = sacked[-1][0]
+      for offset in xrange(span):
+        frame = self.frames.get((cumAck + offset) % self.maxSeqNum)
+        if frame is None or frame.lost:
+          continue
+        for sackOffset, sackedFrame in sacked:
+          if sackOffset > offset and sackedFrame.sentTime >= frame.sentTime:
+            frame.nacks += 1
+        if frame.nacks >= DUP_THRESHOLD:
+          frame.lost = True
+          self.lost.append(frame.seqNum)
+      acked.extend([frame for sackOffset, frame in sacked])
+      sample = None
+      for frame in acked:
+        self.unackedBytes -= len(frame.data)
+        if not frame.retransmitted and len(frame.data) > 0:
+          sample = now - frame.sentTime
+      if sample is not None:
+        self.sampleRTT(sample)
+      return len(acked)
+    finally:
+      self.lock.release()
+
+  def sampleRTT(self, sample):
+    """Update the RTT estimate and the RTO from a round trip time
+    measured on a frame that was only sent once (RFC 6298)"""
+    if self.srtt is None:
+      self.srtt = sample
+      self.rttvar = sample / 2
+    else:
+      self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+      self.srtt = 0.875 * self.srtt + 0.125 * sample
+    self.rto = min(max(self.srtt + 4 * self.rttvar, MIN_RTO), MAX_RTO)
+
+  def getRetransmits(self, limit=None):
+    """
+    Return the frames that have to be sent again, and mark them sent
+
+    Parameters: limit- the most frames to return, or None for all that
+    are due
+
+    Note: frames found lost by SACK come first, followed by the frames
+    with data whose RTO ran out, oldest first. If the RTO ran out, it
+    doubles
+
+    Returns: a list of (seqNum, data) tuples
+
+    """
+    self.lock.acquire()
+    try:
+      now = self.clock()
+      due = []
+      while self.lost and (limit is None or len(due) < limit):
+        frame = self.frames.get(self.lost.popleft())
+        if frame is not None and frame.lost:
+          due.append(frame)
+      timedOut = False
+      for frame in self.frames.itervalues():
+        if limit is not None and len(due) >= limit:
+          break
+        if len(frame.data) == 0:
+          continue
+        if now - frame.sentTime < self.rto:
+          break
+        if not frame.lost:
+          due.append(frame)
+          timedOut = True
+      for frame in due:
+        # move the frame to the back, since it was the last one sent
+        del self.frames[frame.seqNum]
+        self.frames[frame.seqNum] = frame
+        frame.sentTime = now
+        frame.retransmitted = True
+        frame.lost = False
+        frame.nacks = 0
+      self.retransmits += len(due)
+      if timedOut:
+        self.rto = min(self.rto * 2, MAX_RTO)
+      return [(frame.seqNum, frame.data) for frame in due]
+    finally:
+      self.lock.release()
+
+  def getAllowance(self):
+    """
+    Return how many more bytes may be sent before the peer could run
+    out of room for them
+
+    Note: this is the peer's credit less the bytes not acked yet. It is
+    0 once the next frame would fall beyond the end of the peer's
+    reorder buffer, since it would be dropped. Frames sent again do not
+    count against it
+
+    """
+    self.lock.acquire()
+    try:
+      if len(self.frames) == 0:
+        return self.credit
+      if seqDistance(self.lowest, self.highest, self.maxSeqNum) + 1 >= \
+         BUFFER_SIZE:
+        return 0
+      return max(self.credit - self.unackedBytes, 0)
+    finally:
+      self.lock.release()
+
+  def getTimeout(self):
+    """Return the seconds until a frame has to be sent again, 0 if one
+    is due now, or None if no frame with data is waiting for an ack"""
+    self.lock.acquire()
+    try:
+      if self.lost:
+        return 0
+      for frame in self.frames.itervalues():
+        if len(frame.data) > 0:
+          return max(0, frame.sentTime + self.rto - self.clock())
+      return None
+    finally:
+      self.lock.release()
+
+  def getStats(self):
+    """Return a dictionary of the frames waiting for an ack and the RTT
+    estimate"""
+    return {'unackedFrames': len(self.frames),
+            'unackedBytes': self.unackedBytes,
+            'retransmits': self.retransmits,
+            'forgotten': self.forgotten,
+            'credit': self.credit,
+            'srtt': self.srtt,
+            'rto': self.rto}
@@ -0,0 +1,70 @@
+# Georgia Tech
+# Spring 2014
+# scheduler.py: decide how long the client waits between empty polls
+
+import threading
+
+# seconds to wait between polls while data is flowing
+MIN_POLL_INTERVAL = 0.05
+# seconds to wait between polls once both directions have been idle
+MAX_POLL_INTERVAL = 5.0
+# factor the interval grows by after every idle poll
+BACKOFF = 2
+
+
+class PollScheduler():
+  """
+  Adaptive interval between empty polls to the bridge
+
+  While neither Tor nor the bridge has anything to send, every empty
+  poll doubles the wait before the next one, up to MAX_POLL_INTERVAL.
+  As soon as data moves in either direction the interval snaps back to
+  MIN_POLL_INTERVAL, and when the bridge says it has more data queued
+  the next poll goes out right away.
+
+  """
+
+  def __init__(self, minInterval=MIN_POLL_INTERVAL,
+               maxInterval=MAX_POLL_INTERVAL, backoff=BACKOFF):
+    """
+    Parameters:
+    minInterval- the interval used while data is flowing
+    maxInterval- the longest the client will go without polling
+    backoff- factor the interval is multiplied by after an idle poll
+
+    """
+    self.minInterval = minInterval
+    self.maxInterval = maxInterval
+    self.backoff = backoff
+    self.interval = minInterval
+    # responses are handled on the request window's threads
+    self.lock = threading.Lock()
+
+  def getTimeout(self):
+    """Return the number of seconds to wait for Tor before polling"""
+    return self.interval
+
+  def idlePoll(self):
+    """Back off after sending a poll that carried no data"""
+    self.lock.acquire()
+    self.interval = min(max(self.interval * self.backoff, self.minInterval),
+                        self.maxInterval)
+    self.lock.release()
+
+  def dataSent(self):
+    """Poll aggressively again because Tor sent data upstream"""
+    self.lock.acquire()
+    self.interval = self.minInterval
+    self.lock.release()
+
+  def dataReceived(self):
+    """Poll aggressively again because the bridge sent data"""
+    self.lock.acquire()
+    self.interval = self.minInterval
+    self.lock.release()
+
+  def moreData(self):
+    """The bridge has more data queued, so poll again immediately"""
+    self.lock.acquire()
+    self.interval = 0
+    self.lock.release()
@@ -0,0 +1,88 @@
+# Georgia Tech
+# Spring 2014
+# segmenter.py: cut data from Tor into segments that fit in one request
+
+import headerCodec
+import urlEncode
+from constants import *
+
+
+class SegmentingException(Exception):
+  pass
+
+
+class Segmenter():
+  """
+  Cut upstream data into segments sized for the carrier
+
+  The segment size is the number of bytes the url encoding can carry
+  in one request within the size budget for the url and cookies, less
+  the frame header and the acknowledgement that may follow it.
+  Segments are cut by walking an offset through the data, so every
+  byte is copied once no matter how much Tor hands us.
+
+  Segments that are waiting to be sent can share one request as packed
+  frames (see frame.Assembler.assembleMany). countPacked tells how many
+  of them fit, allowing for the length each packed frame carries.
+
+  """
+
+  def __init__(self, encodingType, maxSize=urlEncode.MAX_REQUEST_SIZE,
+               version=1):
+    """
+    Parameters:
+    encodingType- the urlEncode type the segments will be sent with
+    maxSize- the number of characters the url and Cookie header of one
+    request may take up together
+    version- the header version the frames are assembled with, which
+    sets the size of the header and the ack
+
+    """
+    self.encodingType = encodingType
+    self.maxSize = maxSize
+    self.headerSize = headerCodec.getHeaderSize(version)
+    capacity = urlEncode.getCapacity(encodingType, maxSize)
+    self.segmentSize = capacity - self.headerSize - \
+                       headerCodec.getAckSize(version)
+    if self.segmentSize <= 0:
+      raise SegmentingException("A {} request of {} characters cannot "
+                                "carry any data".format(encodingType, maxSize))
+
+  def getSegmentSize(self):
+    """Return the number of bytes of data put in each segment"""
+    return self.segmentSize
+
+  def segment(self, data):
+    """
+    Generate the segments of data in order
+
+    Parameters: data- a string of data read from Tor
+
+    Note: an empty string produces no segments
+
+    """
+    size = self.segmentSize
+    for offset in xrange(0, len(data), size):
+      yield data[offset:offset + size]
+
+  def countPacked(self, segments):
+    """
+    Return how many of the leading segments fit in one request
+
+    Parameters: segments- a list of segments waiting to be sent
+
+    Note: a lone segment is sent as a plain frame, so the first segment
+    always fits. Beyond that, every segment costs a header and a length
+    field on top of its data. Room for the acknowledgement is always
+    left over
+
+    """
+    capacity = self.segmentSize + self.headerSize
+    used = 0
+    count = 0
+    for segment in segments:
+      used += self.headerSize + PACKED_LENGTH_SIZE + len(segment)
+      if used > capacity and count > 0:
+        break
+      count += 1
+    return count
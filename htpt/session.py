@@ -0,0 +1,200 @@
+# Georgia Tech
+# Spring 2014
+# session.py: state the bridge keeps for each connected client
+
+import socket
+import threading
+import time
+
+import frame
+import torWriter
+from constants import *
+
+
+# most sessions a bridge serves at once. Clients with version 2 headers
+# have a 24-bit session ID, so this is no longer bound by the 8-bit one
+MAX_SESSIONS = 4096
+# seconds without a request after which a session is closed and its
+# session ID given back
+SESSION_TIMEOUT = 300
+
+
+class SessionException(Exception):
+  pass
+
+
+class Session():
+  """
+  Everything the bridge needs to serve one client
+
+  Each session has its own assembler and disassembler, so sequence
+  numbers and reordering are kept apart between clients, and its own
+  connection to Tor, written to in the background by a TorWriter.
+  Requests for a session have to be handled one at a time, so callers
+  should hold lock while using it.
+
+  """
+
+  def __init__(self):
+    self.sessionID = None
+    self.assembler = None
+    self.disassembler = None
+    self.torSock = None
+    self.writer = None
+    self.lock = threading.Lock()
+    self.lastSeen = time.time()
+
+  def connectTor(self, address):
+    """Open this session's connection to Tor at the (host, port) address"""
+    self.torSock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    self.torSock.connect(address)
+    self.writer = torWriter.TorWriter(self.torSock)
+
+  def recvData(self, data):
+    """
+    Callback for this session's disassembler
+
+    Parameters: data- the reordered data from the client to pass up to
+    Tor, a string or a buffer such as a memoryview
+
+    Note: the data is queued for the session's writer, so the request
+    is answered without waiting for Tor to read it
+
+    """
+    if len(data) == 0:
+      return
+    self.writer.write(data)
+
+  def getReadSize(self, maxSize):
+    """
+    Return how many bytes may be read from Tor for the client, at most
+    maxSize, or 0 if its reorder buffer has no room for more
+
+    Note: the room is only known from the receive credit in the
+    client's acks. A client that has neither agreed on version 2 headers
+    nor sent an ack is not held to any credit, or the bridge would stop
+    reading from Tor for it for good once INITIAL_CREDIT was sent
+
+    """
+    allowance = self.assembler.getSendAllowance()
+    if allowance is None:
+      return maxSize
+    return min(allowance, maxSize)
+
+  def touch(self):
+    """Record that the client has just sent a request"""
+    self.lastSeen = time.time()
+
+  def getStats(self):
+    """
+    Return a dictionary of this session's reorder buffer counters (see
+    buffers.Buffer.getStats) and frames waiting for the client's ack
+    (see retransmit.RetransmitQueue.getStats) along with its ID and when
+    the client was last seen
+
+    """
+    stats = {}
+    if self.disassembler is not None:
+      stats = self.disassembler.buffer.getStats()
+    if self.assembler is not None and self.assembler.unacked is not None:
+      stats.update(self.assembler.unacked.getStats())
+    stats['sessionID'] = self.sessionID
+    stats['lastSeen'] = self.lastSeen
+    return stats
+
+  def close(self):
+    """Close the connection to Tor"""
+    if self.writer is not None:
+      # the session is over, so do not wait for Tor to take the rest
+      self.writer.close(0)
+      self.writer = None
+    if self.torSock is not None:
+      self.torSock.close()
+      self.torSock = None
+
+
+class SessionTable():
+  """
+  Sessions of every connected client, keyed by session ID
+
+  Note: lookups are a dictionary access, so finding the session for a
+  request takes the same time no matter how many clients are connected
+
+  Note: the session ID of a session that is removed or expires is
+  given back to frame.SessionID to be handed out again
+
+  """
+
+  def __init__(self, maxSessions=MAX_SESSIONS):
+    self.maxSessions = maxSessions
+    self.sessions = {}
+    self.lock = threading.Lock()
+
+  def __len__(self):
+    return len(self.sessions)
+
+  def isFull(self):
+    """Return True if no more sessions can be added"""
+    return len(self.sessions) >= self.maxSessions
+
+  def add(self, session):
+    """
+    Add a session under its session ID
+
+    Note: raises a SessionException if the table is full or if the ID
+    is already taken by a live session
+
+    """
+    self.lock.acquire()
+    try:
+      if len(self.sessions) >= self.maxSessions:
+        raise SessionException("Session table is full")
+      if session.sessionID in self.sessions:
+        raise SessionException("Session ID {} is already in use"
+                               .format(session.sessionID))
+      self.sessions[session.sessionID] = session
+    finally:
+      self.lock.release()
+
+  def get(self, sessionID):
+    """Return the session with the given ID or None if there is none"""
+    return self.sessions.get(sessionID)
+
+  def getStats(self):
+    """Return the stats of every session, keyed by session ID"""
+    self.lock.acquire()
+    sessions = self.sessions.items()
+    self.lock.release()
+    return dict([(sessionID, session.getStats())
+                 for sessionID, session in sessions])
+
+  def remove(self, sessionID):
+    """Remove and close the session with the given ID, if there is one"""
+    self.lock.acquire()
+    session = self.sessions.pop(sessionID, None)
+    self.lock.release()
+    if session is not None:
+      session.close()
+      frame.SessionID.releaseSessionID(sessionID)
+
+  def expire(self, timeout=SESSION_TIMEOUT, now=None):
+    """
+    Remove and close every session that has not sent a request for
+    timeout seconds
+
+    Parameters:
+    timeout- the seconds a session may be idle
+    now- the current time, by default time.time()
+
+    Returns: the IDs of the sessions removed
+
+    """
+    if now is None:
+      now = time.time()
+    self.lock.acquire()
+    expired = [sessionID for sessionID, session in self.sessions.iteritems()
+               if now - session.lastSeen > timeout]
+    self.lock.release()
+    for sessionID in expired:
+      self.remove(sessionID)
+    return expired
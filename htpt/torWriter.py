@@ -0,0 +1,166 @@
+# Georgia Tech
+# Spring 2014
+# torWriter.py: write reordered data to Tor on a thread of its own
+
+import errno
+import select
+import socket
+import threading
+from collections import deque
+
+# most bytes queued for Tor before write blocks
+MAX_QUEUED_BYTES = 4 * 1024 * 1024
+# seconds to wait at a time for Tor's socket to take more data
+WRITE_POLL_INTERVAL = 1.0
+
+
+class WriterException(Exception):
+  pass
+
+
+class TorWriter():
+  """
+  Queue data for a connection to Tor and write it out in the background
+
+  The disassembler's callback only has to put the data in the queue,
+  so decoding the next response is not held up by a slow Tor socket.
+  Data is written with non-blocking sends: whatever part of a chunk
+  Tor's socket takes is written, and the writer waits for the socket to
+  become writable before sending the rest, so no bytes are lost to a
+  short write.
+
+  Note: the queue is bounded by bytes. Once MAX_QUEUED_BYTES are
+  waiting, write blocks until the writer catches up, which in turn
+  holds up decoding, so a stalled Tor cannot make the queue grow
+  without limit
+
+  """
+
+  def __init__(self, sock, maxQueuedBytes=MAX_QUEUED_BYTES):
+    """
+    Parameters:
+    sock- the connected socket to Tor
+    maxQueuedBytes- the most bytes waiting to be written before write
+    blocks
+
+    """
+    self.sock = sock
+    self.maxQueuedBytes = maxQueuedBytes
+    self.queue = deque()
+    self.queuedBytes = 0
+    self.closed = False
+    self.error = None
+    self.condition = threading.Condition()
+    self.writer = threading.Thread(target=self.drain)
+    self.writer.daemon = True
+    self.writer.start()
+
+  def write(self, data):
+    """
+    Queue data to be written to Tor
+
+    Parameters: data- a string or buffer, e.g. a memoryview. It is
+    kept as it is until it is written, so it must not be changed
+
+    Note: blocks while the queue is full. If an earlier write to Tor
+    failed, its error is raised here
+
+    """
+    if len(data) == 0:
+      return
+    self.condition.acquire()
+    try:
+      while self.queuedBytes >= self.maxQueuedBytes and self.error is None \
+            and not self.closed:
+        self.condition.wait()
+      self.checkError()
+      if self.closed:
+        raise WriterException("Writing to a closed TorWriter")
+      self.queue.append(data)
+      self.queuedBytes += len(data)
+      self.condition.notifyAll()
+    finally:
+      self.condition.release()
+
+  def drain(self):
+    """Writer thread: write queued data until closed and empty"""
+    while True:
+      self.condition.acquire()
+      try:
+        while len(self.queue) == 0 and not self.closed:
+          self.condition.wait()
+        if len(self.queue) == 0:
+          return
+        data = self.queue[0]
+      finally:
+        self.condition.release()
+      try:
+        self.sendAll(data)
+      except (socket.error, select.error) as e:
+        self.condition.acquire()
+        self.error = e
+        self.queue.clear()
+        self.queuedBytes = 0
+        self.condition.notifyAll()
+        self.condition.release()
+        return
+      self.condition.acquire()
+      self.queue.popleft()
+      self.queuedBytes -= len(data)
+      self.condition.notifyAll()
+      self.condition.release()
+
+  def sendAll(self, data):
+    """
+    Write all of data to the socket without ever blocking in send
+
+    Note: each send writes as much as the socket will take right now.
+    After a short write the rest is sent once select says the socket
+    is writable again
+
+    """
+    if not isinstance(data, memoryview):
+      data = memoryview(data)
+    offset = 0
+    while offset < len(data):
+      try:
+        offset += self.sock.send(data[offset:], socket.MSG_DONTWAIT)
+      except socket.error as e:
+        if e.errno not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+          raise
+        select.select([], [self.sock], [], WRITE_POLL_INTERVAL)
+
+  def checkError(self):
+    """Raise the error of a failed write, if any"""
+    if self.error is not None:
+      raise self.error
+
+  def getQueuedBytes(self):
+    """Return the number of bytes waiting to be written"""
+    return self.queuedBytes
+
+  def flush(self):
+    """Block until everything queued so far has been written"""
+    self.condition.acquire()
+    try:
+      while len(self.queue) > 0 and self.error is None:
+        self.condition.wait()
+      self.checkError()
+    finally:
+      self.condition.release()
+
+  def close(self, timeout=None):
+    """
+    Stop the writer once the queued data has been written
+
+    Parameters: timeout- the most seconds to wait for the writer to
+    finish, or None to wait until it has
+
+    Note: this does not close the socket
+
+    """
+    self.condition.acquire()
+    self.closed = True
+    self.condition.notifyAll()
+    self.condition.release()
+    self.writer.join(timeout)
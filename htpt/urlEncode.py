@@ -3,22 +3,108 @@
 # url-encode.py: collection of functions to hide small chunks of data in urls
 
 import binascii
+import math
+import os
 import re
+import threading
 from base64 import urlsafe_b64encode, urlsafe_b64decode
 from random import choice, randint
 
-AVAILABLE_TYPES=['market', 'baidu', 'google']
+AVAILABLE_TYPES=['market', 'baidu', 'google', 'b64']
 BYTES_PER_COOKIE=30
+# default budget for the number of characters that the url and the
+# Cookie header of a single request may take up together
+MAX_REQUEST_SIZE=1024
+# number of bytes of data that fit in the url of each encoding before
+# the rest overflows into cookies
+MARKET_URL_BYTES=39
+ENGLISH_URL_BYTES=40
+# host that market and b64 urls are for
+DEFAULT_HOST='localhost:5000'
+# query parameter holding the part of a b64 url's data not in its path
+B64_KEY='sid'
+# bounds on the length of the path segments of a b64 url
+B64_SEGMENT_MIN=8
+B64_SEGMENT_MAX=32
+# longest word in LOOKUP_TABLE, used for worst case url lengths
+MAX_WORD_LEN=4
 LOOKUP_TABLE = ['a', 'an', 'the', 'what', 'if', 'but', 'he', 'she',
                 'it', 'and', 'who', 'when', 'is', 'am', 'are', 'was']
 REVERSE_LOOKUP_TABLE = {'a':'0', 'an':'1', 'the':'2', 'what':'3',
                         'if':'4', 'but':'5', 'he':'6', 'she':'7',
                         'it':'8', 'and':'9', 'who':'A', 'when':'B',
                         'is':'C', 'am':'D', 'are':'E', 'was':'F'}
+# the words for every byte, keyed by the byte as a character: the word
+# for its high nibble and the word for its low nibble, joined by '+'
+WORD_PAIRS = dict([(chr(byte), LOOKUP_TABLE[byte >> 4] + '+' +
+                    LOOKUP_TABLE[byte & 0xf]) for byte in range(256)])
+
+# the characters market urls are padded with. Data is lowercase hex,
+# so the padding is the uppercase hex letters
+PADDING_CHARACTERS = 'ABCDEF'
+# translation from random bytes to padding characters. 252 is a
+# multiple of 6, so the bytes below it map to each character equally
+# often and the bytes from 252 up are deleted
+PADDING_TABLE = ''.join([PADDING_CHARACTERS[byte % len(PADDING_CHARACTERS)]
+                         for byte in range(256)])
+PADDING_DELETE = ''.join([chr(byte) for byte in range(252, 256)])
+# padding characters made at a time by the PaddingPool, enough for
+# about a hundred market urls
+PADDING_POOL_SIZE = 8192
+# every carrier a url can hide data in, compiled once. Each alternative
+# captures its payload in a group named after the carrier type, so one
+# match tells both the carrier and where its data is. The url before
+# the first '?' decides which alternative can match, so at most one does
+CARRIER_PATTERN = re.compile(
+  'http://(?:'
+  '[a-zA-Z0-9:./]*\?qs=(?P<market>[0-9a-fA-F]{80})|'
+  'www\.baidu\.com/s\?wd=(?P<baidu>[a-zA-Z0-9+]+)|'
+  'www\.google\.com/search\?q=(?P<google>[a-zA-Z0-9+]+)|'
+  '[a-zA-Z0-9:.\-]+/(?P<b64>[a-zA-Z0-9_\-/]*\?' + B64_KEY +
+  '=[a-zA-Z0-9_\-.]*)$)')
+CARRIER_TYPES = ['market', 'baidu', 'google', 'b64']
 
 class UrlEncodeError(Exception):
   pass
 
+
+class PaddingPool():
+  """
+  Random padding characters made in bulk and handed out as needed
+
+  Every market url is padded to the same length, so each request needs
+  a few dozen random padding characters. Rather than making them one
+  at a time, the pool makes PADDING_POOL_SIZE at once with
+  getRandomPadding and hands out slices until they run out.
+
+  Note: take holds the pool's lock, so urls may be encoded on several
+  threads
+
+  """
+
+  def __init__(self, size=PADDING_POOL_SIZE):
+    self.size = size
+    self.pool = ''
+    self.offset = 0
+    self.lock = threading.Lock()
+
+  def take(self, count):
+    """Return count random padding characters, none of which is handed
+    out twice"""
+    self.lock.acquire()
+    try:
+      if self.offset + count > len(self.pool):
+        self.pool = getRandomPadding(max(self.size, count))
+        self.offset = 0
+      padding = self.pool[self.offset:self.offset + count]
+      self.offset += count
+      return padding
+    finally:
+      self.lock.release()
+
+# padding for every market url
+paddingPool = PaddingPool()
+
 def encode(data, encodingType):
   """
   Encode data as a url
@@ -47,12 +133,92 @@ def encode(data, encodingType):
   if encodingType not in AVAILABLE_TYPES:
       raise(UrlEncodeError("Bad encoding type. Please refer to"
                            "url-encode.AVAILABLE_TYPES for available options"))
-  if encodingType == 'market':
-    return encodeAsMarket(data)
-  elif encodingType == 'baidu':
-    return encodeAsBaidu(data)
-  elif encodingType == 'google':
-    return encodeAsGoogle(data)
+  return ENCODERS[encodingType](data)
+
+def getCapacity(encodingType, maxSize=MAX_REQUEST_SIZE):
+  """
+  Find how much data a single request can carry
+
+  Parameters:
+  encodingType - a string indicating which encoding will be used
+  maxSize - the number of characters that the url and the Cookie
+  header may take up together
+
+  Returns: the number of bytes of data that encode(data, encodingType)
+  is guaranteed to fit within maxSize characters. This is 0 if not even
+  an empty url fits
+
+  """
+  if encodingType not in AVAILABLE_TYPES:
+      raise(UrlEncodeError("Bad encoding type. Please refer to"
+                           "url-encode.AVAILABLE_TYPES for available options"))
+  return CAPACITIES[encodingType](maxSize)
+
+def cookieSize(numBytes):
+  """
+  Return the most characters that numBytes of data can take up in the
+  Cookie header, including the '; ' separating it from the next cookie
+
+  Note: the key length is picked at random by encodeAsCookie, so this
+  tries every possible split and returns the worst one
+
+  """
+  if numBytes <= 5:
+    splits = [0]
+  elif numBytes < 10:
+    splits = [3]
+  else:
+    splits = range(3, 11)
+  sizes = []
+  for keyLen in splits:
+    if keyLen == 0:
+      keyLen = len('keyForPadding')
+      valueLen = numBytes
+    else:
+      valueLen = numBytes - keyLen
+    keySize = 4 * int(math.ceil(keyLen / 3.0))
+    valueSize = 4 * int(math.ceil(valueLen / 3.0))
+    sizes.append(keySize + len('=') + valueSize + len('; '))
+  return max(sizes)
+
+def capacityWithCookies(urlBytes, urlSize, maxSize):
+  """
+  Return the capacity of an encoding that stores up to urlBytes of data
+  in a url of at most urlSize characters and the rest in cookies
+
+  """
+  if urlSize > maxSize:
+    return 0
+  numCookies = (maxSize - urlSize) / cookieSize(BYTES_PER_COOKIE)
+  return urlBytes + numCookies * BYTES_PER_COOKIE
+
+def capacityAsMarket(maxSize=MAX_REQUEST_SIZE):
+  """Return how many bytes encodeAsMarket can carry in maxSize chars"""
+  # the hex in a market url is always padded to the same length
+  urlSize = len(encodeAsMarket('')['url'])
+  return capacityWithCookies(MARKET_URL_BYTES, urlSize, maxSize)
+
+def capacityAsEnglish(prefixSize, maxSize):
+  """
+  Return how many bytes an english word url can carry in maxSize chars
+
+  Note: each byte is two words of at most MAX_WORD_LEN characters, each
+  followed by a '+' except for the last one
+
+  """
+  bytesLen = 2 * (MAX_WORD_LEN + 1)
+  urlSize = prefixSize + ENGLISH_URL_BYTES * bytesLen - 1
+  if urlSize > maxSize:
+    return max((maxSize - prefixSize + 1) / bytesLen, 0)
+  return capacityWithCookies(ENGLISH_URL_BYTES, urlSize, maxSize)
+
+def capacityAsBaidu(maxSize=MAX_REQUEST_SIZE):
+  """Return how many bytes encodeAsBaidu can carry in maxSize chars"""
+  return capacityAsEnglish(len(encodeAsBaidu('')['url']), maxSize)
+
+def capacityAsGoogle(maxSize=MAX_REQUEST_SIZE):
+  """Return how many bytes encodeAsGoogle can carry in maxSize chars"""
+  return capacityAsEnglish(len(encodeAsGoogle('')['url']), maxSize)
 
 def encodeAsCookies(data):
   """Hide data inside a series of cookies"""
@@ -66,54 +232,51 @@ def encodeAsCookies(data):
       data = ''
   return cookies
 
-def encodeAsB64(host, data):
+def encodeAsB64(data, host=DEFAULT_HOST):
   """
-  Hide data inside the Host, path, and query string fields of the URL
+  Hide data inside the path and query string fields of the URL
 
   Parameters: data- a string with the data to encode
+  host- the host the url is for
 
-  Returns: a string of the url
+  Returns: a dictionary with the key 'url' referencing a string
+  holding the url and the key 'cookie' holding an empty array, since
+  all of the data is in the url. See capacityAsB64 for how much fits
+
+  Note: the data is urlsafe base64 encoded with '.' in place of the '='
+  padding. A random share of up to half of it goes in the path, cut
+  into segments of B64_SEGMENT_MIN to B64_SEGMENT_MAX characters, and
+  the rest is the value of the B64_KEY query parameter, e.g.
+  http://localhost:5000/aGlkZGVu/IGluIGE?sid=cGF0aA..
 
   """
-  # randomly take some data off of the end to be inserted into cookies
-  cookieSplit = randint(0, len(data)/2)
-  cookieData = data[cookieSplit:]
-  cookies = encodeAsCookies(cookieData)
-  data = data[:cookieSplit]
+  encoded = urlsafe_b64encode(data).replace('=', '.')
+  split = randint(0, len(encoded) / 2)
+  segments = []
+  offset = 0
+  while offset < split:
+    end = min(offset + randint(B64_SEGMENT_MIN, B64_SEGMENT_MAX), split)
+    segments.append(encoded[offset:end])
+    offset = end
+  url = 'http://' + host + '/' + '/'.join(segments) + '?' + B64_KEY + \
+        '=' + encoded[split:]
+  encodedData = {'url':url, 'cookie':[]}
+  return encodedData
 
-  # base 64 encode the data
-  encoded = urlsafe_b64encode(data)
-  encoded.replace("=", ".")
+def capacityAsB64(maxSize=MAX_REQUEST_SIZE):
+  """
+  Return how many bytes encodeAsB64 can carry in maxSize chars
 
-  # divide it into path and query string
-  split = randint(0, len(encoded)-1)
-  path = encoded[:split]
-  query = encoded[split:]
-  
-  # randomly insert /'s into the path
-  numSplits = randint(0, 15)
-  if numSplits > len(data)/2:
-    numSplits = len(data)/5
-  for loc in range(numSplits):
-    location = randint(1, len(path)-1)
-    path = path[:location] + "/" + path[:location]
-  # randomly insert ; and = into the query string
-  numSplits = randint(0, 15)
-  if numSplits > len(data)/2:
-    numSplits = len(data)/8
-  for cap in range(numSplits):
-    location = randint(0, (len(data)/numSplits))
-    if cap == numSplits - 1:
-      query = query[location:] + "=" + query[:location]
-      break
-    difference = randint(0, (len(data)/numSplits) -location)
-    equalPos = cap* len(data)/numSplits
-    var = equalPos + difference
-    query = query[:equalPos] + "=" + query[equalPos:var] + ";" + query[var:]
-
-  url = "http://" + host + "/" + path + "?" + query
-  encodedData = {'url':url, 'cookie':cookies}
-  return encodedData
+  Note: every 3 bytes take 4 characters. At most half of them are in
+  the path, with a '/' between segments of at least B64_SEGMENT_MIN
+  characters, so the '/'s add at most one character per
+  2 * B64_SEGMENT_MIN
+
+  """
+  budget = maxSize - len(encodeAsB64('')['url'])
+  perSlash = 2 * B64_SEGMENT_MIN
+  encodedSize = budget * perSlash / (perSlash + 1)
+  return max(encodedSize / 4 * 3, 0)
 
 def encodeAsCookie(data):
   """
@@ -192,6 +355,21 @@ def pickRandomHexChar():
   characters = ['A','B','C','D','E','F']
   return choice(characters)
 
+def getRandomPadding(count):
+  """
+  Return count random characters from PADDING_CHARACTERS
+
+  Note: the characters come from one os.urandom call mapped through
+  PADDING_TABLE. Deleting the bytes from 252 up leaves a few
+  characters short, which are topped up by another call
+
+  """
+  padding = os.urandom(count + count / 32 + 8).translate(PADDING_TABLE,
+                                                        PADDING_DELETE)
+  while len(padding) < count:
+    padding += os.urandom(count).translate(PADDING_TABLE, PADDING_DELETE)
+  return padding[:count]
+
 def encodeAsMarket(data):
   """
   Hide data inside a url commonly used for email personalization
@@ -208,17 +386,14 @@ def encodeAsMarket(data):
 
   """
   cookies = []
-  if len(data) > 39:
-    cookies = encodeAsCookies(data[39:])
-    data = data[:39]
+  if len(data) > MARKET_URL_BYTES:
+    cookies = encodeAsCookies(data[MARKET_URL_BYTES:])
+    data = data[:MARKET_URL_BYTES]
   #if needed, pad the data to 80 characters
   hexData = binascii.hexlify(data)
   if len(hexData) < 78:
     padSize = 78-len(hexData)
-    padding = []
-    for index in range(padSize):
-      padding.append(pickRandomHexChar())
-    padding = ''.join(padding)
+    padding = paddingPool.take(padSize)
   else:
     padSize = 0
     padding = ''
@@ -235,17 +410,44 @@ def encodeAsMarket(data):
   #values and we are using uppercase to distinguish padding and
   #actual text
 #  url = 'http://' + 'click.' + domain + '?qs=' + urlData
-  url = 'http://' + "localhost:5000/" + '?qs=' + urlData
+  url = 'http://' + DEFAULT_HOST + '/' + '?qs=' + urlData
   encodedData = {'url':url, 'cookie':cookies}
   return encodedData
 
+def classify(url):
+  """
+  Find the carrier a url hides data in and the part holding the data
+
+  Parameters: url- the url of a request
+
+  Note: this is one match of CARRIER_PATTERN, however many carriers
+  there are. The result can be handed to decode so the url is not
+  matched again
+
+  Returns: a (carrierType, payload) tuple, where carrierType is one of
+  CARRIER_TYPES and payload is the hex of a market url, the words of
+  a Baidu or Google url or the path and query string of a b64 url, or
+  (None, None) if the url is not a carrier, e.g. a request for the
+  gallery
+
+  """
+  matches = CARRIER_PATTERN.match(url)
+  if matches is None:
+    return None, None
+  carrierType = matches.lastgroup
+  return carrierType, matches.group(carrierType)
+
+def getPayload(url, carrierType):
+  """Return the payload of a url of the given carrier type, raising a
+  UrlEncodeError if the url is not one"""
+  foundType, payload = classify(url)
+  if foundType != carrierType:
+    raise UrlEncodeError("Url is not a {} url".format(carrierType))
+  return payload
+
 def isMarket(url):
   """Return true if this url matches the market pattern"""
-  pattern = 'http://[a-zA-Z0-9:./]*\?qs=[0-9a-fA-F]{80}'
-  matches = re.match(pattern, url)
-  if matches != None:
-      return True
-  return False
+  return classify(url)[0] == 'market'
 
 def encodeAsBaidu(data):
   """
@@ -266,11 +468,10 @@ def encodeAsBaidu(data):
   """
   urlData = data
   cookies = []
-  if len(data) > 40:
-    urlData = data[:40]
-    cookies = encodeAsCookies(data[40:])
-  words = encodeAsEnglish(urlData)
-  urlData = '+'.join(words)
+  if len(data) > ENGLISH_URL_BYTES:
+    urlData = data[:ENGLISH_URL_BYTES]
+    cookies = encodeAsCookies(data[ENGLISH_URL_BYTES:])
+  urlData = encodeAsEnglishString(urlData)
   #Note: we cannot use urlparse here because it capitalizes our hex
   #values and we are using uppercase to distinguish padding and
   #actual text
@@ -282,11 +483,7 @@ def isBaidu(url):
   """Return True if this url matches the pattern for Baidu searches"""
 
   #Example: http://www.baidu.com/s?wd=mao+is+cool&rsv_bp=0&ch=&tn=baidu&bar=&rsv_spt=3&ie=utf-8
-  pattern = 'http://www.baidu.com/s\?wd=[\S+]+'
-  matches = re.match(pattern, url)
-  if matches != None:
-      return True
-  return False
+  return classify(url)[0] == 'baidu'
 
 def decodeAsBaidu(url):
   """
@@ -297,12 +494,7 @@ def decodeAsBaidu(url):
   Returns: a string with the decoded data
 
   """
-  pattern = 'http://www.baidu.com/s\?wd=(?P<englishText>[a-zA-Z0-9+]+)'
-  matches = re.match(pattern, url)
-  urlData = matches.group('englishText')
-  words = urlData.split('+')
-  data = decodeAsEnglish(words)
-  return data
+  return decodeAsEnglishString(getPayload(url, 'baidu'))
 
 def isGoogle(url):
   """
@@ -317,11 +509,8 @@ def isGoogle(url):
   expression would only match the+a
 
   """
-  pattern = 'http://www.google.com/search\?q=(?P<query>[a-zA-Z0-9+]+)'
-  matches = re.match(pattern, url)
-  if matches != None:
-    return True
-  return False
+  return classify(url)[0] == 'google'
+
 
 def encodeAsGoogle(data):
   """
@@ -342,11 +531,10 @@ def encodeAsGoogle(data):
   #if the data is over 40 chars, then use cookies
   urlData = data
   cookies = []
-  if len(data) > 40:
-    urlData = data[:40]
-    cookies = encodeAsCookies(data[40:])
-  words = encodeAsEnglish(urlData)
-  urlData = '+'.join(words)
+  if len(data) > ENGLISH_URL_BYTES:
+    urlData = data[:ENGLISH_URL_BYTES]
+    cookies = encodeAsCookies(data[ENGLISH_URL_BYTES:])
+  urlData = encodeAsEnglishString(urlData)
   url = 'http://www.google.com/search?q=' + urlData
   encodedData = {'url':url, 'cookie':cookies}
   return encodedData
@@ -355,36 +543,54 @@ def encodeAsGoogle(data):
 def decodeAsGoogle(url):
   """Decode data hidden within a google search query"""
   
-  pattern = 'http://www.google.com/search\?q=(?P<englishText>[a-zA-Z0-9+]+)'
-  matches = re.match(pattern, url)
-  urlData = matches.group('englishText')
-  words = urlData.split('+')
-  data = decodeAsEnglish(words)
-  return data
+  return decodeAsEnglishString(getPayload(url, 'google'))
 
 def encodeAsEnglish(data):
-  """Serialize data using english words for symbols"""
+  """Serialize data using english words for symbols
+
+  Returns: a list of two words per byte, see encodeAsEnglishString"""
+
+  if len(data) == 0:
+    return []
+  return encodeAsEnglishString(data).split('+')
+
+def encodeAsEnglishString(data):
+  """
+  Serialize data as english words joined by '+'
+
+  Parameters: data- a string of data to encode
 
-  #first, convert the string to a hex representation
-  hexString = binascii.hexlify(data)
-  #and convert the hex representation into words
-  stringy = []
-  for char in hexString:
-    stringy.append(LOOKUP_TABLE[int(char, 16)])
-  return stringy
+  Note: each byte is looked up in WORD_PAIRS, which holds both of its
+  words, so there is one lookup per byte instead of a hex digit
+  conversion and a lookup per nibble
+
+  Returns: the words of every byte joined by '+', ready to go in a url
+
+  """
+  return '+'.join([WORD_PAIRS[char] for char in data])
 
 def decodeAsEnglish(words):
   """Convert data back to hex, then a string from english text"""
 
   #first convert the english text back to hex
-  hexString = []
-  for word in words:
-    hexString.append(REVERSE_LOOKUP_TABLE[word])
-  hexString = ''.join(hexString)
+  hexString = ''.join([REVERSE_LOOKUP_TABLE[word] for word in words])
   #and convert the hex back to a string
   data = binascii.unhexlify(hexString)
   return data
 
+def decodeAsEnglishString(text):
+  """
+  Convert english words joined by '+' back to data
+
+  Parameters: text- the words as encodeAsEnglishString returns them
+
+  Note: raises a KeyError if a word is not in REVERSE_LOOKUP_TABLE
+
+  """
+  if len(text) == 0:
+    return ''
+  return decodeAsEnglish(text.split('+'))
+
 def decodeAsMarket(url):
   """
   Decode data hidden inside a url format for email personalization
@@ -394,36 +600,46 @@ def decodeAsMarket(url):
   Returns: a string with the decoded data
 
   """
-  pattern = '\?qs=(?P<hash>[0-9a-fA-F]*)'
-  matches = re.search(pattern, url)
-  data = matches.group('hash')
-  # strip any padding
-  dataLen = int(data[:2], 16)
-  data = data[2:dataLen+2]
-  data = binascii.unhexlify(data)
-  return data
+  return decodeMarketPayload(getPayload(url, 'market'))
 
-def decodeWithB64(data):
+def decodeMarketPayload(payload):
+  """
+  Decode the 80 hex characters after ?qs= in a market url
+
+  Note: the first 2 characters are the length of the hex data in hex,
+  and the padding after the data is dropped
+
+  """
+  dataLen = int(payload[:2], 16)
+  return binascii.unhexlify(payload[2:dataLen+2])
+
+def isB64(url):
+  """Return true if this url matches the pattern of encodeAsB64"""
+  return classify(url)[0] == 'b64'
+
+def decodeAsB64(url):
+  """Decode the data hidden in a url by encodeAsB64"""
+  return decodeWithB64(getPayload(url, 'b64'))
+
+def decodeWithB64(payload):
   """
   Decode the given data as b64 encoded with path and query string
   stuff added
 
-  """
-  pattern = '/(?<path>[\S]+)\?(?<query>[\S]+)'
-  matches = re.search(pattern, url)
-  path = matches.group('path')
-  query = matches.group('query')
+  Parameters: payload- the path and query string of a b64 url, as
+  classify returns them
 
-  # string out the encoding characters and decode the data
-  path.replace("/", "")
-  query.replace(";", "")
-  query.replace("=", "")
-  encoded = path + query
-  encoded.replace(".", "=")
-  data = urlsafe_b64decode(encoded)
-  return data
+  """
+  path, query = payload.split('?' + B64_KEY + '=', 1)
+  # strip out the encoding characters and decode the data. The url
+  # may come from the web server as unicode, which base64 cannot take
+  encoded = str(path.replace('/', '') + query)
+  try:
+    return urlsafe_b64decode(encoded.replace('.', '='))
+  except TypeError:
+    raise UrlEncodeError("Url does not hold valid base64 data")
 
-def decode(protocolUnit):
+def decode(protocolUnit, carrier=None):
 
   """
   Decode the given data after matching the url hiding format
@@ -431,20 +647,33 @@ def decode(protocolUnit):
   Parameters: data- the url and cookies to be decoded in the form of a
   dictionary with the url stored under the key 'url' and an array of 0
   or more cookies stored under 'cookie'
+  carrier- the (carrierType, payload) tuple classify returned for the
+  url, if the caller already has it. By default the url is classified
+  here
 
   Returns: the decoded data in the form of a string
 
   """
   url = protocolUnit['url']
   cookies = protocolUnit['cookie']
+  if carrier is None:
+    carrier = classify(url)
+  carrierType, payload = carrier
   data = []
-  if isMarket(url):
-    data.append(decodeAsMarket(url))
-  elif isBaidu(url):
-    data.append(decodeAsBaidu(url))
+  if carrierType == 'market':
+    data.append(decodeMarketPayload(payload))
+  elif carrierType in ['baidu', 'google']:
+    data.append(decodeAsEnglishString(payload))
+  elif carrierType == 'b64':
+    data.append(decodeWithB64(payload))
   else:
-    data.append(encodeAsB64(url))
-#    raise UrlEncodeError("Data does not match a known decodable type")
+    raise UrlEncodeError("Data does not match a known decodable type")
   for cookie in cookies:
     data.append(decodeAsCookie(cookie))
   return ''.join(data)
+
+# the encoder and the capacity function of every type in AVAILABLE_TYPES
+ENCODERS = {'market': encodeAsMarket, 'baidu': encodeAsBaidu,
+            'google': encodeAsGoogle, 'b64': encodeAsB64}
+CAPACITIES = {'market': capacityAsMarket, 'baidu': capacityAsBaidu,
+              'google': capacityAsGoogle, 'b64': capacityAsB64}
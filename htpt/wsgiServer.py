@@ -0,0 +1,283 @@
+# Georgia Tech
+# Spring 2014
+# wsgiServer.py: multi-threaded WSGI server to run the bridge without
+# flask's debug server
+
+import select
+import socket
+import threading
+import time
+from collections import OrderedDict
+from Queue import Queue
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# number of worker threads serving requests
+WORKERS = 64
+# seconds a keep-alive connection may stay idle before it is closed
+KEEP_ALIVE_TIMEOUT = 15
+# most seconds between checks for idle connections that timed out
+IDLE_CHECK_INTERVAL = 1.0
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+  """
+  Request handler that keeps connections open between requests
+
+  Note: the handler serves one request at a time. Rather than waiting
+  for the next request on a connection, it hands the connection back
+  to the server, which gives it to a worker again once the next request
+  arrives (see ThreadPoolMixIn). The handler, and the data it has read
+  ahead, stay with the connection until it is closed
+
+  Note: werkzeug closes the connection itself if a response has no
+  Content-Length, and the socket timeout frees the worker from a
+  client that stops in the middle of a request
+
+  Note: the status line and headers are written before the body, so
+  with Nagle's algorithm the body would wait for the client's delayed
+  ACK of the headers, up to 40ms per response. TCP_NODELAY sends it
+  right away
+
+  """
+  protocol_version = 'HTTP/1.1'
+  timeout = KEEP_ALIVE_TIMEOUT
+
+  def setup(self):
+    WSGIRequestHandler.setup(self)
+    self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+  def handle(self):
+    """Handle the first request on a new connection"""
+    self.handleNext()
+
+  def handleNext(self):
+    """
+    Handle one request on the connection
+
+    Returns: True if the connection stays open for another request
+
+    """
+    self.close_connection = 1
+    try:
+      self.handle_one_request()
+    except socket.error as e:
+      # the client went away or stopped in the middle of the request
+      self.connection_dropped(e)
+      self.close_connection = 1
+    return not self.close_connection
+
+  def hasBufferedData(self):
+    """Return True if the start of the next request has already been
+    read from the socket"""
+    return self.rfile._rbuf.tell() > 0
+
+  def finish(self):
+    """Leave the connection open after a request, see close"""
+    pass
+
+  def close(self):
+    """Flush and close the handler's files once the connection is
+    done"""
+    WSGIRequestHandler.finish(self)
+
+  def log_request(self, *args):
+    pass
+
+
+class ThreadPoolMixIn():
+  """
+  Serve each request on one of a fixed set of worker threads
+
+  Unlike SocketServer.ThreadingMixIn, threads are started once and
+  reused, and the number of requests served at once is capped at
+  numWorkers. Requests beyond that wait in the queue until a worker is
+  free.
+
+  A worker only holds a keep-alive connection while it serves a
+  request. The connection then goes to the idle set, which one thread
+  watches with poll. As soon as the next request arrives, the
+  connection is queued for the workers again, and connections that
+  stay idle for keepAliveTimeout seconds are closed. So the number of
+  open connections is not bound by the number of workers.
+
+  Note: the request handler has to have handleNext, hasBufferedData
+  and close, as KeepAliveRequestHandler does
+
+  """
+  numWorkers = WORKERS
+  keepAliveTimeout = KEEP_ALIVE_TIMEOUT
+
+  def startWorkers(self):
+    """Start the worker threads and the thread watching idle
+    connections"""
+    self.connections = Queue()
+    # idle connections by file descriptor, oldest first
+    self.idle = OrderedDict()
+    # connections handed back by the workers, for the watcher to add
+    self.newIdle = Queue()
+    self.poller = select.poll()
+    # written to wake the watcher when a connection is handed back
+    self.wakeReader, self.wakeWriter = socket.socketpair()
+    self.poller.register(self.wakeReader, select.POLLIN)
+    self.stopping = False
+    self.watcher = threading.Thread(target=self.watchIdle)
+    self.watcher.daemon = True
+    self.watcher.start()
+    self.workers = []
+    for index in range(self.numWorkers):
+      worker = threading.Thread(target=self.serveConnections)
+      worker.daemon = True
+      worker.start()
+      self.workers.append(worker)
+
+  def serveConnections(self):
+    """
+    Worker thread: serve one request of each queued connection until
+    None is queued
+
+    Note: a connection without a handler is new, and the handler is
+    made for it here
+
+    """
+    while True:
+      item = self.connections.get()
+      if item is None:
+        return
+      request, clientAddress, handler = item
+      try:
+        if handler is None:
+          handler = self.RequestHandlerClass(request, clientAddress, self)
+          keepOpen = not handler.close_connection
+        else:
+          keepOpen = handler.handleNext()
+      except Exception:
+        self.handle_error(request, clientAddress)
+        keepOpen = False
+      if keepOpen:
+        self.keepIdle(request, clientAddress, handler)
+      else:
+        self.closeConnection(request, handler)
+
+  def keepIdle(self, request, clientAddress, handler):
+    """Hand a keep-alive connection to the watcher until its next
+    request arrives"""
+    if handler.hasBufferedData():
+      # the client sent its next request before this one was answered
+      self.connections.put((request, clientAddress, handler))
+      return
+    self.newIdle.put((request, clientAddress, handler))
+    self.wakeWriter.send('x')
+
+  def closeConnection(self, request, handler):
+    """Close a connection and its handler"""
+    try:
+      if handler is not None:
+        handler.close()
+    except socket.error:
+      pass
+    self.shutdown_request(request)
+
+  def watchIdle(self):
+    """
+    Watcher thread: queue idle connections for the workers as soon as
+    their next request arrives, and close the ones idle for too long
+
+    Note: only this thread changes self.idle and self.poller, so
+    neither needs a lock
+
+    """
+    wakeFd = self.wakeReader.fileno()
+    while not self.stopping:
+      timeout = IDLE_CHECK_INTERVAL
+      if self.idle:
+        since = self.idle.itervalues().next()[3]
+        timeout = min(max(since + self.keepAliveTimeout - time.time(), 0),
+                      timeout)
+      events = self.poller.poll(timeout * 1000)
+      for fd, event in events:
+        if fd == wakeFd:
+          self.wakeReader.recv(4096)
+          continue
+        item = self.idle.pop(fd, None)
+        if item is None:
+          continue
+        self.poller.unregister(fd)
+        self.connections.put(item[:3])
+      while not self.newIdle.empty():
+        request, clientAddress, handler = self.newIdle.get()
+        fd = request.fileno()
+        self.idle[fd] = (request, clientAddress, handler, time.time())
+        self.poller.register(fd, select.POLLIN)
+      now = time.time()
+      while self.idle:
+        fd, item = self.idle.iteritems().next()
+        if now - item[3] < self.keepAliveTimeout:
+          break
+        del self.idle[fd]
+        self.poller.unregister(fd)
+        self.closeConnection(item[0], item[2])
+
+  def getStats(self):
+    """Return a dictionary of the workers, the requests waiting for
+    one and the idle keep-alive connections"""
+    return {'workers': self.numWorkers,
+            'queued': self.connections.qsize(),
+            'idle': len(self.idle)}
+
+  def process_request(self, request, client_address):
+    """Hand a new connection to the workers"""
+    self.connections.put((request, client_address, None))
+
+  def stopWorkers(self):
+    """Stop the workers once the queued requests are served, and close
+    the idle connections"""
+    for worker in self.workers:
+      self.connections.put(None)
+    for worker in self.workers:
+      worker.join()
+    self.stopping = True
+    self.wakeWriter.send('x')
+    self.watcher.join()
+    for request, clientAddress, handler, since in self.idle.values():
+      self.closeConnection(request, handler)
+    self.idle.clear()
+
+
+class ThreadPoolWSGIServer(ThreadPoolMixIn, BaseWSGIServer):
+  """
+  WSGI server that serves the bridge on a pool of worker threads
+
+  Note: the workers are threads in one process rather than forked
+  processes on purpose. The bridge keeps each client's session
+  (sequence numbers, reorder buffer and connection to Tor) in memory,
+  so every request of a session has to reach the same process. Threads
+  share the session table and each session's lock keeps two requests
+  of one client from being handled at once.
+
+  Note: idle keep-alive connections do not hold a worker, so workers
+  only have to cover the requests being served at once, e.g. long
+  polls and requests waiting on Tor, not every open connection
+
+  """
+  multithread = True
+
+  def __init__(self, host, port, app, workers=WORKERS,
+               keepAliveTimeout=KEEP_ALIVE_TIMEOUT):
+    """
+    Parameters:
+    host, port- the address to listen on
+    app- the WSGI application to serve, i.e. the flask app
+    workers- the number of worker threads
+    keepAliveTimeout- seconds an idle keep-alive connection stays open
+
+    """
+    BaseWSGIServer.__init__(self, host, port, app,
+                            handler=KeepAliveRequestHandler)
+    self.numWorkers = workers
+    self.keepAliveTimeout = keepAliveTimeout
+    self.startWorkers()
+
+  def server_close(self):
+    BaseWSGIServer.server_close(self)
+    self.stopWorkers()
@@ -1,11 +1,33 @@
 import unittest
 
 import tests.verifyUrlEncode
+import tests.verifyBuffer
 import tests.verifyFrame
+import tests.verifyConnection
+import tests.verifyScheduler
+import tests.verifySegmenter
+import tests.verifySession
+import tests.verifyHeaderCodec
+import tests.verifyTorWriter
+import tests.verifyRetransmit
+import tests.verifyCongestion
+import tests.verifyEncoders
+import tests.verifyWsgiServer
 
 suite = unittest.TestLoader()
 suite = suite.loadTestsFromModule(tests.verifyUrlEncode)
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyBuffer))
 suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyFrame))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyConnection))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyScheduler))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifySegmenter))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifySession))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyHeaderCodec))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyTorWriter))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyRetransmit))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyCongestion))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyEncoders))
+suite.addTest(unittest.TestLoader().loadTestsFromModule(tests.verifyWsgiServer))
 
 if __name__ == "__main__":
   unittest.TextTestRunner().run(suite)
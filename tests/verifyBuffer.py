@@ -2,8 +2,10 @@
 # Fall 2013
 # HTPT Pluggable Transport
 
+import random
 import unittest
 
+from htpt import buffers
 from htpt import constants
 from htpt import frame
 
@@ -135,3 +137,183 @@ class TestFrame(unittest.TestCase):
     self.framer.recvFrame('hello', 0)
     self.framer.flushBuffer()
     self.assertEqual(self.uploadedData, 'hello')
+
+
+class TestRingBuffer(unittest.TestCase):
+  """Test that buffers.Buffer reorders frames as the ring wraps"""
+
+  def setUp(self):
+    self.uploadedData = ''
+    self.buffer = buffers.Buffer(minSeqNum=0)
+    self.buffer.addCallback(self.recvData)
+
+  def recvData(self, data):
+    self.uploadedData += str(data)
+
+  def send(self, seqNums):
+    for seqNum in seqNums:
+      self.buffer.recvData(str(seqNum) + ',', seqNum % constants.MAX_SEQ_NUM)
+
+  def expected(self, start, stop):
+    return ''.join([str(seqNum) + ',' for seqNum in range(start, stop)])
+
+  def test_inOrder(self):
+    """Verify that in order frames are delivered around the ring"""
+    self.send(range(3 * constants.BUFFER_SIZE + 5))
+    self.assertEqual(self.uploadedData,
+                     self.expected(0, 3 * constants.BUFFER_SIZE + 5))
+    self.assertEqual(self.buffer.head, 5)
+
+  def test_getAck(self):
+    """Verify the cumulative ACK and SACK bitmap of held frames"""
+    credit = constants.MAX_BUFFERED_BYTES / constants.CREDIT_UNIT
+    self.assertEqual(buffers.Buffer().getAck(), None)
+    self.assertEqual(self.buffer.getAck(), (0, 0, credit))
+    self.send([0, 1, 3, 4, 6, 40])
+    # 2 is missing, 3 and 4 are held and so is 6 (bit 3)
+    self.assertEqual(self.buffer.getAck()[:2], (2, 1 | 1<<1 | 1<<3))
+    self.send([2])
+    self.assertEqual(self.buffer.getAck()[:2], (5, 1))
+    self.send([5, 6])
+    # 40 is beyond the bitmap
+    self.assertEqual(self.buffer.getAck()[:2], (7, 0))
+
+  def test_credit(self):
+    """Verify that the credit is the free part of the byte budget"""
+    self.buffer = buffers.Buffer(minSeqNum=0,
+                                 maxBufferedBytes=4 * constants.CREDIT_UNIT)
+    self.buffer.addCallback(self.recvData)
+    self.assertEqual(self.buffer.getAck()[2], 4)
+    self.buffer.recvData('x' * (constants.CREDIT_UNIT + 1), 1)
+    self.assertEqual(self.buffer.getAck()[2], 2)
+    self.buffer.recvData('', 0)
+    self.assertEqual(self.buffer.getAck(), (2, 0, 4))
+
+  def test_outOfOrder(self):
+    """Verify that reversed and shuffled frames are held until the gap
+    before them is filled"""
+    size = constants.BUFFER_SIZE
+    self.send(reversed(range(1, size)))
+    self.assertEqual(self.uploadedData, '')
+    self.send([0])
+    self.assertEqual(self.uploadedData, self.expected(0, size))
+    seqNums = range(size, 3 * size)
+    random.seed(5)
+    for start in range(0, len(seqNums), 64):
+      window = seqNums[start:start + 64]
+      random.shuffle(window)
+      self.send(window)
+    self.assertEqual(self.uploadedData, self.expected(0, 3 * size))
+
+  def test_window(self):
+    """Verify that frames outside the window are refused and do not
+    overwrite a slot in use"""
+    self.send([1])
+    self.assertFalse(self.buffer.recvData('x', constants.BUFFER_SIZE))
+    self.assertFalse(self.buffer.recvData('x', constants.BUFFER_SIZE + 5))
+    self.send([0])
+    self.assertEqual(self.uploadedData, '0,1,')
+    self.assertEqual(self.buffer.getStats()['droppedFrames'], 2)
+
+  def test_duplicate(self):
+    """Verify that frames received twice are taken once and counted as
+    duplicates rather than drops"""
+    self.send([0, 2])
+    # still waiting in the buffer
+    self.assertTrue(self.buffer.recvData('x', 2))
+    self.send([1])
+    # already passed up
+    self.assertTrue(self.buffer.recvData('x', 0))
+    self.assertTrue(self.buffer.recvData('x', 2))
+    self.assertEqual(self.uploadedData, '0,1,2,')
+    stats = self.buffer.getStats()
+    self.assertEqual(stats['duplicateFrames'], 3)
+    self.assertEqual(stats['droppedFrames'], 0)
+    # too far behind to tell apart from too far ahead
+    self.assertFalse(self.buffer.recvData('x', 3 - constants.BUFFER_SIZE - 1
+                                          + constants.MAX_SEQ_NUM))
+
+  def test_byteBudget(self):
+    """Verify that frames after a gap are limited by bytes, that the
+    fill level follows them and that the head frame is always taken"""
+    self.buffer = buffers.Buffer(minSeqNum=0, maxBufferedBytes=100)
+    self.buffer.addCallback(self.recvData)
+    self.assertTrue(self.buffer.recvData('a' * 40, 1))
+    self.assertFalse(self.buffer.isCongested())
+    self.assertTrue(self.buffer.recvData('b' * 40, 2))
+    self.assertTrue(self.buffer.isCongested())
+    self.assertAlmostEqual(self.buffer.getFillLevel(), 0.8)
+    self.assertFalse(self.buffer.recvData('c' * 40, 3))
+    stats = self.buffer.getStats()
+    self.assertEqual(stats['bufferedFrames'], 2)
+    self.assertEqual(stats['bufferedBytes'], 80)
+    self.assertEqual(stats['droppedFrames'], 1)
+    self.assertTrue(self.buffer.recvData('z' * 200, 0))
+    self.assertEqual(self.uploadedData, 'z' * 200 + 'a' * 40 + 'b' * 40)
+    self.assertEqual(self.buffer.getFillLevel(), 0)
+    self.assertEqual(self.buffer.getStats()['peakBufferedBytes'], 80)
+    # the dropped frame can be sent again
+    self.assertTrue(self.buffer.recvData('c' * 40, 3))
+    self.assertEqual(self.uploadedData[-40:], 'c' * 40)
+
+  def test_maxFlushSize(self):
+    """Verify that frames released by a filled gap are passed up in
+    calls of at most maxFlushSize bytes"""
+    calls = []
+    self.buffer = buffers.Buffer(minSeqNum=0, maxFlushSize=10)
+    self.buffer.addCallback(lambda data: calls.append(str(data)))
+    for seqNum in range(1, 8):
+      self.buffer.recvData('abcd', seqNum)
+    self.buffer.recvData('x' * 12, 8)
+    self.buffer.recvData('', 9)
+    self.buffer.recvData('ef', 10)
+    self.assertEqual(calls, [])
+    self.buffer.recvData('0', 0)
+    self.assertEqual(calls, ['0abcdabcd', 'abcdabcd', 'abcdabcd', 'abcd',
+                             'x' * 12, 'ef'])
+    self.assertEqual(self.buffer.minAcceptableSeqNum, 11)
+
+  def test_wrapSeqNum(self):
+    """Verify that delivery continues when sequence numbers wrap"""
+    start = constants.MAX_SEQ_NUM - 10
+    self.buffer = buffers.Buffer(minSeqNum=start)
+    self.buffer.addCallback(self.recvData)
+    seqNums = range(start, start + 20)
+    self.send(reversed(seqNums))
+    self.assertEqual(self.uploadedData,
+                     ''.join([str(seqNum) + ',' for seqNum in seqNums]))
+    self.assertEqual(self.buffer.minAcceptableSeqNum, 10)
+
+  def test_wrapExtSeqNum(self):
+    """Verify that delivery continues when 32-bit sequence numbers wrap,
+    and that the window is found the same way on either side of it"""
+    start = constants.MAX_EXT_SEQ_NUM - 10
+    self.buffer = buffers.Buffer(minSeqNum=start,
+                                 maxSeqNum=constants.MAX_EXT_SEQ_NUM)
+    self.buffer.addCallback(self.recvData)
+    self.assertTrue(self.buffer.isSeqNumInBuffer(start))
+    self.assertTrue(self.buffer.isSeqNumInBuffer(constants.BUFFER_SIZE - 11))
+    self.assertFalse(self.buffer.isSeqNumInBuffer(constants.BUFFER_SIZE - 9))
+    self.assertFalse(self.buffer.isSeqNumInBuffer(start - 1))
+    # 65535 is no longer where the sequence numbers wrap
+    self.assertFalse(self.buffer.isSeqNumInBuffer(constants.MAX_SEQ_NUM))
+    seqNums = range(start, start + 20)
+    for seqNum in reversed(seqNums):
+      self.buffer.recvData(str(seqNum) + ',',
+                           seqNum % constants.MAX_EXT_SEQ_NUM)
+    self.assertEqual(self.uploadedData, self.expected(start, start + 20))
+    self.assertEqual(self.buffer.minAcceptableSeqNum, 10)
+    self.assertEqual(self.buffer.getAck()[0], 10)
+
+  def test_setMaxSeqNum(self):
+    """Verify that the buffer moves to the wider space mid session"""
+    self.buffer.recvData('a', 0)
+    self.buffer.setMaxSeqNum(constants.MAX_EXT_SEQ_NUM)
+    self.assertEqual(self.buffer.maxAcceptableSeqNum,
+                     1 + constants.BUFFER_SIZE)
+    self.buffer.minAcceptableSeqNum = constants.MAX_SEQ_NUM - 1
+    self.buffer.recvData('b', constants.MAX_SEQ_NUM - 1)
+    # 65535 is a sequence number of its own rather than 0 again
+    self.buffer.recvData('c', constants.MAX_SEQ_NUM)
+    self.assertEqual(self.buffer.minAcceptableSeqNum,
+                     constants.MAX_SEQ_NUM + 1)
@@ -0,0 +1,46 @@
+# Georgia Tech
+# Spring 2014
+# verifyCongestion.py: unit tests for the congestion module
+
+import unittest
+
+from htpt import congestion
+
+
+class TestCongestionWindow(unittest.TestCase):
+  """Test that the request window grows and shrinks by AIMD"""
+
+  def setUp(self):
+    self.window = congestion.CongestionWindow(4, 1, 16)
+
+  def test_increase(self):
+    """Verify that the window opens by one request per round trip"""
+    for index in range(4):
+      self.window.onResponse()
+    self.assertEqual(self.window.getWindow(), 4)
+    self.window.onResponse()
+    self.assertEqual(self.window.getWindow(), 5)
+    for index in range(1000):
+      self.window.onResponse()
+    self.assertEqual(self.window.getWindow(), 16)
+
+  def test_decrease(self):
+    """Verify that losses halve the window once per round trip"""
+    self.window.onLoss()
+    self.assertEqual(self.window.getWindow(), 2)
+    # losses from the same round trip are ignored
+    self.window.onLoss()
+    self.assertEqual(self.window.getWindow(), 2)
+    self.window.onResponse()
+    self.window.onResponse()
+    self.window.onLoss()
+    self.assertEqual(self.window.getWindow(), 1)
+    self.window.onResponse()
+    self.window.onLoss()
+    self.assertEqual(self.window.getWindow(), 1)
+    self.assertEqual(self.window.getStats()['losses'], 4)
+    self.assertEqual(self.window.getStats()['decreases'], 3)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,198 @@
+# Georgia Tech
+# Spring 2014
+# verifyConnection.py: unit tests for the connection module
+
+import socket
+import threading
+import time
+import unittest
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from htpt import congestion
+from htpt import connection
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+  """Echo the path and cookies back over an HTTP/1.1 connection"""
+  protocol_version = 'HTTP/1.1'
+
+  def do_GET(self):
+    self.server.ports.append(self.client_address[1])
+    if self.path.startswith('/slow'):
+      # record how many requests are being served at the same time
+      self.server.lock.acquire()
+      self.server.active += 1
+      self.server.maxActive = max(self.server.maxActive, self.server.active)
+      self.server.lock.release()
+      time.sleep(0.1)
+      self.server.lock.acquire()
+      self.server.active -= 1
+      self.server.lock.release()
+    if self.path.startswith('/hang'):
+      time.sleep(0.5)
+    body = self.path + '|' + str(self.headers.getheader('Cookie'))
+    self.send_response(200)
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def log_message(self, *args):
+    pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+  daemon_threads = True
+
+
+class TestConnection(unittest.TestCase):
+  """Test the keep-alive connection pool against a local server"""
+
+  def setUp(self):
+    self.server = ThreadingHTTPServer(('localhost', 0), KeepAliveHandler)
+    self.server.ports = []
+    self.server.lock = threading.Lock()
+    self.server.active = 0
+    self.server.maxActive = 0
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+    self.address = 'localhost:{}'.format(self.server.server_address[1])
+    self.pool = connection.ConnectionPool(self.address, size=1)
+
+  def tearDown(self):
+    self.pool.close()
+    self.server.shutdown()
+    self.server.server_close()
+
+  def test_requestPath(self):
+    """Verify that the path and query keep their case"""
+    url = 'http://localhost:5000/?qs=0a6162AbCdEf'
+    self.assertEqual(connection.requestPath(url), '/?qs=0a6162AbCdEf')
+    self.assertEqual(connection.requestPath('http://localhost'), '/')
+
+  def test_cookieHeader(self):
+    """Verify that cookies survive a round trip through one header"""
+    cookies = ['Cookie: YWJj=ZGVm', 'Cookie: a2V5Rm9yUGFk+GluZw+=eHl6']
+    header = connection.cookieHeader(cookies)
+    self.assertEqual(header, 'YWJj=ZGVm; a2V5Rm9yUGFk+GluZw+=eHl6')
+    self.assertEqual(connection.splitCookieHeader(header), cookies)
+    self.assertEqual(connection.splitCookieHeader(None), [])
+
+  def test_reuse(self):
+    """Verify that consecutive requests share a single connection"""
+    for index in range(5):
+      encoded = {'url':'http://' + self.address + '/?qs=' + str(index),
+                 'cookie':['Cookie: YWJj=ZGVm']}
+      body = self.pool.request(encoded)
+      self.assertEqual(body, '/?qs={}|YWJj=ZGVm'.format(index))
+    self.assertEqual(len(set(self.server.ports)), 1)
+    self.assertEqual(self.pool.numConnections, 1)
+
+  def test_reconnect(self):
+    """Verify that a connection dropped by the server is replaced"""
+    encoded = {'url':'http://' + self.address + '/', 'cookie':[]}
+    self.pool.request(encoded)
+    # close the socket under the pool as an idle timeout would
+    conn = self.pool.idle.get()
+    conn.sock.close()
+    self.pool.releaseConnection(conn)
+    self.assertEqual(self.pool.request(encoded), '/|None')
+    self.assertEqual(len(set(self.server.ports)), 2)
+    self.assertEqual(self.pool.numConnections, 1)
+
+  def test_timeout(self):
+    """Verify that a request which times out on a reused connection is
+    not sent again, since the bridge may still act on it"""
+    pool = connection.ConnectionPool(self.address, size=1, timeout=0.2)
+    pool.request({'url':'http://' + self.address + '/', 'cookie':[]})
+    self.assertRaises(socket.timeout, pool.request,
+                      {'url':'http://' + self.address + '/hang',
+                       'cookie':[]})
+    time.sleep(0.6)
+    self.assertEqual(len(self.server.ports), 2)
+    self.assertEqual(pool.numConnections, 0)
+    pool.close()
+
+  def test_window(self):
+    """Verify that the window keeps several requests in flight and
+    delivers every response"""
+    responses = []
+    pool = connection.ConnectionPool(self.address, size=3)
+    window = connection.RequestWindow(pool, responses.append, size=3)
+    for index in range(9):
+      window.send({'url':'http://' + self.address + '/slow' + str(index),
+                   'cookie':[]})
+    window.wait()
+    window.close()
+    pool.close()
+    self.assertEqual(sorted(responses),
+                     ['/slow{}|None'.format(index) for index in range(9)])
+    self.assertEqual(self.server.maxActive, 3)
+
+  def test_congestionWindow(self):
+    """Verify that the congestion window limits the requests in flight"""
+    responses = []
+    pool = connection.ConnectionPool(self.address, size=4)
+    window = connection.RequestWindow(pool, responses.append, size=4,
+                                      congestion=
+                                      congestion.CongestionWindow(2, 1, 4))
+    self.assertEqual(window.getLimit(), 2)
+    for index in range(6):
+      window.send({'url':'http://' + self.address + '/slow' + str(index),
+                   'cookie':[]})
+    window.wait()
+    window.close()
+    pool.close()
+    self.assertEqual(len(responses), 6)
+    self.assertEqual(self.server.maxActive, 2)
+    self.assertEqual(window.getLimit(), 4)
+
+  def test_windowError(self):
+    """Verify that a failed request is reported to the sender"""
+    pool = connection.ConnectionPool('localhost:1', size=1)
+    window = connection.RequestWindow(pool, lambda body: None, size=1)
+    window.send({'url':'http://localhost:1/', 'cookie':[]})
+    self.assertRaises(connection.ConnectionError, window.wait)
+    window.close()
+
+  def test_windowLost(self):
+    """Verify that up to maxLost failed requests in a row are only
+    counted"""
+    pool = connection.ConnectionPool('localhost:1', size=1)
+    window = connection.RequestWindow(pool, lambda body: None, size=1,
+                                      maxLost=2)
+    for index in range(2):
+      window.send({'url':'http://localhost:1/', 'cookie':[]})
+    window.wait()
+    self.assertEqual(window.lost, 2)
+    window.send({'url':'http://localhost:1/', 'cookie':[]})
+    self.assertRaises(connection.ConnectionError, window.wait)
+    window.close()
+
+  def test_windowCallbackError(self):
+    """Verify that a response the callback fails on is not counted as a
+    lost request and does not close the congestion window"""
+    def callback(body):
+      if 'bad' in body:
+        raise ValueError(body)
+    cwnd = congestion.CongestionWindow(initial=4)
+    window = connection.RequestWindow(self.pool, callback, size=1,
+                                      maxLost=1, congestion=cwnd)
+    window.send({'url':'http://' + self.address + '/bad', 'cookie':[]})
+    window.wait()
+    self.assertEqual((window.lost, window.dropped), (0, 1))
+    self.assertEqual(cwnd.getStats()['losses'], 0)
+    self.assertTrue(cwnd.window > 4)
+    window.send({'url':'http://' + self.address + '/good', 'cookie':[]})
+    window.wait()
+    self.assertEqual(window.droppedInARow, 0)
+    for index in range(2):
+      window.send({'url':'http://' + self.address + '/bad', 'cookie':[]})
+    self.assertRaises(ValueError, window.wait)
+    self.assertEqual(window.lost, 0)
+    window.close()
+
+
+if __name__ == '__main__':
+  unittest.main()
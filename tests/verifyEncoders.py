@@ -0,0 +1,109 @@
+# Georgia Tech
+# Spring 2014
+# verifyEncoders.py: unit tests for the encoders module
+
+import os
+import unittest
+
+from htpt import encoders
+from htpt import imageEncode
+from htpt import urlEncode
+
+
+class TestEncoderRegistry(unittest.TestCase):
+  """Test the registry of encoders and the choice between them"""
+
+  def setUp(self):
+    self.registry = encoders.EncoderRegistry()
+
+  def makeEncoder(self, name, capacity, expansion, cost, kind='url'):
+    encoder = encoders.Encoder(name, kind, lambda data: data,
+                               lambda data: data, capacity)
+    encoder.expansion = expansion
+    encoder.costPerByte = cost
+    return encoder
+
+  def test_register(self):
+    """Verify that encoders are found by name and kind"""
+    encoder = self.makeEncoder('small', lambda maxSize: 10, 2.0, 1e-6)
+    self.registry.register(encoder)
+    self.assertIs(self.registry.get('small'), encoder)
+    self.assertRaises(encoders.EncoderException, self.registry.register,
+                      encoder)
+    self.assertRaises(encoders.EncoderException, self.registry.get, 'none')
+    self.assertEqual(self.registry.getEncoders('url'), [encoder])
+    self.assertEqual(self.registry.getEncoders('image'), [])
+
+  def test_countRequests(self):
+    encoder = self.makeEncoder('small', lambda maxSize: maxSize / 10, 2.0, 0)
+    self.assertEqual(encoder.countRequests(0), 1)
+    self.assertEqual(encoder.countRequests(102), 1)
+    self.assertEqual(encoder.countRequests(103), 2)
+    self.assertEqual(encoder.countRequests(103, 2000), 1)
+    unlimited = self.makeEncoder('image', None, 2.0, 0, 'image')
+    self.assertEqual(unlimited.countRequests(10 ** 6), 1)
+
+  def test_choose(self):
+    """Verify that fewer requests win, then less expansion, then less
+    CPU"""
+    self.registry.register(self.makeEncoder('small', lambda maxSize: 100,
+                                            1.5, 1e-6))
+    self.registry.register(self.makeEncoder('large', lambda maxSize: 400,
+                                            3.0, 1e-6))
+    self.registry.register(self.makeEncoder('slow', lambda maxSize: 100,
+                                            1.5, 1e-3))
+    self.assertEqual(self.registry.choose('url', 50), 'small')
+    self.assertEqual(self.registry.choose('url', 300), 'large')
+    self.assertEqual(self.registry.choose('url', 50, ['large', 'slow']),
+                     'slow')
+    self.assertRaises(encoders.EncoderException, self.registry.choose,
+                      'image', 50)
+    self.registry.get('small').available = False
+    self.assertEqual(self.registry.choose('url', 50), 'slow')
+
+  def test_nearTie(self):
+    """Verify that measurements within TIE_TOLERANCE go to the first of
+    names, whichever happened to measure lower"""
+    self.registry.register(self.makeEncoder('bmp', None, 1.0, 1.05e-6,
+                                            'image'))
+    self.registry.register(self.makeEncoder('png', None, 1.02, 1e-6,
+                                            'image'))
+    self.assertEqual(self.registry.choose('image', 50, ['bmp', 'png']),
+                     'bmp')
+    self.assertEqual(self.registry.choose('image', 50, ['png', 'bmp']),
+                     'png')
+    # a clear difference still wins
+    self.registry.get('png').costPerByte = 0.5e-6
+    self.assertEqual(self.registry.choose('image', 50, ['bmp', 'png']),
+                     'png')
+
+  def test_measure(self):
+    """Verify that the real encoders round trip and are measured"""
+    registry = encoders.makeRegistry()
+    self.assertEqual(sorted([encoder.name for encoder in
+                             registry.getEncoders('url')]),
+                     sorted(urlEncode.AVAILABLE_TYPES))
+    market = registry.get('market')
+    self.assertEqual(market.getCapacity(), urlEncode.getCapacity('market'))
+    market.measure()
+    self.assertTrue(market.available)
+    # hex in the url, base64 in the cookies
+    self.assertTrue(1 < market.expansion < 3)
+    self.assertTrue(market.costPerByte > 0)
+    self.assertEqual(registry.choose('url', 100, ['market']), 'market')
+
+  def test_identify(self):
+    """Verify that images are told apart by their first bytes"""
+    registry = encoders.makeRegistry()
+    data = os.urandom(100)
+    for imageType in ['bmp', 'png']:
+      image = registry.get(imageType).encode(data)
+      self.assertEqual(registry.identify(image), imageType)
+      self.assertEqual(str(registry.get(imageType).decode(image)), data)
+    self.assertEqual(registry.identify('not an image'), None)
+    self.assertEqual(registry.get('png').mimeType,
+                     imageEncode.MIME_TYPES['png'])
+
+
+if __name__ == '__main__':
+  unittest.main()
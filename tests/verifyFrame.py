@@ -2,6 +2,7 @@
 # Fall 2013
 # HTPT Pluggable Transport
 
+import struct
 import unittest
 
 from htpt import constants
@@ -29,6 +30,14 @@ class TestSeqNum(unittest.TestCase):
     self.SN = frame.SeqNumber(65534)
     self.assertEqual(0, self.SN.getSequenceAndIncrement())
 
+  def test_perAssembler(self):
+    """Ensure that every assembler numbers its frames on its own"""
+    first = frame.Assembler(sessionID=1)
+    second = frame.Assembler(sessionID=2)
+    self.assertEqual([first.getSeqNum() for i in range(3)], [0, 1, 2])
+    self.assertEqual(second.getSeqNum(), 0)
+    self.assertEqual(first.getSeqNum(), 3)
+
 
 class TestSessionID(unittest.TestCase):
   """Test sessionID module and lock"""
@@ -52,6 +61,51 @@ class TestSessionID(unittest.TestCase):
     self.assertEqual(0, self.SI.getSessionIDAndIncrement())
 
 
+class TestSessionIDAllocator(unittest.TestCase):
+  """Test that session IDs are handed out once and reused when freed"""
+
+  def test_allocate(self):
+    """Ensure that IDs are unique while live and reused oldest first"""
+    allocator = frame.SessionIDAllocator(1, 5)
+    self.assertEqual([allocator.allocate() for index in range(4)],
+                     [1, 2, 3, 4])
+    self.assertRaises(frame.FramingException, allocator.allocate)
+    self.assertTrue(allocator.release(3))
+    self.assertTrue(allocator.release(1))
+    self.assertFalse(allocator.release(1))
+    self.assertFalse(allocator.release(42))
+    self.assertFalse(allocator.isLive(3))
+    self.assertEqual(allocator.allocate(), 3)
+    self.assertEqual(allocator.allocate(), 1)
+    stats = allocator.getStats()
+    self.assertEqual(stats['live'], 4)
+    self.assertEqual(stats['occupancy'], 1.0)
+    self.assertEqual(stats['allocated'], 6)
+    self.assertEqual(stats['released'], 2)
+    self.assertEqual(stats['exhausted'], 1)
+
+  def test_sessionID(self):
+    """Ensure that 0 is never handed out, that the two header versions
+    get separate ranges and that released IDs come back"""
+    frame.SessionID.reset()
+    ids = [frame.SessionID.getSessionIDAndIncrement()
+           for index in range(constants.MAX_SESSION_NUM - 1)]
+    self.assertEqual(sorted(ids), range(1, constants.MAX_SESSION_NUM))
+    self.assertRaises(frame.FramingException,
+                      frame.SessionID.getSessionIDAndIncrement)
+    self.assertEqual(frame.SessionID.getExtSessionIDAndIncrement(),
+                     constants.MAX_SESSION_NUM)
+    self.assertTrue(frame.SessionID.releaseSessionID(7))
+    self.assertEqual(frame.SessionID.getSessionIDAndIncrement(), 7)
+    self.assertTrue(frame.SessionID.releaseSessionID(
+      constants.MAX_SESSION_NUM))
+    stats = frame.SessionID.getStats()
+    self.assertEqual(stats['sessionIDs']['live'],
+                     constants.MAX_SESSION_NUM - 1)
+    self.assertEqual(stats['extSessionIDs']['live'], 0)
+    frame.SessionID.reset()
+
+
 class TestAssemble(unittest.TestCase):
   """Test the validity of the Assemble framing module in htpt"""
 
@@ -173,6 +227,219 @@ class TestDisassemble(unittest.TestCase):
     self.assertEqual(self.output, '')
 
 
+class TestPacking(unittest.TestCase):
+  """Test that several frames can be carried by one url or image"""
+
+  def setUp(self):
+    self.Assembler = frame.Assembler(sessionID=3)
+    self.Disassembler = frame.Disassembler(self.dummyCallback)
+    self.downloadedData = ''
+
+  def dummyCallback(self, data):
+    # data is a memoryview or bytearray rather than a string
+    self.downloadedData += str(bytearray(data))
+
+  def test_assembleMany(self):
+    """Ensure that every packed frame has its own header and length"""
+    self.output = self.Assembler.assembleMany(['abc', '', 'defg'], more_data=1)
+    self.assertEqual(len(self.output), 3 * (constants.HEADER_SIZE +
+                                            constants.PACKED_LENGTH_SIZE) + 7)
+    self.Disassembler.retrieveHeaders(self.output[:constants.HEADER_SIZE])
+    self.assertEqual(self.Disassembler.flags, (1<<7 | 1<<4))
+    self.assertEqual(self.Disassembler.getSessionID(), 3)
+    self.assertRaises(frame.FramingException, self.Assembler.assembleMany,
+                      ['a' * (constants.MAX_PACKED_SIZE + 1)])
+
+  def test_disassemble(self):
+    """Ensure that packed frames are unpacked and reordered like frames
+    sent one at a time"""
+    first = self.Assembler.assemble('01')
+    packed = self.Assembler.assembleMany(['abc', '', 'defg'])
+    last = self.Assembler.assemble('xyz')
+    self.Disassembler.disassemble(first)
+    self.assertEqual(self.Disassembler.disassemble(last), 3)
+    self.assertEqual(self.downloadedData, '01')
+    self.assertEqual(self.Disassembler.disassemble(packed), 7)
+    self.assertEqual(self.downloadedData, '01abcdefgxyz')
+
+  def test_zeroCopy(self):
+    """Ensure that the data of a frame reaches the callback as a view on
+    the frame rather than a copy"""
+    received = []
+    self.Disassembler = frame.Disassembler(received.append)
+    framed = self.Assembler.assemble('payload')
+    self.Disassembler.disassemble(framed)
+    self.assertTrue(isinstance(received[0], memoryview))
+    self.assertEqual(received[0].tobytes(), 'payload')
+
+
+
+class TestAck(unittest.TestCase):
+  """Test acknowledgements piggybacked on frames and retransmission"""
+
+  def setUp(self):
+    self.Assembler = frame.Assembler(sessionID=3, reliable=True)
+    self.received = []
+    self.Disassembler = frame.Disassembler(self.dummyCallback, minSeqNum=0)
+
+  def dummyCallback(self, data):
+    self.received.append(str(bytearray(data)))
+
+  def test_assemble(self):
+    """Ensure that an ack follows the header and is not taken as data"""
+    framed = self.Assembler.assemble('abc', ack=(7, 1<<31 | 5, 3))
+    self.assertEqual(len(framed), constants.HEADER_SIZE +
+                     constants.ACK_SIZE + 3)
+    self.Disassembler.disassemble(framed)
+    self.assertEqual(self.Disassembler.getPeerAck(), (7, 1<<31 | 5, 3))
+    self.assertEqual(self.received, ['abc'])
+    self.Disassembler.disassemble(self.Assembler.assemble('d'))
+    self.assertEqual(self.Disassembler.getPeerAck(), None)
+
+  def test_assembleMany(self):
+    """Ensure that only the first packed frame carries the ack"""
+    packed = self.Assembler.assembleMany(['abc', 'de'], ack=(1, 2, 3))
+    self.assertEqual(len(packed), constants.ACK_SIZE + 5 + 2 *
+                     (constants.HEADER_SIZE + constants.PACKED_LENGTH_SIZE))
+    self.assertEqual(self.Disassembler.disassemble(packed), 5)
+    self.assertEqual(self.Disassembler.getPeerAck(), (1, 2, 3))
+    self.assertEqual(''.join(self.received), 'abcde')
+
+  def test_retransmit(self):
+    """Ensure that a lost frame is sent again with its sequence number
+    and fills the gap at the receiver"""
+    frames = [self.Assembler.assemble(data) for data in ['a', 'b', 'c']]
+    self.assertEqual(len(self.Assembler.unacked), 3)
+    # frame 'b' is lost
+    self.Disassembler.disassemble(frames[0])
+    self.Disassembler.disassemble(frames[2])
+    self.assertEqual(self.Disassembler.getAck()[:2], (1, 1))
+    self.Assembler.recvAck(self.Disassembler.getAck())
+    self.assertEqual(len(self.Assembler.unacked), 1)
+    self.Assembler.unacked.rto = 0
+    resend = self.Assembler.getRetransmits()
+    self.assertEqual(resend, [(1, 'b')])
+    seqNum, data = resend[0]
+    self.Disassembler.disassemble(self.Assembler.assemble(data, seqNum=seqNum))
+    self.assertEqual(''.join(self.received), 'abc')
+    self.Assembler.recvAck(self.Disassembler.getAck())
+    self.assertEqual(len(self.Assembler.unacked), 0)
+    # an assembler that is not reliable keeps nothing
+    self.assertEqual(frame.Assembler().getRetransmits(), [])
+
+  def test_unreliable(self):
+    """Ensure that an assembler leaves acks out and keeps nothing until
+    the peer has shown it understands acks"""
+    assembler = frame.Assembler(sessionID=3)
+    self.assertFalse(assembler.isReliable())
+    framed = assembler.assemble('abc', ack=(7, 5, 3))
+    self.assertEqual(len(framed), constants.HEADER_SIZE + 3)
+    self.assertEqual(frame.parseHeaders(framed)[2] & constants.ACK_FLAG, 0)
+    packed = assembler.assembleMany(['ab', 'c'], ack=(7, 5, 3))
+    self.assertEqual(len(packed), 3 + 2 *
+                     (constants.HEADER_SIZE + constants.PACKED_LENGTH_SIZE))
+    self.assertEqual(assembler.getRetransmits(), [])
+    self.assertIsNone(assembler.getRetransmitTimeout())
+    self.assertIsNone(assembler.getSendAllowance())
+    # no ack from the peer leaves it as it is
+    assembler.recvAck(None)
+    self.assertFalse(assembler.isReliable())
+    # the first ack from the peer turns acks and retransmission on
+    assembler.recvAck((4, 0, 64))
+    self.assertTrue(assembler.isReliable())
+    framed = assembler.assemble('d', ack=(7, 5, 3))
+    self.assertEqual(len(framed), constants.HEADER_SIZE +
+                     constants.ACK_SIZE + 1)
+    self.assertEqual(len(assembler.unacked), 1)
+
+
+class TestVersion(unittest.TestCase):
+  """Test version 2 headers and how they are agreed on"""
+
+  def setUp(self):
+    self.received = []
+
+  def dummyCallback(self, data):
+    self.received.append(str(bytearray(data)))
+
+  def test_assemble(self):
+    """Ensure that version 2 frames carry wide sequence numbers, session
+    IDs and acks and are read back by any disassembler"""
+    sessionID = constants.MAX_EXT_SESSION_NUM - 1
+    assembler = frame.Assembler(sessionID, reliable=True, version=2)
+    start = constants.MAX_EXT_SEQ_NUM - 2
+    assembler.seqNum.setSeqNum(start - 1)
+    disassembler = frame.Disassembler(self.dummyCallback, minSeqNum=start,
+                                      maxSeqNum=constants.MAX_EXT_SEQ_NUM)
+    ack = (constants.MAX_SEQ_NUM + 7, 3, 64)
+    framed = assembler.assemble('abc', ack=ack)
+    self.assertEqual(len(framed), constants.EXT_HEADER_SIZE +
+                     constants.EXT_ACK_SIZE + 3)
+    self.assertEqual(frame.parseHeaders(framed)[:2], (start, sessionID))
+    disassembler.disassemble(framed)
+    self.assertEqual(disassembler.getHeaderVersion(), 2)
+    self.assertEqual(disassembler.getSessionID(), sessionID)
+    self.assertEqual(disassembler.getPeerAck(), ack)
+    packed = assembler.assembleMany(['de', 'f', 'g'], ack=ack)
+    self.assertEqual(len(packed), constants.EXT_ACK_SIZE + 4 + 3 *
+                     (constants.EXT_HEADER_SIZE + constants.PACKED_LENGTH_SIZE))
+    self.assertEqual(disassembler.disassemble(packed), 4)
+    self.assertEqual(disassembler.getPeerAck(), ack)
+    # the sequence numbers wrapped at 2**32
+    self.assertEqual(assembler.seqNum.seqNum, 1)
+    self.assertEqual(''.join(self.received), 'abcdefg')
+    assembler.recvAck(disassembler.getAck())
+    self.assertEqual(len(assembler.unacked), 0)
+    self.assertRaises(frame.FramingException, assembler.setVersion, 3)
+
+  def test_negotiate(self):
+    """Ensure that a client asking with the SYN flag gets version 2
+    headers and an extended session ID, and that one which does not
+    keeps version 1"""
+    client = frame.Assembler(reliable=True)
+    connect = client.assemble('hello', SYN=1)
+    sender, receiver = frame.initServerConnection(connect, ['hello'],
+                                                  self.dummyCallback)
+    self.assertEqual(sender.getVersion(), 2)
+    self.assertTrue(sender.getSessionID() >= constants.MAX_SESSION_NUM)
+    reply = frame.Disassembler(self.dummyCallback)
+    reply.disassemble(sender.assemble('', ack=receiver.getAck()))
+    self.assertEqual(reply.getHeaderVersion(), 2)
+    self.assertEqual(reply.getSessionID(), sender.getSessionID())
+    client.recvAck(reply.getPeerAck())
+    self.assertEqual(len(client.unacked), 0)
+    client.setVersion(reply.getHeaderVersion())
+    client.setSessionID(reply.getSessionID())
+    # the bridge reads the client's frames past 16-bit sequence numbers
+    client.seqNum.setSeqNum(constants.MAX_SEQ_NUM - 2)
+    receiver.buffer.minAcceptableSeqNum = constants.MAX_SEQ_NUM - 1
+    for data in ['a', 'b', 'c']:
+      receiver.disassemble(client.assemble(data))
+    self.assertEqual(''.join(self.received), 'abc')
+    self.assertEqual(receiver.getAck()[0], constants.MAX_SEQ_NUM + 2)
+
+    old = frame.Assembler()
+    sender, receiver = frame.initServerConnection(old.assemble('hello'),
+                                                  ['hello'],
+                                                  self.dummyCallback)
+    self.assertEqual(sender.getVersion(), 1)
+    self.assertTrue(sender.getSessionID() < constants.MAX_SESSION_NUM)
+    self.assertFalse(sender.isReliable())
+    reply = frame.Disassembler(self.dummyCallback)
+    framed = sender.assemble('', ack=receiver.getAck())
+    # an old client gets frames in the format it knows: a 4 byte header
+    # and the data, with no ack
+    self.assertEqual(framed, struct.pack('!HBB', 0, sender.getSessionID(), 0))
+    reply.disassemble(framed)
+    self.assertEqual(reply.getHeaderVersion(), 1)
+    self.assertEqual(reply.getPeerAck(), None)
+    receiver.disassemble(old.assemble('up'))
+    framed = sender.assemble('down', more_data=1, ack=receiver.getAck())
+    self.assertEqual(framed, struct.pack('!HBB', 1, sender.getSessionID(),
+                                         constants.MORE_DATA_FLAG) + 'down')
+    self.assertEqual(sender.getRetransmits(), [])
+    self.assertIsNone(sender.getSendAllowance())
+
 
 if __name__ == "__main__":
   unittest.main()
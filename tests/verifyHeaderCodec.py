@@ -0,0 +1,98 @@
+# Georgia Tech
+# Spring 2014
+# verifyHeaderCodec.py: unit tests for the headerCodec module
+
+import struct
+import unittest
+
+from htpt import constants
+from htpt import headerCodec
+
+
+class TestHeaderCodec(unittest.TestCase):
+  """Test packing and unpacking of frame headers"""
+
+  def test_makeFlags(self):
+    """Verify that each keyword sets its bit and nothing else"""
+    self.assertEqual(headerCodec.makeFlags(), 0)
+    self.assertEqual(headerCodec.makeFlags(more_data=1, SYN=0), 1<<7)
+    self.assertEqual(headerCodec.makeFlags(SYN=1, long_poll=1), 1<<6 | 1<<5)
+    self.assertEqual(headerCodec.makeFlags(packed=1), 1<<4)
+    self.assertEqual(headerCodec.makeFlags(backpressure=1), 1<<3)
+    self.assertEqual(headerCodec.makeFlags(ack=1), 1<<2)
+
+  def test_packHeader(self):
+    """Verify the wire format matches the documented !HBB layout"""
+    header = headerCodec.packHeader(23, 10, 1<<7)
+    self.assertEqual(header, struct.pack('!HBB', 23, 10, 1<<7))
+    self.assertEqual(headerCodec.unpackHeader(header), (23, 10, 1<<7))
+    self.assertEqual(headerCodec.unpackHeader('xx' + header, 2), (23, 10, 1<<7))
+
+  def test_batch(self):
+    """Verify that a batch of headers round trips through one buffer"""
+    headers = [(index, index % 256, index % 2 << 7) for index in range(300)]
+    buf = headerCodec.packHeaders(headers)
+    self.assertEqual(len(buf), 300 * constants.HEADER_SIZE)
+    self.assertEqual(headerCodec.unpackHeaders(buf), headers)
+    self.assertEqual(headerCodec.unpackHeaders(str(buf), 2, 4), headers[1:3])
+    # reuse the buffer for a smaller batch after an offset
+    headerCodec.packHeaders(headers[:2], buf, 8)
+    self.assertEqual(headerCodec.unpackHeaders(buf, 2, 8), headers[:2])
+    frames = [headerCodec.packHeader(*header) + 'data' for header in headers]
+    self.assertEqual(headerCodec.unpackFrameHeaders(frames), headers)
+
+  def test_extBatch(self):
+    """Verify that a batch of version 2 headers round trips and matches
+    packExtHeader"""
+    headers = [(constants.MAX_EXT_SEQ_NUM - index, 0x10000 + index,
+                index % 2 << 7) for index in range(1, 300)]
+    expected = [(seqNum, sessionID, flags | constants.EXT_FLAG)
+                for seqNum, sessionID, flags in headers]
+    buf = headerCodec.packHeaders(headers, version=2)
+    self.assertEqual(len(buf), len(headers) * constants.EXT_HEADER_SIZE)
+    self.assertEqual(str(buf[:constants.EXT_HEADER_SIZE]),
+                     headerCodec.packExtHeader(*headers[0]))
+    self.assertEqual(headerCodec.unpackHeaders(buf, version=2), expected)
+    self.assertEqual(headerCodec.unpackHeaders(str(buf), 2, 8, version=2),
+                     expected[1:3])
+    frames = [headerCodec.packExtHeader(*header) + 'data'
+              for header in headers]
+    self.assertEqual(headerCodec.unpackFrameHeaders(frames, 2), expected)
+
+  def test_length(self):
+    buf = bytearray(4)
+    headerCodec.packLengthInto(buf, 2, 513)
+    self.assertEqual(headerCodec.unpackLength(buf, 2), 513)
+
+  def test_ack(self):
+    ack = headerCodec.packAck(65534, 1<<31 | 1, 8192)
+    self.assertEqual(len(ack), constants.ACK_SIZE)
+    self.assertEqual(headerCodec.unpackAck('xx' + ack, 2),
+                     (65534, 1<<31 | 1, 8192))
+
+  def test_extHeader(self):
+    """Verify that version 2 headers carry 32-bit sequence numbers and
+    24-bit session IDs, and that unpackAnyHeader reads both versions"""
+    header = headerCodec.packExtHeader(0x12345678, 0xabcdef, 1<<7)
+    self.assertEqual(len(header), constants.EXT_HEADER_SIZE)
+    # the first 4 bytes are laid out like a version 1 header
+    self.assertEqual(headerCodec.unpackHeader(header),
+                     (0x5678, 0xef, 1<<7 | constants.EXT_FLAG))
+    self.assertEqual(headerCodec.unpackAnyHeader('xx' + header, 2),
+                     (0x12345678, 0xabcdef, 1<<7 | constants.EXT_FLAG,
+                      constants.EXT_HEADER_SIZE))
+    self.assertEqual(headerCodec.unpackAnyHeader(
+      headerCodec.packHeader(23, 10, 0)), (23, 10, 0, constants.HEADER_SIZE))
+    buf = bytearray(10)
+    seqNum = constants.MAX_EXT_SEQ_NUM - 1
+    sessionID = constants.MAX_EXT_SESSION_NUM - 1
+    headerCodec.packExtHeaderInto(buf, 2, seqNum, sessionID, 0)
+    self.assertEqual(headerCodec.unpackAnyHeader(buf, 2)[:2],
+                     (seqNum, sessionID))
+    ack = headerCodec.packExtAck(seqNum, 5, 64)
+    self.assertEqual(len(ack), constants.EXT_ACK_SIZE)
+    self.assertEqual(headerCodec.unpackExtAck(ack), (seqNum, 5, 64))
+
+
+if __name__ == '__main__':
+  unittest.main()
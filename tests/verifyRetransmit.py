@@ -0,0 +1,148 @@
+# Georgia Tech
+# Spring 2014
+# verifyRetransmit.py: unit tests for the retransmit module
+
+import unittest
+
+from htpt import constants
+from htpt import retransmit
+
+
+class TestRetransmitQueue(unittest.TestCase):
+  """Test that unacked frames are kept and sent again"""
+
+  def setUp(self):
+    self.now = 100.0
+    self.queue = retransmit.RetransmitQueue(clock=lambda: self.now)
+
+  def send(self, seqNums):
+    for seqNum in seqNums:
+      self.queue.add(seqNum % constants.MAX_SEQ_NUM, str(seqNum))
+
+  def test_cumulativeAck(self):
+    """Verify that a cumulative ack forgets every frame before it"""
+    self.send(range(5))
+    self.assertEqual(self.queue.ack(3, 0), 3)
+    self.assertEqual(len(self.queue), 2)
+    self.assertEqual(self.queue.unackedBytes, 2)
+    # a stale ack changes nothing
+    self.assertEqual(self.queue.ack(1, 0), 0)
+    self.assertEqual(self.queue.ack(5, 0), 2)
+    self.assertEqual(len(self.queue), 0)
+
+  def test_wrap(self):
+    """Verify acks across the wrap of the sequence numbers"""
+    start = constants.MAX_SEQ_NUM - 2
+    self.send(range(start, start + 5))
+    self.assertEqual(self.queue.ack(1, 0), 3)
+    self.assertEqual(len(self.queue), 2)
+
+  def test_extWrap(self):
+    """Verify acks across the wrap of 32-bit sequence numbers"""
+    self.queue = retransmit.RetransmitQueue(clock=lambda: self.now,
+                                            maxSeqNum=constants.MAX_EXT_SEQ_NUM)
+    start = constants.MAX_EXT_SEQ_NUM - 2
+    for seqNum in range(start, start + 5):
+      self.queue.add(seqNum % constants.MAX_EXT_SEQ_NUM, str(seqNum))
+    self.assertEqual(self.queue.ack(1, 0), 3)
+    self.assertEqual(len(self.queue), 2)
+    # an ack far beyond the last frame sent only acks what was sent
+    self.assertEqual(self.queue.ack(1 << 30, 0), 2)
+    self.assertEqual(len(self.queue), 0)
+
+  def test_timeout(self):
+    """Verify that frames are sent again once the RTO runs out and that
+    the RTO then backs off"""
+    self.send(range(3))
+    self.assertEqual(self.queue.getTimeout(), retransmit.INITIAL_RTO)
+    self.assertEqual(self.queue.getRetransmits(), [])
+    self.now += retransmit.INITIAL_RTO
+    self.assertEqual(self.queue.getTimeout(), 0)
+    self.assertEqual(self.queue.getRetransmits(1), [(0, '0')])
+    self.assertEqual(self.queue.rto, 2 * retransmit.INITIAL_RTO)
+    # frame 0 was just sent again, so it is now the last to time out
+    self.assertEqual(self.queue.getRetransmits(), [])
+    self.now += 2 * retransmit.INITIAL_RTO
+    self.assertEqual(self.queue.getRetransmits(), [(1, '1'), (2, '2'),
+                                                   (0, '0')])
+    self.assertEqual(self.queue.retransmits, 4)
+
+  def test_sack(self):
+    """Verify that a frame is sent again without waiting for the RTO
+    once DUP_THRESHOLD frames after it are SACKed"""
+    self.send(range(6))
+    # 1 is missing and 2 is held
+    self.queue.ack(1, 1)
+    self.assertEqual(self.queue.getRetransmits(), [])
+    # the same ack again does not count twice
+    self.queue.ack(1, 1)
+    self.assertEqual(self.queue.getRetransmits(), [])
+    self.queue.ack(1, 1 | 1<<1 | 1<<2)
+    self.assertEqual(self.queue.getTimeout(), 0)
+    self.assertEqual(self.queue.getRetransmits(), [(1, '1')])
+    self.assertEqual(len(self.queue), 2)
+    self.assertEqual(self.queue.ack(6, 0), 2)
+
+  def test_rtt(self):
+    """Verify the RTO estimate from acked frames"""
+    # a frame sent again gives no sample, since its ack could be for
+    # either send (Karn's rule)
+    self.send([constants.MAX_SEQ_NUM - 1])
+    self.now += retransmit.INITIAL_RTO
+    self.queue.getRetransmits()
+    self.queue.ack(0, 0)
+    self.assertEqual(self.queue.srtt, None)
+    self.send([0])
+    self.now += 0.5
+    self.queue.ack(1, 0)
+    self.assertEqual(self.queue.srtt, 0.5)
+    self.assertEqual(self.queue.rto, 0.5 + 4 * 0.25)
+    for seqNum in range(1, 50):
+      self.send([seqNum])
+      self.now += 0.01
+      self.queue.ack(seqNum + 1, 0)
+    self.assertEqual(self.queue.rto, retransmit.MIN_RTO)
+
+  def test_emptyFrames(self):
+    """Verify that polls are not timed, so a long poll held by the
+    peer is not sent again, but are sent again once SACKs show them
+    lost"""
+    self.queue.add(0, '')
+    self.assertEqual(self.queue.getTimeout(), None)
+    self.now += 1.5 * retransmit.INITIAL_RTO
+    self.assertEqual(self.queue.getRetransmits(), [])
+    self.assertEqual(self.queue.rto, retransmit.INITIAL_RTO)
+    # a poll answered late gives no RTT sample
+    self.queue.ack(1, 0)
+    self.assertEqual(self.queue.srtt, None)
+    self.queue.add(1, '')
+    self.send(range(2, 5))
+    self.assertEqual(self.queue.getTimeout(), retransmit.INITIAL_RTO)
+    self.queue.ack(1, 1 | 1<<1 | 1<<2)
+    self.assertEqual(self.queue.getRetransmits(), [(1, '')])
+
+  def test_allowance(self):
+    """Verify that the peer's credit limits the bytes not acked yet"""
+    self.assertEqual(self.queue.getAllowance(), constants.INITIAL_CREDIT)
+    self.send([9, 10])
+    self.queue.ack(9, 0, 1)
+    self.assertEqual(self.queue.getAllowance(), constants.CREDIT_UNIT - 3)
+    # a stale ack does not change the credit
+    self.queue.ack(5, 0, 100)
+    self.assertEqual(self.queue.credit, constants.CREDIT_UNIT)
+    self.queue.ack(11, 0, 2)
+    self.assertEqual(self.queue.getAllowance(), 2 * constants.CREDIT_UNIT)
+    # the next frame would not fit in the peer's buffer, whatever the
+    # credit
+    self.send([11, 11 + constants.BUFFER_SIZE - 1])
+    self.assertEqual(self.queue.getAllowance(), 0)
+
+  def test_bounded(self):
+    """Verify that a peer that never acks cannot grow the queue forever"""
+    self.send(range(retransmit.MAX_UNACKED_FRAMES + 10))
+    self.assertEqual(len(self.queue), retransmit.MAX_UNACKED_FRAMES)
+    self.assertEqual(self.queue.forgotten, 10)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,47 @@
+# Georgia Tech
+# Spring 2014
+# verifyScheduler.py: unit tests for the scheduler module
+
+import unittest
+
+from htpt import scheduler
+
+
+class TestPollScheduler(unittest.TestCase):
+  """Test the adaptive poll interval"""
+
+  def setUp(self):
+    self.scheduler = scheduler.PollScheduler(minInterval=0.1,
+                                             maxInterval=1.0, backoff=2)
+
+  def test_backoff(self):
+    """Verify that idle polls back off exponentially up to the max"""
+    self.assertEqual(self.scheduler.getTimeout(), 0.1)
+    expected = [0.2, 0.4, 0.8, 1.0, 1.0]
+    for interval in expected:
+      self.scheduler.idlePoll()
+      self.assertAlmostEqual(self.scheduler.getTimeout(), interval)
+
+  def test_dataFlow(self):
+    """Verify that data in either direction resets the interval"""
+    for index in range(4):
+      self.scheduler.idlePoll()
+    self.scheduler.dataSent()
+    self.assertEqual(self.scheduler.getTimeout(), 0.1)
+    for index in range(4):
+      self.scheduler.idlePoll()
+    self.scheduler.dataReceived()
+    self.assertEqual(self.scheduler.getTimeout(), 0.1)
+
+  def test_moreData(self):
+    """Verify that the server hint triggers an immediate poll and that
+    backing off resumes from the minimum afterwards"""
+    self.scheduler.idlePoll()
+    self.scheduler.moreData()
+    self.assertEqual(self.scheduler.getTimeout(), 0)
+    self.scheduler.idlePoll()
+    self.assertEqual(self.scheduler.getTimeout(), 0.1)
+
+
+if __name__ == '__main__':
+  unittest.main()
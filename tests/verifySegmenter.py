@@ -0,0 +1,57 @@
+# Georgia Tech
+# Spring 2014
+# verifySegmenter.py: unit tests for the segmenter module
+
+import unittest
+
+from htpt import constants
+from htpt import segmenter
+from htpt import urlEncode
+
+
+class TestSegmenter(unittest.TestCase):
+  """Test that upstream data is cut to the size of the carrier"""
+
+  def test_segmentSize(self):
+    """Verify that a segment plus its header and ack fills one request"""
+    for maxSize in [200, 1024, 4096]:
+      seg = segmenter.Segmenter('market', maxSize)
+      self.assertEqual(seg.getSegmentSize() + constants.HEADER_SIZE +
+                       constants.ACK_SIZE,
+                       urlEncode.getCapacity('market', maxSize))
+    self.assertRaises(segmenter.SegmentingException, segmenter.Segmenter,
+                      'market', 10)
+    # version 2 headers and acks are larger
+    seg = segmenter.Segmenter('market', 1024, version=2)
+    self.assertEqual(seg.getSegmentSize() + constants.EXT_HEADER_SIZE +
+                     constants.EXT_ACK_SIZE,
+                     urlEncode.getCapacity('market', 1024))
+
+  def test_segment(self):
+    """Verify that segments are in order, full sized and lose nothing"""
+    seg = segmenter.Segmenter('market', 1024)
+    size = seg.getSegmentSize()
+    data = ''.join([chr(index % 256) for index in range(size * 5 + 7)])
+    segments = list(seg.segment(data))
+    self.assertEqual(len(segments), 6)
+    for segment in segments[:-1]:
+      self.assertEqual(len(segment), size)
+    self.assertEqual(len(segments[-1]), 7)
+    self.assertEqual(''.join(segments), data)
+    self.assertEqual(list(seg.segment('')), [])
+
+  def test_countPacked(self):
+    """Verify that small segments share a request and full ones do not"""
+    seg = segmenter.Segmenter('market', 1024)
+    size = seg.getSegmentSize()
+    overhead = constants.HEADER_SIZE + constants.PACKED_LENGTH_SIZE
+    self.assertEqual(seg.countPacked(['a' * size, 'b']), 1)
+    self.assertEqual(seg.countPacked(['b', 'a' * size]), 1)
+    small = 'c' * ((size + constants.HEADER_SIZE) / overhead / 4)
+    self.assertEqual(seg.countPacked([small] * 2), 2)
+    fits = (size + constants.HEADER_SIZE) / (len(small) + overhead)
+    self.assertEqual(seg.countPacked([small] * (fits + 3)), fits)
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,145 @@
+# Georgia Tech
+# Spring 2014
+# verifySession.py: unit tests for the session module
+
+import unittest
+
+from htpt import constants
+from htpt import frame
+from htpt import session
+
+
+class TestSessionTable(unittest.TestCase):
+  """Test the table of client sessions kept by the bridge"""
+
+  def setUp(self):
+    self.table = session.SessionTable(maxSessions=3)
+
+  def makeSession(self, sessionID):
+    newSession = session.Session()
+    newSession.sessionID = sessionID
+    return newSession
+
+  def test_addAndGet(self):
+    """Verify that sessions are found by their session ID"""
+    sessions = [self.makeSession(sessionID) for sessionID in [1, 2, 3]]
+    for newSession in sessions:
+      self.table.add(newSession)
+    for newSession in sessions:
+      self.assertIs(self.table.get(newSession.sessionID), newSession)
+    self.assertIsNone(self.table.get(4))
+    self.assertEqual(len(self.table), 3)
+
+  def test_limits(self):
+    """Verify that duplicate IDs and a full table are refused"""
+    self.table.add(self.makeSession(1))
+    self.assertRaises(session.SessionException, self.table.add,
+                      self.makeSession(1))
+    self.table.add(self.makeSession(2))
+    self.table.add(self.makeSession(3))
+    self.assertTrue(self.table.isFull())
+    self.assertRaises(session.SessionException, self.table.add,
+                      self.makeSession(4))
+
+  def test_remove(self):
+    """Verify that a removed session frees its slot"""
+    for sessionID in [1, 2, 3]:
+      self.table.add(self.makeSession(sessionID))
+    self.table.remove(2)
+    self.assertIsNone(self.table.get(2))
+    self.assertFalse(self.table.isFull())
+    self.table.add(self.makeSession(2))
+    #removing an unknown session does nothing
+    self.table.remove(42)
+    self.assertEqual(len(self.table), 3)
+
+  def test_expire(self):
+    """Verify that idle sessions are removed and their IDs freed"""
+    frame.SessionID.reset()
+    for index in range(3):
+      newSession = self.makeSession(frame.SessionID.getSessionIDAndIncrement())
+      newSession.lastSeen = 100.0 * index
+      self.table.add(newSession)
+    self.assertEqual(self.table.expire(150, now=250.0), [1])
+    self.assertIsNone(self.table.get(1))
+    self.assertEqual(len(self.table), 2)
+    self.table.remove(3)
+    stats = frame.SessionID.getStats()['sessionIDs']
+    self.assertEqual(stats['live'], 1)
+    self.assertEqual(stats['released'], 2)
+    frame.SessionID.reset()
+
+  def test_getStats(self):
+    """Verify that every session reports its own buffered bytes"""
+    for sessionID in [1, 2]:
+      newSession = self.makeSession(sessionID)
+      newSession.disassembler = frame.Disassembler(lambda data: None,
+                                                   minSeqNum=0)
+      self.table.add(newSession)
+    # frame 1 waits for frame 0 in the first session only
+    self.table.get(1).disassembler.buffer.recvData('abc', 1)
+    stats = self.table.getStats()
+    self.assertEqual(sorted(stats.keys()), [1, 2])
+    self.assertEqual(stats[1]['bufferedBytes'], 3)
+    self.assertEqual(stats[1]['sessionID'], 1)
+    self.assertEqual(stats[2]['bufferedBytes'], 0)
+    self.assertEqual(stats[2]['droppedFrames'], 0)
+
+
+class TestSession(unittest.TestCase):
+  """Test the state the bridge keeps for one client"""
+
+  def setUp(self):
+    frame.SessionID.reset()
+
+  def tearDown(self):
+    frame.SessionID.reset()
+
+  def connect(self, **flags):
+    """Return a session set up from a connect request with the given
+    flags, as the bridge does"""
+    client = frame.Assembler()
+    newSession = session.Session()
+    newSession.assembler, newSession.disassembler = \
+      frame.initServerConnection(client.assemble('hello', **flags),
+                                 ['hello'], newSession.recvData)
+    return newSession
+
+  def test_getReadSize(self):
+    """Verify that a client that never acks is not held to any credit,
+    while one with version 2 headers is held to the credit in its
+    acks"""
+    old = self.connect()
+    for index in range(4 * constants.INITIAL_CREDIT / 1024):
+      self.assertEqual(old.getReadSize(1024), 1024)
+      old.assembler.assemble('x' * 1024)
+      old.assembler.recvAck(old.disassembler.getPeerAck())
+    self.assertEqual(old.getReadSize(1024), 1024)
+    self.assertEqual(old.assembler.getRetransmits(), [])
+
+    new = self.connect(SYN=1)
+    self.assertEqual(new.getReadSize(10**6), constants.INITIAL_CREDIT)
+    while new.getReadSize(1024) > 0:
+      new.assembler.assemble('x' * 1024)
+    self.assertEqual(len(new.assembler.unacked),
+                     constants.INITIAL_CREDIT / 1024)
+    # the client's ack for every frame gives the credit back
+    new.assembler.recvAck((constants.INITIAL_CREDIT / 1024, 0, 64))
+    self.assertEqual(new.getReadSize(1024), 1024)
+
+  def test_ownSeqNums(self):
+    """Verify that sessions served in turn each number their frames
+    from where they left off, not from a counter they share"""
+    sessions = [self.connect(), self.connect()]
+    seqNums = dict([(index, []) for index in range(len(sessions))])
+    for count in range(3):
+      for index, clientSession in enumerate(sessions):
+        framed = clientSession.assembler.assemble('data')
+        client = frame.Disassembler(lambda data: None, minSeqNum=0)
+        client.disassemble(framed)
+        seqNums[index].append(client.seqNum)
+    self.assertEqual(seqNums, {0: [0, 1, 2], 1: [0, 1, 2]})
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -0,0 +1,92 @@
+# Georgia Tech
+# Spring 2014
+# verifyTorWriter.py: unit tests for the torWriter module
+
+import os
+import socket
+import threading
+import time
+import unittest
+
+from htpt import torWriter
+
+
+class TestTorWriter(unittest.TestCase):
+  """Test the background writer to Tor"""
+
+  def setUp(self):
+    self.local, self.remote = socket.socketpair()
+    # small socket buffers, so writes come up short
+    self.local.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+    self.remote.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+
+  def tearDown(self):
+    self.local.close()
+    self.remote.close()
+
+  def readAll(self, numBytes):
+    data = []
+    received = 0
+    self.remote.settimeout(10)
+    while received < numBytes:
+      chunk = self.remote.recv(65536)
+      if chunk == '':
+        break
+      data.append(chunk)
+      received += len(chunk)
+    return ''.join(data)
+
+  def test_order(self):
+    """Verify that every byte arrives in order despite short writes"""
+    writer = torWriter.TorWriter(self.local)
+    chunks = [os.urandom(100000) for index in range(5)]
+    for chunk in chunks[:-1]:
+      writer.write(chunk)
+    writer.write(memoryview(chunks[-1])[10:])
+    expected = ''.join(chunks[:-1]) + chunks[-1][10:]
+    self.assertEqual(self.readAll(len(expected)), expected)
+    writer.flush()
+    self.assertEqual(writer.getQueuedBytes(), 0)
+    writer.close()
+
+  def test_bounded(self):
+    """Verify that write blocks once the queue is full and not before"""
+    writer = torWriter.TorWriter(self.local, maxQueuedBytes=200000)
+    writer.write('a' * 150000)
+    writer.write('b' * 100000)
+    done = threading.Event()
+    def write():
+      writer.write('c' * 10)
+      done.set()
+    thread = threading.Thread(target=write)
+    thread.start()
+    time.sleep(0.2)
+    # nobody is reading, so the queue cannot drain below the limit
+    self.assertFalse(done.is_set())
+    data = self.readAll(250010)
+    thread.join(5)
+    self.assertTrue(done.is_set())
+    self.assertEqual(data, 'a' * 150000 + 'b' * 100000 + 'c' * 10)
+    writer.close()
+
+  def test_error(self):
+    """Verify that a failed write is raised to the next caller"""
+    writer = torWriter.TorWriter(self.local)
+    self.remote.close()
+    writer.write('x' * 100000)
+    self.assertRaises(socket.error, writer.flush)
+    self.assertRaises(socket.error, writer.write, 'y')
+    writer.close()
+
+  def test_closed(self):
+    """Verify that queued data is written before close returns and that
+    writing afterwards is refused"""
+    writer = torWriter.TorWriter(self.local)
+    writer.write('last words')
+    writer.close()
+    self.assertEqual(self.readAll(10), 'last words')
+    self.assertRaises(torWriter.WriterException, writer.write, 'more')
+
+
+if __name__ == '__main__':
+  unittest.main()
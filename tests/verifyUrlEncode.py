@@ -114,6 +114,29 @@ class TestUrlEncode(unittest.TestCase):
       char = urlEncode.pickRandomHexChar()
       self.assertIn(char, characters)
 
+  def test_getRandomPadding(self):
+    """Validate that bulk padding is the right length, uses only the
+    padding characters and uses each of them about equally"""
+
+    for count in [0, 1, 78, 10000]:
+      padding = urlEncode.getRandomPadding(count)
+      self.assertEqual(len(padding), count)
+      self.assertEqual(padding.strip('ABCDEF'), '')
+    counts = [padding.count(char) for char in 'ABCDEF']
+    self.assertTrue(min(counts) > 10000 / 6 * 0.8)
+    self.assertTrue(max(counts) < 10000 / 6 * 1.2)
+
+  def test_paddingPool(self):
+    """Validate that the pool refills when it runs out"""
+
+    pool = urlEncode.PaddingPool(100)
+    taken = [pool.take(30) for index in range(10)]
+    for padding in taken:
+      self.assertEqual(len(padding), 30)
+      self.assertEqual(padding.strip('ABCDEF'), '')
+    # more than the pool holds at once
+    self.assertEqual(len(pool.take(250)), 250)
+
   def test_encodeAsMarket(self):
     """Verify that data are correctly stored in the url market form"""
 
@@ -192,6 +215,30 @@ class TestUrlEncode(unittest.TestCase):
       stringy.append(choice(characters))
     return ''.join(stringy)
 
+  def test_classify(self):
+    """Verify that one match finds the carrier and its payload, and
+    that decode reuses it"""
+
+    data = 'some data to hide'
+    market = urlEncode.encodeAsMarket(data)
+    carrierType, payload = urlEncode.classify(market['url'])
+    self.assertEqual(carrierType, 'market')
+    self.assertEqual(len(payload), 80)
+    self.assertEqual(urlEncode.decodeMarketPayload(payload), data)
+    self.assertEqual(urlEncode.decode(market, (carrierType, payload)), data)
+    for encode in [urlEncode.encodeAsBaidu, urlEncode.encodeAsGoogle]:
+      encoded = encode(data)
+      carrierType, payload = urlEncode.classify(encoded['url'] + '&ie=utf-8')
+      self.assertIn(carrierType, ['baidu', 'google'])
+      self.assertEqual(urlEncode.decodeAsEnglishString(payload),
+                       data[:urlEncode.ENGLISH_URL_BYTES])
+      self.assertEqual(urlEncode.decode(encoded), data)
+    for url in ['http://localhost:5000/gallery/img1.png',
+                'http://localhost:5000/?qs=123fad', 'google.com', '']:
+      self.assertEqual(urlEncode.classify(url), (None, None))
+    self.assertRaises(urlEncode.UrlEncodeError, urlEncode.decodeAsMarket,
+                      urlEncode.encodeAsGoogle(data)['url'])
+
   def test_isBaidu(self):
     """verify that we can detect urls of the form
     http://www.baidu.com/s?wd=text+other"""
@@ -282,6 +329,20 @@ class TestUrlEncode(unittest.TestCase):
       testOutput = urlEncode.encodeAsEnglish(datum)
       self.assertEqual(datum, urlEncode.decodeAsEnglish(testOutput))
 
+  def test_englishString(self):
+    """Verify that the word pair table matches the per nibble words
+    and that whole strings round trip"""
+
+    self.assertEqual(len(urlEncode.WORD_PAIRS), 256)
+    allBytes = ''.join([chr(byte) for byte in range(256)])
+    for datum in [allBytes, 'a', '']:
+      testOutput = urlEncode.encodeAsEnglishString(datum)
+      self.assertEqual('+'.join(urlEncode.encodeAsEnglish(datum)),
+                       testOutput)
+      self.assertEqual(datum, urlEncode.decodeAsEnglishString(testOutput))
+    self.assertEqual(urlEncode.encodeAsEnglishString('\x2f'), 'the+was')
+    self.assertRaises(KeyError, urlEncode.decodeAsEnglishString, 'the+cat')
+
   def test_isGoogle(self):
     """Verify that urls are correctly identified as Google url"""
 
@@ -339,5 +400,79 @@ class TestUrlEncode(unittest.TestCase):
         decoded += urlEncode.decodeAsCookie(cookie)
       self.assertEqual(datum, decoded)
 
+  def test_encodeAsB64(self):
+    """Verify that b64 urls keep all of the data in the path and query
+    string and decode to it again"""
+
+    capacity = urlEncode.getCapacity('b64')
+    for size in [0, 1, 2, 3, 4, 50, 100, capacity]:
+      for trial in range(20):
+        datum = ''.join([chr(randint(0, 255)) for index in range(size)])
+        testOutput = urlEncode.encodeAsB64(datum)
+        self.assertEqual(testOutput['cookie'], [])
+        self.assertLessEqual(len(testOutput['url']),
+                             urlEncode.MAX_REQUEST_SIZE)
+        self.assertTrue(testOutput['url'].startswith(
+          'http://' + urlEncode.DEFAULT_HOST + '/'))
+        path, query = testOutput['url'].split('?' + urlEncode.B64_KEY + '=')
+        for segment in path.split('/')[3:-1]:
+          self.assertLessEqual(len(segment), urlEncode.B64_SEGMENT_MAX)
+        self.assertEqual(urlEncode.decode(testOutput), datum)
+    #b64 urls carry more than market urls in the same budget
+    self.assertGreater(capacity, urlEncode.getCapacity('market'))
+
+  def test_decodeAsB64(self):
+    """Verify that b64 urls are recognized and that other urls are not
+    decoded as b64"""
+
+    datum = 'some data to hide in the path'
+    url = urlEncode.encodeAsB64(datum, 'bridge.example.com:8080')['url']
+    self.assertTrue(urlEncode.isB64(url))
+    self.assertEqual(urlEncode.classify(url)[0], 'b64')
+    self.assertEqual(urlEncode.decodeAsB64(url), datum)
+    encoded = urlsafe_b64encode(datum).replace('=', '.')
+    handMade = 'http://localhost/' + encoded[:8] + '/' + encoded[8:12] + \
+               '?sid=' + encoded[12:]
+    self.assertEqual(urlEncode.decodeAsB64(handMade), datum)
+    #web servers may hand the url over as unicode
+    self.assertEqual(urlEncode.decodeAsB64(unicode(url)), datum)
+    for other in [urlEncode.encodeAsMarket(datum)['url'],
+                  urlEncode.encodeAsGoogle(datum)['url'],
+                  'http://localhost:5000/gallery/img1.png',
+                  'http://localhost:5000/a?sid=not+base64']:
+      self.assertFalse(urlEncode.isB64(other))
+    self.assertRaises(urlEncode.UrlEncodeError, urlEncode.decodeAsB64,
+                      urlEncode.encodeAsMarket(datum)['url'])
+    #urls that are not carriers are not decoded at all
+    self.assertRaises(urlEncode.UrlEncodeError, urlEncode.decode,
+                      {'url':'http://localhost:5000/gallery/img1.png',
+                       'cookie':[]})
+    self.assertRaises(urlEncode.UrlEncodeError, urlEncode.decode,
+                      {'url':'http://localhost/abcde?sid=abcde', 'cookie':[]})
+
+  def test_getCapacity(self):
+    """Verify that data of the advertised capacity fits in the budget
+    and still decodes correctly"""
+
+    for encodingType in urlEncode.AVAILABLE_TYPES:
+      for maxSize in [200, 500, 1024, 4096]:
+        capacity = urlEncode.getCapacity(encodingType, maxSize)
+        datum = ''.join([chr(randint(0, 255)) for index in range(capacity)])
+        testOutput = urlEncode.encode(datum, encodingType)
+        cookies = [cookie[len('Cookie: '):] for cookie in testOutput['cookie']]
+        size = len(testOutput['url']) + len('; '.join(cookies))
+        self.assertLessEqual(size, maxSize)
+        if encodingType == 'google':
+          decoded = urlEncode.decodeAsGoogle(testOutput['url'])
+          for cookie in testOutput['cookie']:
+            decoded += urlEncode.decodeAsCookie(cookie)
+        else:
+          decoded = urlEncode.decode(testOutput)
+        self.assertEqual(datum, decoded)
+    #a budget that is too small for the url cannot carry anything
+    self.assertEqual(urlEncode.getCapacity('market', 10), 0)
+    self.assertRaises(urlEncode.UrlEncodeError, urlEncode.getCapacity,
+                      'bogus')
+
 if __name__ == '__main__':
   unittest.main()
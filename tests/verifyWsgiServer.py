@@ -0,0 +1,86 @@
+# Georgia Tech
+# Spring 2014
+# verifyWsgiServer.py: unit tests for the wsgiServer module
+
+import threading
+import time
+import unittest
+
+from htpt import connection
+from htpt import wsgiServer
+
+
+def echoApp(environ, start_response):
+  """WSGI app which answers with the path of the request"""
+  body = environ['PATH_INFO']
+  start_response('200 OK', [('Content-Type', 'text/plain'),
+                            ('Content-Length', str(len(body)))])
+  return [body]
+
+
+class TestThreadPoolWSGIServer(unittest.TestCase):
+  """Test the bridge's thread pool server with keep-alive clients"""
+
+  def startServer(self, workers, keepAliveTimeout=30):
+    self.server = wsgiServer.ThreadPoolWSGIServer('localhost', 0, echoApp,
+                                                  workers, keepAliveTimeout)
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.daemon = True
+    self.thread.start()
+    self.address = 'localhost:{}'.format(self.server.port)
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+
+  def test_manyClients(self):
+    """Verify that more keep-alive connections than workers are all
+    served without waiting for idle ones to time out"""
+    workers = 2
+    self.startServer(workers)
+    numClients = 4 * workers
+    pools = [connection.ConnectionPool(self.address, size=4)
+             for index in range(numClients)]
+    results = []
+    def client(pool, index):
+      for count in range(20):
+        path = '/{}/{}'.format(index, count)
+        body = pool.request({'url':'http://' + self.address + path,
+                             'cookie':[]})
+        results.append(body == path)
+    start = time.time()
+    threads = [threading.Thread(target=client, args=(pool, index))
+               for index, pool in enumerate(pools) for copy in range(4)]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    elapsed = time.time() - start
+    self.assertEqual(results, [True] * len(threads) * 20)
+    self.assertLess(elapsed, 10)
+    # every connection stays open, without holding a worker
+    time.sleep(0.2)
+    stats = self.server.getStats()
+    self.assertEqual(stats['idle'], sum([pool.numConnections
+                                         for pool in pools]))
+    self.assertGreater(stats['idle'], workers)
+    for pool in pools:
+      pool.close()
+
+  def test_idleTimeout(self):
+    """Verify that idle connections are closed after the timeout and
+    that the client's next request goes over a new one"""
+    self.startServer(1, keepAliveTimeout=0.2)
+    pool = connection.ConnectionPool(self.address, size=1)
+    encoded = {'url':'http://' + self.address + '/a', 'cookie':[]}
+    self.assertEqual(pool.request(encoded), '/a')
+    time.sleep(0.1)
+    self.assertEqual(self.server.getStats()['idle'], 1)
+    time.sleep(1.5)
+    self.assertEqual(self.server.getStats()['idle'], 0)
+    self.assertEqual(pool.request(encoded), '/a')
+    pool.close()
+
+
+if __name__ == '__main__':
+  unittest.main()